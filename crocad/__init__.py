@@ -26,12 +26,15 @@ This module provides `main`, which is the entry-point for command-line
 execution of the module's functionality.
 """
 
+import importlib
 import locale
 import logging
 import optparse
+import os
 import sys
+import time
 
-from crocad import localization
+from crocad import localization, profiling
 
 _ = localization.get_translation()
 
@@ -52,26 +55,49 @@ class NullHandler(logging.Handler):
 
 logging.getLogger('crocad').addHandler(NullHandler())
 
-from crocad import donut, ball, cone
-
 __all__ = ['main']
 
 
 LOG = logging.getLogger('crocad')
 
 
+# Command modules are only imported when their command is run, so that
+# start-up only pays for the command being used. Each module's NAMES must
+# match its entry here:
+COMMAND_MODULES = [
+    ('crocad.ball', ['ball', 'sphere']),
+    ('crocad.cone', ['cone']),
+    ('crocad.donut', ['donut', 'torus']),
+    ('crocad.cylinder', ['cylinder', 'tube']),
+    ('crocad.hemisphere', ['hemisphere', 'dome']),
+    ('crocad.capsule', ['capsule', 'pill']),
+    ('crocad.ellipsoid', ['ellipsoid', 'spheroid']),
+    ('crocad.egg', ['egg']),
+    ('crocad.partialtorus', ['partial-torus', 'torus-arc']),
+    ('crocad.batch', ['batch']),
+    ('crocad.server', ['serve', 'server']),
+    ('crocad.sweep', ['sweep']),
+    ('crocad.workqueue', ['queue']),
+    ('crocad.counts', ['render']),
+    ('crocad.similar', ['similar']),
+    ('crocad.solve', ['solve']),
+    ('crocad.assembly', ['assemble', 'assembly']),
+]
+
 COMMAND_ALIASES = {}
-for module in [ball, cone, donut]:
-    for name in module.NAMES:
-        COMMAND_ALIASES[name] = module
+for module_name, names in COMMAND_MODULES:
+    for name in names:
+        COMMAND_ALIASES[name] = module_name
 
 
 def find_command(command):
     """
-    Attempts to find an imported module with the name `command`, and then
-    obtains and returns that moule's `main` function.
+    Attempts to find and import the module for the command `command`, and
+    then obtains and returns that module's `main` function.
     """
-    command_module = COMMAND_ALIASES.get(command, None)
+    module_name = COMMAND_ALIASES.get(command, None)
+    command_module = importlib.import_module(module_name) if module_name \
+        else None
     if hasattr(command_module, 'main'):
         return getattr(command_module, 'main')
     else:
@@ -79,10 +105,39 @@ def find_command(command):
             _('Unknown command: {command}').format(command=command))
 
 
+def run_command(command, args, global_options, started=None):
+    """
+    Run `command` with its `args`, under the profiler selected by the global
+    options, if any. `started` is the time (from `time.perf_counter`) at
+    which crochet-cad started parsing its options.
+    """
+    if global_options.profile_output:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall(find_command(command), args, global_options)
+        profiler.dump_stats(global_options.profile_output)
+    elif global_options.profile:
+        profiler = profiling.enable(
+            profiling.Profiler([profiling.write_report]))
+        if started is not None:
+            profiler.add('options', profiler.started - started)
+            profiler.started = started
+        try:
+            with profiling.stage('import'):
+                command_main = find_command(command)
+            command_main(args, global_options)
+        finally:
+            profiling.disable()
+    else:
+        find_command(command)(args, global_options)
+
+
 def main(argv=sys.argv[1:]):
     """ Crochet CAD's command-line entry-point. """
+    started = time.perf_counter()
     try:
         locale.setlocale(locale.LC_ALL, '')
+        localization.activate(locale.getlocale()[0])
 
         opt_parser = optparse.OptionParser("""
 %prog [-va] COMMAND [COMMAND-OPTIONS]
@@ -92,8 +147,15 @@ def main(argv=sys.argv[1:]):
       %prog COMMAND --help""",
     description=_("""
 Generate a crochet pattern for a geometric primitive, specified as COMMAND.
-Supported commands are 'ball', 'donut', and 'cone'. For details of options for
-a specific command, run '%prog COMMAND --help' with the name of the command.
+Supported commands are 'ball', 'donut', 'cone', 'cylinder', 'hemisphere',
+'capsule', 'ellipsoid', 'egg' and 'partial-torus', plus 'batch' to generate
+many patterns in one process, 'sweep' to generate patterns for ranges of
+options, 'render' to write the instructions for stitch-counts calculated
+elsewhere, 'similar' to find the patterns closest to a stitch profile,
+'solve' to find the options for a pattern of a given size, 'assemble' to
+join shapes into one pattern and 'serve' to run a pattern server. For
+details of options for a specific command, run '%prog COMMAND --help' with
+the name of the command.
     """).strip()
     )
         opt_parser.disable_interspersed_args()
@@ -112,6 +174,35 @@ a specific command, run '%prog COMMAND --help' with the name of the command.
             default=False,
             help=_('Instead of printing instructions,'
                    ' just print the row-counts, one per line.'))
+        optgroup.add_option('-f', '--format', action='store', type='choice',
+            choices=['txt', 'json', 'chart', 'counts'], default='txt',
+            help=_('the output format - one of txt, json, chart'
+                   ' or counts. [%default]'))
+        optgroup.add_option('-g', '--group-rows', action='store_true',
+            default=False, help=_('collapse runs of identical rows, and'
+            ' repeated sequences of rows, in txt and chart output.'))
+        optgroup.add_option('--output', action='store', metavar='FILE',
+            help=_('write output to FILE instead of stdout. FILE is'
+                   ' gzip-compressed if its name ends in .gz.'))
+        optgroup.add_option('--store', action='store', metavar='DIR',
+            default=os.environ.get('CROCHET_CAD_STORE') or None,
+            help=_('keep rendered patterns in the store in DIR, and reuse'
+                   ' them instead of generating them again.'
+                   ' [$CROCHET_CAD_STORE]'))
+        optgroup.add_option('--store-size', action='store', type='int',
+            default=64, metavar='MB', help=_('the size of the pattern'
+                                             ' store. [%default]'))
+        optgroup.add_option('--rounding', action='store',
+            type='choice', choices=['nearest', 'optimal'], default='nearest',
+            help=_('how stitch-counts are rounded - nearest rounds each row'
+                   ' separately, optimal keeps the whole shape and its'
+                   ' increases closest to the ideal. [%default]'))
+        optgroup.add_option('--profile', action='store_true', default=False,
+            help=_('print the time spent in each stage of generating the'
+                   ' pattern to stderr.'))
+        optgroup.add_option('--profile-output', action='store',
+            metavar='FILE', help=_('write cProfile statistics for the'
+                                   ' command to FILE.'))
         opt_parser.add_option_group(optgroup)
 
         global_options, args = opt_parser.parse_args(argv)
@@ -126,7 +217,7 @@ a specific command, run '%prog COMMAND --help' with the name of the command.
 
         if args:
             command = args.pop(0)
-            find_command(command)(args, global_options)
+            run_command(command, args, global_options, started)
         else:
             opt_parser.error(_('No command was provided.'))
     except UserError as user_error:
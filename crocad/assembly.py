@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.assembly - patterns made from a stack of shapes.
+
+An `Assembly` joins segments - such as a cone, then half a ball - into one
+continuous pattern. Each segment is described as a batch job is::
+
+    {"shape": "ball", "options": {"row_count": 30}, "first_row": 16,
+     "last_row": 30, "reverse": false}
+
+"first_row" and "last_row" select part of the shape's pattern, and
+"reverse" works it from its last row to its first. Where one segment's last
+row and the next segment's first row differ by more than a factor of two,
+transition rows are added between them, each at most doubling or halving
+the stitch-count.
+
+The rows of each segment are cached, keyed on its description, so changing
+one segment only generates that segment again - the others, and the
+transitions between unchanged rows, are reused.
+"""
+
+import json
+import logging
+import optparse
+
+from crocad import ball, capsule, cone, cylinder, egg, ellipsoid, hemisphere
+from crocad import localization, profiling
+from crocad.batch import JobError, job_options, row_selection
+from crocad.cache import LRUCache
+
+
+__all__ = ['Assembly', 'transition', 'set_segment_cache']
+
+NAMES = ['assemble', 'assembly']
+LOG = logging.getLogger('crocad.assembly')
+
+# The shapes which can be segments. Donuts have no open end to join:
+SHAPES = {}
+for module in [ball, cone, cylinder, hemisphere, capsule, ellipsoid, egg]:
+    for name in module.NAMES:
+        SHAPES[name] = module
+
+_SEGMENT_CACHE = LRUCache(256)
+
+
+def set_segment_cache(cache):
+    """
+    Replace the cache of segment rows shared by every Assembly, returning
+    the previous cache. See `crocad.cache` for the cache interface.
+    """
+    global _SEGMENT_CACHE
+    previous, _SEGMENT_CACHE = _SEGMENT_CACHE, cache
+    return previous
+
+
+def transition(prev, count):
+    """
+    Return the stitch-counts of the rows to add between a row of `prev`
+    stitches and one of `count` stitches, so that no row more than doubles
+    or halves the stitch-count.
+    """
+    rows = []
+    while count > 2 * prev:
+        prev *= 2
+        rows.append(prev)
+    while prev > 2 * count:
+        prev = (prev + 1) // 2
+        rows.append(prev)
+    return rows
+
+
+def segment_spec(segment):
+    """
+    Return the complete description of `segment` (a dict), with every option
+    of its shape, and its shape module.
+
+    Raises ValueError if the segment isn't valid.
+    """
+    _ = localization.get_translation()
+    if not isinstance(segment, dict):
+        raise ValueError(_('A segment must be a JSON object.'))
+    module = SHAPES.get(segment.get('shape'))
+    if module is None:
+        raise ValueError(_('Unknown shape: {shape}').format(
+            shape=segment.get('shape')))
+    try:
+        command_opts = job_options(module, segment.get('options'))
+        first, last = row_selection(segment)
+    except JobError as error:
+        raise ValueError(str(error))
+    return {
+        'shape': module.NAMES[0],
+        'options': vars(command_opts),
+        'first_row': first,
+        'last_row': last,
+        'reverse': bool(segment.get('reverse', False)),
+    }, module
+
+
+class Assembly(object):
+    """
+    A pattern made by joining the patterns of `segments`, a list of segment
+    dicts, generated with the crochet-cad global options `global_options`.
+
+    Segment rows are cached in `cache`, which is shared by every Assembly
+    if not given. `generated` counts the segments this Assembly generated
+    rather than found in the cache.
+    """
+    def __init__(self, segments=(), global_options=None, title=None,
+                 cache=None):
+        self.global_options = global_options or optparse.Values(
+            {'accurate': False})
+        self.title = title
+        self.cache = cache
+        self.generated = 0
+        self._segments = []
+        for segment in segments:
+            self.append(segment)
+
+    def __len__(self):
+        return len(self._segments)
+
+    def __getitem__(self, index):
+        return self._segments[index][0]
+
+    def __setitem__(self, index, segment):
+        """ Replace the segment at `index`. See `segment_spec`. """
+        self._segments[index] = segment_spec(segment)
+
+    def append(self, segment):
+        """ Add a segment to the end of the assembly. See `segment_spec`. """
+        self._segments.append(segment_spec(segment))
+
+    def segment_title(self, index):
+        """ Return the title of the segment at `index`. """
+        spec, module = self._segments[index]
+        return module.title(optparse.Values(spec['options']))
+
+    def pattern_title(self):
+        """ Return the assembly's title, from its segments if not given. """
+        if self.title:
+            return self.title
+        return ' + '.join(self.segment_title(index)
+                          for index in range(len(self)))
+
+    def segment_rows(self, index):
+        """
+        Return a tuple of the stitch-counts of the segment at `index`, from
+        the cache if it's there.
+
+        Raises ValueError if the segment has no rows.
+        """
+        spec, module = self._segments[index]
+        cache = self.cache if self.cache is not None else _SEGMENT_CACHE
+        key = json.dumps([spec, bool(self.global_options.accurate),
+                          getattr(self.global_options, 'rounding', None)
+                          or 'nearest'], sort_keys=True)
+        rows = cache.get(key)
+        if rows is None:
+            self.generated += 1
+            profiling.count('assembly.segments')
+            __, stitches = module.pattern(optparse.Values(spec['options']),
+                                          self.global_options)
+            rows = [int(count) for count in stitches]
+            rows = rows[(spec['first_row'] or 1) - 1:spec['last_row']]
+            if spec['reverse']:
+                rows.reverse()
+            rows = tuple(rows)
+            cache.put(key, rows)
+        if not rows:
+            raise ValueError(localization.get_translation()(
+                'Segment {number} has no rows.').format(number=index + 1))
+        return rows
+
+    def layout(self):
+        """
+        Return (stitches, rows): the stitch-counts of the whole pattern, and
+        the (first, last) row numbers of each segment within it. Transition
+        rows aren't part of any segment.
+        """
+        stitches = []
+        rows = []
+        for index in range(len(self)):
+            segment = self.segment_rows(index)
+            if stitches:
+                stitches.extend(transition(stitches[-1], segment[0]))
+            rows.append((len(stitches) + 1, len(stitches) + len(segment)))
+            stitches.extend(segment)
+        return stitches, rows
+
+    def stitches(self):
+        """ Return the stitch-counts of the whole pattern. """
+        return self.layout()[0]
+
+    def pattern(self):
+        """ Return the title and stitch-counts of the whole pattern. """
+        return self.pattern_title(), self.stitches()
+
+
+def read_assembly(stream):
+    """
+    Return (title, segments) from the JSON document in `stream`: either a
+    list of segments, or an object with "segments" and optionally "title".
+
+    Raises ValueError if the document isn't valid.
+    """
+    _ = localization.get_translation()
+    document = json.load(stream)
+    if isinstance(document, list):
+        document = {'segments': document}
+    if not isinstance(document, dict) or not isinstance(
+            document.get('segments'), list) or not document['segments']:
+        raise ValueError(_('An assembly must have a list of segments.'))
+    return document.get('title'), document['segments']
+
+
+def main(argv, global_options):
+    """ Command entry-point for assembled patterns. """
+    import sys
+    from crocad import UserError
+    from crocad.output import output_writer
+    from crocad.store import print_stored
+    _ = localization.get_translation()
+    opt_parser = optparse.OptionParser(
+        '%prog [GLOBAL-OPTIONS] assemble [--title=TITLE] [FILE]',
+        description=_("""
+Generate one pattern from a stack of shapes, described by the JSON in FILE
+(or stdin): a list of segments, each with a "shape" (ball, cone, cylinder,
+hemisphere, capsule, ellipsoid or egg), and optionally "options",
+"first_row", "last_row" and "reverse".
+""").strip())
+    opt_parser.add_option('-t', '--title', action='store',
+        help=_('the title of the pattern'))
+    command_opts, args = opt_parser.parse_args(argv)
+    if len(args) > 1:
+        opt_parser.error(_('Provide at most one FILE.'))
+
+    path = args[0] if args else '-'
+    try:
+        if path == '-':
+            title, segments = read_assembly(sys.stdin)
+        else:
+            with open(path) as stream:
+                title, segments = read_assembly(stream)
+        assembly = Assembly(segments, global_options,
+                            command_opts.title or title)
+        # Every segment is generated now, so that errors are reported
+        # before any output:
+        stitches = assembly.stitches()
+    except (IOError, OSError) as error:
+        raise UserError(_('Cannot read {path}: {error}').format(
+            path=path, error=error.strerror or error))
+    except ValueError as error:
+        raise UserError(str(error))
+
+    def pattern(command_opts, global_options):
+        return assembly.pattern_title(), stitches
+
+    with output_writer(global_options) as out:
+        print_stored(NAMES[0], pattern, optparse.Values({
+            'title': assembly.pattern_title(),
+            'segments': [assembly[index] for index in range(len(assembly))],
+        }), global_options, out)
@@ -23,12 +23,9 @@ crocad.ball - sphere crochet pattern generation for crochet-cad.
 """
 
 import logging
-from math import pi, sin
 import optparse
 
-from crocad import localization
-from crocad.util import round_to_nearest_iter as snap
-from crocad.util import print_instructions_txt, print_row_counts
+from crocad import engine, localization, shape
 
 
 __all__ = ['ball']
@@ -39,32 +36,35 @@ LOG = logging.getLogger('crocad.ball')
 
 def ball(rows):
     """ Generator for stitch-counts for a ball crochet pattern. """
-    rad = (rows + 1) / pi
-    row_angle = pi / (rows + 1)
-    for row in range(rows):
-        row_rad = rad * sin((row + 1) * row_angle)
-        stitches = 2 * pi * row_rad
+    for stitches in shape.generate(engine.BALL, (rows,)):
         yield stitches
 
 
-def main(argv, global_options):
-    """ Command entry-point for the ball pattern-generator. """
-    _ = localization.get_translation()
-    opt_parser = optparse.OptionParser(
-        '%prog [GLOBAL-OPTIONS] ball [--row-count=ROWS]',
-        description=_("""
+def options(_):
+    """ Return the description and options of the ball command. """
+    return _("""
 Generate a crochet pattern for a ball (sphere).
-""").strip())
-    opt_parser.add_option('-r', '--row-count', action='store',
-        type='int', default=16, metavar='ROWS',
-        help=_('the number of rows in the pattern. Defines the size'
-        ' of the ball - the circumference is 2x this value. [%default]'))
-    command_opts, __ = opt_parser.parse_args(argv)
-    stitches = ball(command_opts.row_count)
-    stitches = snap(stitches, 1 if global_options.accurate else 6, 6)
-
-    if not global_options.inhuman:
-        title = _("Ball (%d rows)") % (command_opts.row_count)
-        print_instructions_txt(title, stitches)
-    else:
-        print_row_counts(stitches)
+"""), [
+        optparse.make_option('-r', '--row-count', action='store',
+            type='int', default=16, metavar='ROWS',
+            help=_('the number of rows in the pattern. Defines the size'
+            ' of the ball - the circumference is 2x this value. [%default]')),
+    ]
+
+
+def params(command_opts):
+    """ Return the Surface parameters for the command options. """
+    return (command_opts.row_count,)
+
+
+def title(command_opts):
+    """ Return the title of a ball pattern. """
+    _ = localization.get_translation()
+    return _("Ball (%d rows)") % (command_opts.row_count)
+
+
+SHAPE = shape.Shape(NAMES[0], engine.BALL, options, params, title)
+option_parser = SHAPE.option_parser
+pattern = SHAPE.pattern
+lazy_pattern = SHAPE.lazy_pattern
+main = SHAPE.main
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.batch - generate many patterns in a single crochet-cad process.
+
+Jobs are read as JSON objects, one per line, such as::
+
+    {"id": 1, "shape": "ball", "options": {"row_count": 20},
+     "accurate": false, "locale": "fi_FI.UTF-8", "format": "txt",
+     "rounding": "nearest", "first_row": 1, "last_row": 20,
+     "group_rows": false}
+
+Only "shape" is required. "first_row" and "last_row" select part of the
+pattern, and only the rows selected are generated. For each job a single
+JSON line is written, containing the job's "id" and either its rendered
+"output" or an "error".
+"""
+
+import json
+import logging
+import optparse
+import sys
+
+from crocad import ball, capsule, cone, cylinder, donut, egg, ellipsoid
+from crocad import hemisphere, localization, partialtorus
+from crocad.output import output_writer
+from crocad.store import DEFAULT_SIZE_MB, open_store, pattern_key
+from crocad.store import stored_text
+from crocad.render import RENDERERS, group_option, output_format, render
+from crocad.render import render_rows
+from crocad.util import SNAPPERS
+
+
+__all__ = ['run_job', 'run_jobs']
+
+NAMES = ['batch']
+LOG = logging.getLogger('crocad.batch')
+
+SHAPES = {}
+for module in [ball, cone, donut, cylinder, hemisphere, capsule, ellipsoid,
+               egg, partialtorus]:
+    for name in module.NAMES:
+        SHAPES[name] = module
+
+
+class JobError(Exception):
+    """ Indicates an invalid job specification. """
+
+
+def job_options(module, options):
+    """
+    Return the command options for a shape `module`, starting from its
+    defaults and updated from the `options` dict, which is keyed on option
+    destinations, such as 'row_count'.
+    """
+    _ = localization.get_translation()
+    if options is not None and not isinstance(options, dict):
+        raise JobError(_('Options must be a JSON object.'))
+    opt_parser = module.option_parser()
+    command_opts = opt_parser.get_default_values()
+    by_dest = dict((opt.dest, opt) for opt in opt_parser.option_list
+                   if opt.dest)
+    for key, value in (options or {}).items():
+        option = by_dest.get(key)
+        if option is None:
+            raise JobError(_('Unknown option: {option}').format(option=key))
+        try:
+            value = option.check_value(option.get_opt_string(), str(value))
+        except optparse.OptionValueError as error:
+            raise JobError(str(error))
+        setattr(command_opts, key, value)
+    return command_opts
+
+
+def job_defaults(global_options):
+    """ Return the job defaults for the crochet-cad global options. """
+    return optparse.Values({
+        'accurate': global_options.accurate,
+        'format': output_format(global_options),
+        'rounding': getattr(global_options, 'rounding', 'nearest'),
+        'group_rows': group_option(global_options),
+        'store': getattr(global_options, 'store', None),
+        'store_size': getattr(global_options, 'store_size', None),
+    })
+
+
+def run_job(job, defaults, report_errors=True):
+    """
+    Run a single job (a dict) and return the result dict.
+
+    `defaults` are the global options used for anything not specified by
+    the job. Unexpected exceptions are reported in the result, as invalid
+    jobs are, unless `report_errors` is false, when they're raised.
+    """
+    _ = localization.get_translation()
+    result = {'id': job.get('id')}
+    try:
+        module = _choice(SHAPES, job.get('shape'))
+        if module is None:
+            raise JobError(_('Unknown shape: {shape}').format(
+                shape=job.get('shape')))
+        fmt = job.get('format', defaults.format)
+        if _choice(RENDERERS, fmt) is None:
+            raise JobError(_('Unknown format: {format}').format(format=fmt))
+        rounding = job.get('rounding') or getattr(defaults, 'rounding',
+                                                  'nearest')
+        if _choice(SNAPPERS, rounding) is None:
+            raise JobError(_('Unknown rounding: {rounding}').format(
+                rounding=rounding))
+        if not isinstance(job.get('locale') or '', str):
+            raise JobError(_('A locale must be a string, such as'
+                             ' "fi_FI.UTF-8".'))
+        global_options = optparse.Values({
+            'accurate': bool(job.get('accurate', defaults.accurate)),
+            'inhuman': fmt == 'counts',
+            'format': fmt,
+            'rounding': rounding,
+            'group_rows': bool(job.get('group_rows',
+                                       getattr(defaults, 'group_rows',
+                                               False))),
+        })
+        command_opts = job_options(module, job.get('options'))
+        selection = row_selection(job)
+        if selection != (None, None) and rounding != 'nearest':
+            raise JobError(_('Rows can only be selected with nearest'
+                             ' rounding.'))
+        store = open_store(getattr(defaults, 'store', None),
+                           getattr(defaults, 'store_size', None)
+                           or DEFAULT_SIZE_MB)
+        if job.get('locale'):
+            with localization.translation_context(job['locale']):
+                output = _output(module, command_opts, global_options,
+                                 selection, store)
+        else:
+            output = _output(module, command_opts, global_options, selection,
+                             store)
+        result['output'] = output
+    except JobError as error:
+        result['error'] = str(error)
+    except Exception as error:
+        if not report_errors:
+            raise
+        # A bug shouldn't stop the jobs that follow:
+        LOG.exception('Job %r failed', result['id'])
+        result['error'] = _('Internal error: {error}').format(
+            error=error or error.__class__.__name__)
+    return result
+
+
+def _choice(choices, name):
+    """ Return the value for the key `name` in `choices`, or None if `name`
+    isn't one of its keys (or isn't even a string).
+    """
+    if not isinstance(name, str):
+        return None
+    return choices.get(name)
+
+
+def row_selection(job):
+    """ Return the (first, last) rows selected by a job, which are None if
+    not given.
+    """
+    _ = localization.get_translation()
+    selection = []
+    for key in ['first_row', 'last_row']:
+        value = job.get(key)
+        if value is not None:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                value = 0
+            if value < 1:
+                raise JobError(_('{key} must be a positive whole number.')
+                               .format(key=key))
+        selection.append(value)
+    first, last = selection
+    if first is not None and last is not None and first > last:
+        raise JobError(_('first_row must not be after last_row.'))
+    return tuple(selection)
+
+
+def _render(module, command_opts, global_options, selection=(None, None)):
+    """
+    Generate and render a pattern, returning the lines of output. Only the
+    rows from first to last of `selection` are rendered, if given.
+    """
+    fmt = global_options.format
+    group = global_options.group_rows
+    if selection == (None, None):
+        title, stitches = module.pattern(command_opts, global_options)
+        return render(title, stitches, [fmt], group)[fmt]
+    first, last = selection
+    pattern = module.lazy_pattern(command_opts, global_options)
+    if first is not None and first > len(pattern):
+        _ = localization.get_translation()
+        raise JobError(_('first_row must not be after the last row'
+                         ' ({rows}).').format(rows=len(pattern)))
+    rows = pattern.rows((first or 1) - 1, last)
+    return render_rows(pattern.title, rows, [fmt], group)[fmt]
+
+
+def _output(module, command_opts, global_options, selection, store):
+    """
+    Return the rendered output for a job, from `store` if it's there (and
+    `store` isn't None).
+    """
+    if store is None:
+        return '\n'.join(_render(module, command_opts, global_options,
+                                 selection))
+
+    def render():
+        return ''.join(line + '\n' for line in _render(
+            module, command_opts, global_options, selection))
+
+    key = pattern_key(module.NAMES[0], command_opts, global_options,
+                      selection)
+    # Stored outputs end with a newline, as they do when printed:
+    return stored_text(store, key, render)[:-1]
+
+
+def run_jobs(lines, defaults, out):
+    """
+    Run each JSON job in `lines`, writing one JSON result line per job to
+    the file or `crocad.output.Writer` `out`, which is flushed after each
+    result.
+    """
+    _ = localization.get_translation()
+    for line_number, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError(_('A job must be a JSON object.'))
+        except ValueError as error:
+            LOG.warning('Invalid job on line %d: %s', line_number + 1, error)
+            result = {'id': None, 'error': str(error)}
+        else:
+            result = run_job(job, defaults)
+        out.write(json.dumps(result, sort_keys=True))
+        out.write('\n')
+        out.flush()
+
+
+def main(argv, global_options):
+    """ Command entry-point for batch pattern-generation. """
+    _ = localization.get_translation()
+    opt_parser = optparse.OptionParser(
+        '%prog [GLOBAL-OPTIONS] batch',
+        description=_("""
+Generate many patterns in one process. Jobs are read from stdin as JSON
+objects, one per line, with a "shape", and optionally "id", "options",
+"accurate", "locale", "format", "rounding", "first_row", "last_row" and
+"group_rows". One JSON result is written to stdout for each job.
+""").strip())
+    opt_parser.parse_args(argv)
+    with output_writer(global_options) as out:
+        run_jobs(sys.stdin, job_defaults(global_options), out)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.cache - bounded in-memory caches for crochet-cad.
+
+Any object providing `get`, `put`, `clear` and `stats` may be used wherever
+crochet-cad accepts a cache, so callers can plug in their own implementation.
+"""
+
+from collections import namedtuple, OrderedDict
+import logging
+import threading
+
+
+__all__ = ['CacheStats', 'LRUCache', 'NullCache']
+
+LOG = logging.getLogger('crocad.cache')
+
+
+CacheStats = namedtuple('CacheStats', 'hits misses evictions size maxsize')
+
+
+class LRUCache(object):
+    """
+    A thread-safe mapping which holds at most `maxsize` items, discarding
+    the least-recently used item when full.
+    """
+    def __init__(self, maxsize=4096):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ Return the value stored for `key`, or `default` if missing. """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """ Store `value` for `key`, evicting the oldest item if full. """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """ Remove all items and reset the counters. """
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """ Return a `CacheStats` describing this cache's usage. """
+        with self._lock:
+            return CacheStats(self.hits, self.misses, self.evictions,
+                              len(self._data), self.maxsize)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class NullCache(object):
+    """ A cache which stores nothing. Used to disable caching. """
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """ Always returns `default`. """
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """ Does nothing. """
+        pass
+
+    def clear(self):
+        """ Resets the miss counter. """
+        self.misses = 0
+
+    def stats(self):
+        """ Return a `CacheStats` describing this cache's usage. """
+        return CacheStats(0, self.misses, 0, 0, 0)
+
+    def __len__(self):
+        return 0
+
+    def __contains__(self, key):
+        return False
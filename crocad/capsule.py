@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.capsule - capsule crochet pattern generation for crochet-cad.
+"""
+
+import logging
+import optparse
+
+from crocad import engine, localization, shape
+
+
+__all__ = ['capsule']
+
+NAMES = ['capsule', 'pill']
+LOG = logging.getLogger('crocad.capsule')
+
+
+def capsule(circumference, rows):
+    """ Generator for stitch-counts for a capsule crochet pattern. """
+    for stitches in shape.generate(engine.CAPSULE, (circumference, rows)):
+        yield stitches
+
+
+def options(_):
+    """ Return the description and options of the capsule command. """
+    return _("""
+Generate a crochet pattern for a capsule: a cylinder with rounded ends.
+"""), [
+        optparse.make_option('-c', '--circumference', action='store',
+            type='int', default=36, metavar='STITCHES',
+            help=_('the number of stitches around the widest row. Defines the'
+            ' circumference of the capsule [%default]')),
+        optparse.make_option('-r', '--row-count', action='store',
+            type='int', default=8, metavar='ROWS',
+            help=_('the number of straight rows between the rounded ends'
+            ' [%default]')),
+    ]
+
+
+def params(command_opts):
+    """ Return the Surface parameters for the command options. """
+    return (command_opts.circumference, command_opts.row_count)
+
+
+def title(command_opts):
+    """ Return the title of a capsule pattern. """
+    _ = localization.get_translation()
+    return _("Capsule (%d circumference, %d rows)") % (
+        command_opts.circumference, command_opts.row_count)
+
+
+SHAPE = shape.Shape(NAMES[0], engine.CAPSULE, options, params, title)
+option_parser = SHAPE.option_parser
+pattern = SHAPE.pattern
+lazy_pattern = SHAPE.lazy_pattern
+main = SHAPE.main
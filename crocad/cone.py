@@ -26,9 +26,7 @@ crocad.cone - cone crochet pattern generation for crochet-cad.
 import logging
 import optparse
 
-from crocad.util import round_to_nearest_iter as snap
-from crocad.util import print_instructions_txt, print_row_counts
-from crocad import localization
+from crocad import engine, localization, shape
 
 
 _ = localization.get_translation()
@@ -41,34 +39,39 @@ LOG = logging.getLogger('crocad.cone')
 
 def cone(rows, max_circ):
     """ Generator for stitch-counts for a cone crochet pattern. """
-    min_circ = 6
-    yield min_circ
-    for row in range(rows - 2):
-        stitches = float(row) / (rows - 2) * (max_circ - min_circ) + min_circ
+    for stitches in shape.generate(engine.CONE, (rows, max_circ)):
         yield stitches
-    yield max_circ
 
 
-def main(argv, global_options):
-    """ Command entry-point for the cone pattern-generator. """
+def options(_):
+    """ Return the description and options of the cone command. """
+    return _("Generate a crochet pattern for a cone."), [
+        optparse.make_option('-r', '--row-count', action='store',
+            type='int', default=16, metavar='ROWS',
+            help=_('the number of rows in the pattern. Defines the height'
+            ' of the cone [%default]')),
+        optparse.make_option('-c', '--max-circumference', action='store',
+            type='int', default=60, metavar='STITCHES',
+            help=_('the number of stitches at the base of the pattern.'
+            ' Defines the circumference of the base of the cone'
+            ' [%default]')),
+    ]
+
+
+def params(command_opts):
+    """ Return the Surface parameters for the command options. """
+    return (command_opts.row_count, command_opts.max_circumference)
+
+
+def title(command_opts):
+    """ Return the title of a cone pattern. """
     _ = localization.get_translation()
-    opt_parser = optparse.OptionParser(
-    '%prog [GLOBAL-OPTIONS] cone [--row-count=ROWS]',
-        description=_("Generate a crochet pattern for a cone."))
-    opt_parser.add_option('-r', '--row-count', action='store',
-        type='int', default=16, metavar='ROWS',
-        help=_('the number of rows in the pattern. Defines the height'
-        ' of the cone [%default]'))
-    opt_parser.add_option('-c', '--max-circumference', action='store',
-        type='int', default=60, metavar='STITCHES',
-        help=_('the number of stitches at the base of the pattern. Defines the'
-        ' circumference of the base of the cone [%default]'))
-    command_opts, __ = opt_parser.parse_args(argv)
-    stitches = cone(command_opts.row_count, command_opts.max_circumference)
-    stitches = snap(stitches, 1 if global_options.accurate else 6, 6)
-    if not global_options.inhuman:
-        title = _("Cone (%d rows, %d max-circumference)") % (
-                command_opts.row_count, command_opts.max_circumference)
-        print_instructions_txt(title, stitches)
-    else:
-        print_row_counts(stitches)
+    return _("Cone (%d rows, %d max-circumference)") % (
+            command_opts.row_count, command_opts.max_circumference)
+
+
+SHAPE = shape.Shape(NAMES[0], engine.CONE, options, params, title)
+option_parser = SHAPE.option_parser
+pattern = SHAPE.pattern
+lazy_pattern = SHAPE.lazy_pattern
+main = SHAPE.main
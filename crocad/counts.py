@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.counts - render stitch-counts calculated elsewhere.
+
+The render command is the inverse of ``--inhuman``: it reads stitch-counts,
+one per line, from a file or stdin and writes the pattern's instructions.
+Counts are read and rendered one row at a time, so patterns of any length
+are rendered in constant memory. Files are memory-mapped rather than read.
+"""
+
+import contextlib
+import logging
+import mmap
+import optparse
+import sys
+
+from crocad import localization, profiling
+from crocad.output import output_writer
+from crocad.render import group_option, output_format, print_pattern
+from crocad.util import round_to_nearest
+
+
+__all__ = ['read_counts', 'open_lines']
+
+NAMES = ['render']
+LOG = logging.getLogger('crocad.counts')
+
+
+def read_counts(lines):
+    """
+    Generate the stitch-count on each of `lines` (bytes), rounded to a
+    whole number. Blank lines and lines starting with '#' are skipped.
+
+    Raises crocad.UserError if a line isn't a positive number.
+    """
+    from crocad import UserError
+    _ = localization.get_translation()
+    for line_number, line in enumerate(lines):
+        line = line.strip()
+        if not line or line.startswith(b'#'):
+            continue
+        try:
+            count = int(line)
+        except ValueError:
+            try:
+                count = round_to_nearest(float(line))
+            except ValueError:
+                count = 0
+        if count < 1:
+            raise UserError(_(
+                'Line {line_number} is not a stitch-count: {line}').format(
+                    line_number=line_number + 1,
+                    line=line.decode('utf-8', 'replace')))
+        yield count
+
+
+@contextlib.contextmanager
+def open_lines(path=None):
+    """
+    A context manager providing an iterator over the lines (as bytes) of the
+    file `path`, which is memory-mapped, or of stdin if `path` is None or
+    '-'.
+    """
+    if path is None or path == '-':
+        yield iter(sys.stdin.buffer.readline, b'')
+        return
+    with open(path, 'rb') as stream:
+        try:
+            mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped:
+            yield iter([])
+            return
+        try:
+            yield iter(mapped.readline, b'')
+        finally:
+            mapped.close()
+
+
+def main(argv, global_options):
+    """ Command entry-point for rendering stitch-counts. """
+    from crocad import UserError
+    _ = localization.get_translation()
+    with profiling.stage('options'):
+        opt_parser = optparse.OptionParser(
+            '%prog [GLOBAL-OPTIONS] render [--title=TITLE] [FILE]',
+            description=_("""
+Render the instructions for the stitch-counts in FILE (or stdin), one per
+line, such as those written by 'crochet-cad --inhuman'.
+""").strip())
+        opt_parser.add_option('-t', '--title', action='store',
+            default=_('Pattern'), help=_('the title of the pattern'
+                                         ' [%default]'))
+        command_opts, args = opt_parser.parse_args(argv)
+    if len(args) > 1:
+        opt_parser.error(_('Provide at most one FILE.'))
+
+    path = args[0] if args else None
+    with contextlib.ExitStack() as stack:
+        try:
+            lines = stack.enter_context(open_lines(path))
+        except (IOError, OSError) as error:
+            raise UserError(_('Cannot read {path}: {error}').format(
+                path=path, error=error.strerror or error))
+        out = stack.enter_context(output_writer(global_options))
+        stitches = profiling.stage_iter('read', read_counts(lines))
+        print_pattern(command_opts.title, stitches,
+                      output_format(global_options), out,
+                      group_option(global_options))
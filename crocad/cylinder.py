@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.cylinder - cylinder crochet pattern generation for crochet-cad.
+"""
+
+import logging
+import optparse
+
+from crocad import engine, localization, shape
+
+
+__all__ = ['cylinder']
+
+NAMES = ['cylinder', 'tube']
+LOG = logging.getLogger('crocad.cylinder')
+
+
+def cylinder(circumference, rows):
+    """ Generator for stitch-counts for a cylinder crochet pattern. """
+    for stitches in shape.generate(engine.CYLINDER, (circumference, rows)):
+        yield stitches
+
+
+def options(_):
+    """ Return the description and options of the cylinder command. """
+    return _("""
+Generate a crochet pattern for a cylinder, with a flat base and an open top.
+"""), [
+        optparse.make_option('-c', '--circumference', action='store',
+            type='int', default=36, metavar='STITCHES',
+            help=_('the number of stitches around the widest row. Defines the'
+            ' circumference of the cylinder [%default]')),
+        optparse.make_option('-r', '--row-count', action='store',
+            type='int', default=16, metavar='ROWS',
+            help=_('the number of rows in the side, after the base.'
+            ' Defines the height of the cylinder [%default]')),
+    ]
+
+
+def params(command_opts):
+    """ Return the Surface parameters for the command options. """
+    return (command_opts.circumference, command_opts.row_count)
+
+
+def title(command_opts):
+    """ Return the title of a cylinder pattern. """
+    _ = localization.get_translation()
+    return _("Cylinder (%d circumference, %d rows)") % (
+        command_opts.circumference, command_opts.row_count)
+
+
+SHAPE = shape.Shape(NAMES[0], engine.CYLINDER, options, params, title)
+option_parser = SHAPE.option_parser
+pattern = SHAPE.pattern
+lazy_pattern = SHAPE.lazy_pattern
+main = SHAPE.main
@@ -26,11 +26,9 @@ from crocad import localization
 _ = localization.get_translation()
 
 import logging
-from math import pi, cos
 import optparse
 
-from crocad.util import round_to_nearest_iter as snap
-from crocad.util import print_instructions_txt, print_row_counts
+from crocad import engine, shape
 
 
 __all__ = ['donut']
@@ -46,45 +44,44 @@ def donut(init_stitches, rows, initial_angle=0):
     rows - number of rows around the torus
     inital_angle - The angle (in radians) of the first row crocheted.
     """
-    # Radius of the hole in 'stitches':
-    hole_rad = init_stitches / (2 * pi)
-    # Radius of a donut vertical cross-section:
-    xrad = rows / (2 * pi)
-    row_angle = 2 * pi / rows
-    for row in range(rows):
-        rad = hole_rad + (xrad - (xrad * cos(row * row_angle + initial_angle)))
-        circ = rad * 2 * pi
+    for circ in shape.generate(engine.DONUT,
+                               (init_stitches, rows, initial_angle)):
         yield circ  # stitch_count
 
 
-def main(argv, global_options):
-    """
-    Command entry-point for the donut pattern-generator.
-    """
-    _ = localization.get_translation()
-    opt_parser = optparse.OptionParser(
-        '%prog [GLOBAL-OPTIONS] '
-        'donut [--inner-radius=STITCHES] [--row-count=ROWS]',
-        description=_("""
+def options(_):
+    """ Return the description and options of the donut command. """
+    return _("""
 Generate a pattern for a donut (torus).
 
 The pattern starts off with a row in the centre (the donut hole) and is
 crocheted up and around.
-""").strip())
-    opt_parser.add_option('-i', '--inner-radius', action='store',
-        type='int', default=18, metavar='STITCHES',
-        help=_('the circumference of the donut hole, in stitches [%default]'))
-    opt_parser.add_option('-r', '--row-count', action='store', type='int',
-        default=16, metavar='ROWS',
-        help=_("the number of rows in the pattern - defines the 'thickness'"
-            " of the donut [%default]"))
-    command_opts, __ = opt_parser.parse_args(argv)
-    stitches = donut(command_opts.inner_radius, command_opts.row_count)
-    stitches = snap(stitches, 1 if global_options.accurate else 6)
-
-    if not global_options.inhuman:
-        title = _("Donut (inner-radius: %d, %d rows)") % (
-                command_opts.inner_radius, command_opts.row_count)
-        print_instructions_txt(title, stitches)
-    else:
-        print_row_counts(stitches)
+"""), [
+        optparse.make_option('-i', '--inner-radius', action='store',
+            type='int', default=18, metavar='STITCHES',
+            help=_('the circumference of the donut hole, in stitches'
+            ' [%default]')),
+        optparse.make_option('-r', '--row-count', action='store', type='int',
+            default=16, metavar='ROWS',
+            help=_("the number of rows in the pattern - defines the"
+            " 'thickness' of the donut [%default]")),
+    ]
+
+
+def params(command_opts):
+    """ Return the Surface parameters for the command options. """
+    return (command_opts.inner_radius, command_opts.row_count, 0)
+
+
+def title(command_opts):
+    """ Return the title of a donut pattern. """
+    _ = localization.get_translation()
+    return _("Donut (inner-radius: %d, %d rows)") % (
+            command_opts.inner_radius, command_opts.row_count)
+
+
+SHAPE = shape.Shape(NAMES[0], engine.DONUT, options, params, title, 0)
+option_parser = SHAPE.option_parser
+pattern = SHAPE.pattern
+lazy_pattern = SHAPE.lazy_pattern
+main = SHAPE.main
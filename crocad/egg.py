@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.egg - egg crochet pattern generation for crochet-cad.
+"""
+
+import logging
+import optparse
+
+from crocad import engine, localization, shape
+
+
+__all__ = ['egg']
+
+NAMES = ['egg']
+LOG = logging.getLogger('crocad.egg')
+
+
+def egg(rows, aspect, point):
+    """ Generator for stitch-counts for an egg crochet pattern. """
+    for stitches in shape.generate(engine.EGG, (rows, aspect, point)):
+        yield stitches
+
+
+def options(_):
+    """ Return the description and options of the egg command. """
+    return _("""
+Generate a crochet pattern for an egg, starting at its rounder end.
+"""), [
+        optparse.make_option('-r', '--row-count', action='store',
+            type='int', default=16, metavar='ROWS',
+            help=_('the number of rows in the pattern. Defines the size'
+            ' of the egg [%default]')),
+        optparse.make_option('--aspect', action='store',
+            type='float', default=1.3, metavar='RATIO',
+            help=_('the height of the egg divided by its width'
+            ' [%default]')),
+        optparse.make_option('--point', action='store',
+            type='float', default=1.4, metavar='RATIO',
+            help=_('the height of the pointed half of the egg divided'
+            ' by the height of the rounder half [%default]')),
+    ]
+
+
+def params(command_opts):
+    """ Return the Surface parameters for the command options. """
+    return (command_opts.row_count, command_opts.aspect,
+            command_opts.point)
+
+
+def title(command_opts):
+    """ Return the title of an egg pattern. """
+    _ = localization.get_translation()
+    return _("Egg (%d rows, aspect %g, point %g)") % (
+        command_opts.row_count, command_opts.aspect,
+        command_opts.point)
+
+
+SHAPE = shape.Shape(NAMES[0], engine.EGG, options, params, title)
+option_parser = SHAPE.option_parser
+pattern = SHAPE.pattern
+lazy_pattern = SHAPE.lazy_pattern
+main = SHAPE.main
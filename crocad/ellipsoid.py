@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.ellipsoid - ellipsoid crochet pattern generation for crochet-cad.
+"""
+
+import logging
+import optparse
+
+from crocad import engine, localization, shape
+
+
+__all__ = ['ellipsoid']
+
+NAMES = ['ellipsoid', 'spheroid']
+LOG = logging.getLogger('crocad.ellipsoid')
+
+
+def ellipsoid(rows, aspect):
+    """ Generator for stitch-counts for an ellipsoid crochet pattern. """
+    for stitches in shape.generate(engine.ELLIPSOID, (rows, aspect)):
+        yield stitches
+
+
+def options(_):
+    """ Return the description and options of the ellipsoid command. """
+    return _("""
+Generate a crochet pattern for an ellipsoid: a ball stretched or squashed
+along its axis.
+"""), [
+        optparse.make_option('-r', '--row-count', action='store',
+            type='int', default=16, metavar='ROWS',
+            help=_('the number of rows in the pattern. Defines the size'
+            ' of the ellipsoid [%default]')),
+        optparse.make_option('--aspect', action='store',
+            type='float', default=1.5, metavar='RATIO',
+            help=_('the height of the ellipsoid divided by its width'
+            ' [%default]')),
+    ]
+
+
+def params(command_opts):
+    """ Return the Surface parameters for the command options. """
+    return (command_opts.row_count, command_opts.aspect)
+
+
+def title(command_opts):
+    """ Return the title of an ellipsoid pattern. """
+    _ = localization.get_translation()
+    return _("Ellipsoid (%d rows, aspect %g)") % (
+        command_opts.row_count, command_opts.aspect)
+
+
+SHAPE = shape.Shape(NAMES[0], engine.ELLIPSOID, options, params, title)
+option_parser = SHAPE.option_parser
+pattern = SHAPE.pattern
+lazy_pattern = SHAPE.lazy_pattern
+main = SHAPE.main
@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.engine - vectorized stitch-count generation for crochet-cad.
+
+Every shape is a `Surface`: a surface of revolution, whose profile is worked
+from one end to the other with a row at each stitch of arc length. A row's
+stitch-count is the circumference of the surface at that row.
+
+A Surface's formulas are written once, for a math namespace: the `math`
+module's functions for single patterns, calculated without NumPy, or NumPy
+for batches. `Surface.batch` takes array-like shape parameters (which are
+broadcast against each other) and calculates the stitch-counts for every
+resulting pattern in one pass. As patterns have differing numbers of rows,
+results are returned as a `RaggedArray`: one flat array holding every row of
+every pattern, plus an `offsets` array marking where each pattern starts.
+
+Single patterns and batches are calculated by the same formulas, so they
+produce identical values. Shapes whose profiles have no simple arc-length
+formula, such as ellipsoids, are `CurveSurface`s, which interpolate a table
+of points along the profile, and agree to within rounding.
+"""
+
+import bisect
+import functools
+import logging
+import math
+
+
+__all__ = ['RaggedArray', 'Surface', 'CurveSurface', 'SURFACES', 'snap',
+           'ball', 'cone', 'donut', 'ball_rows', 'cone_rows', 'donut_rows',
+           'ball_row', 'cone_row', 'donut_row', 'cone_length']
+
+LOG = logging.getLogger('crocad.engine')
+
+MIN_CONE_CIRC = 6
+
+# The number of points at which a CurveSurface's profile is sampled:
+TABLE_SIZE = 1024
+
+np = None
+
+
+def _numpy():
+    """
+    Import NumPy on first use. It is only required for batches, and
+    importing it would dominate the start-up time of the command-line tool.
+    """
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+class _Math(object):
+    """
+    The constants and functions used by Surface formulas, for Python
+    numbers. NumPy provides the same names for arrays.
+    """
+    pi = math.pi
+    sin = staticmethod(math.sin)
+    cos = staticmethod(math.cos)
+    sqrt = staticmethod(math.sqrt)
+    floor = staticmethod(math.floor)
+    ceil = staticmethod(math.ceil)
+    minimum = staticmethod(min)
+    maximum = staticmethod(max)
+
+
+_MATH = _Math()
+
+
+class Surface(object):
+    """
+    A surface of revolution, defined by two functions of its parameters,
+    which each take a math namespace `m` first:
+
+    length(m, *params) - the number of rows in a pattern, which is never
+        negative.
+    profile(m, *params) - returns (start, step, circumference): row `n` is
+        at arc length ``start + n * step`` along the profile, and
+        ``circumference(s)`` is the stitch-count at arc length `s`.
+
+    If given, ``ends(m, *params)`` returns the stitch-counts of the first and
+    last rows, which replace the calculated values. `dtypes` holds the type
+    of each parameter, int or float.
+    """
+    def __init__(self, dtypes, length, profile, ends=None):
+        self.dtypes = dtypes
+        self.length = length
+        self.profile = profile
+        self.ends = ends
+
+    def row_count(self, params):
+        """ Return the number of rows in the pattern for `params`. """
+        return int(self.length(_MATH, *params))
+
+    def row(self, params, row):
+        """ Return the stitch-count for zero-based `row` of a pattern. """
+        if self.ends is not None:
+            first, last = self.ends(_MATH, *params)
+            if row == self.row_count(params) - 1:
+                return last
+            elif row == 0:
+                return first
+        start, step, circumference = self.profile(_MATH, *params)
+        return circumference(start + row * step)
+
+    def rows(self, params):
+        """ Return a list of the stitch-counts of the pattern for `params`.
+        """
+        length = self.row_count(params)
+        if not length:
+            return []
+        start, step, circumference = self.profile(_MATH, *params)
+        if self.ends is None:
+            return [circumference(start + row * step)
+                    for row in range(length)]
+        first, last = self.ends(_MATH, *params)
+        return ([first]
+                + [circumference(start + row * step)
+                   for row in range(1, length - 1)]
+                + [last])[-length:]
+
+    def batch(self, *params):
+        """
+        Return a RaggedArray of the stitch-counts for each combination of
+        the array-like `params`.
+        """
+        np = _numpy()
+        # Parameters are broadcast before they're flattened, so that a
+        # column and a row give every combination of their values:
+        params = [value.ravel() for value in np.broadcast_arrays(*[
+            np.atleast_1d(np.asarray(value, dtype=np.int64 if dtype is int
+                                     else np.float64))
+            for value, dtype in zip(params, self.dtypes)])]
+        lengths = np.asarray(self.length(np, *params), dtype=np.intp)
+        pattern, row, offsets = _row_layout(lengths)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = self._values(np, pattern, row, params)
+        if self.ends is not None:
+            first, last = self.ends(np, *params)
+            for selected, value in [(row == 0, first),
+                                    (row == lengths[pattern] - 1, last)]:
+                value = np.asarray(value)
+                values[selected] = value[pattern[selected]] if value.ndim \
+                    else value
+        return RaggedArray(values, offsets)
+
+    def _values(self, np, pattern, row, params):
+        """ Return the stitch-counts for the rows of a batch. """
+        start, step, circumference = self.profile(
+            np, *[value[pattern] for value in params])
+        return np.asarray(circumference(start + row * step),
+                          dtype=np.float64)
+
+
+class CurveSurface(Surface):
+    """
+    A Surface whose profile is the curve ``curve(m, theta, *shape_params)``
+    - returning (r, z) for theta from 0 to pi, with r zero at both ends -
+    scaled so that its pattern has one row per stitch of arc length. The
+    first parameter is the number of rows, followed by the `shape_params`.
+
+    The curve is sampled at TABLE_SIZE points, and the radius at each row is
+    interpolated from the arc length of the samples.
+    """
+    def __init__(self, dtypes, curve):
+        Surface.__init__(self, dtypes, _rows, self._profile)
+        self.curve = curve
+        self._table = functools.lru_cache(maxsize=64)(self._build_table)
+
+    def _build_table(self, shape_params):
+        """
+        Return lists of the fraction of the profile's arc length, and the
+        radius as a fraction of the arc length, at each sample.
+        """
+        step = math.pi / (TABLE_SIZE - 1)
+        points = [self.curve(_MATH, index * step, *shape_params)
+                  for index in range(TABLE_SIZE - 1)]
+        points.append(self.curve(_MATH, math.pi, *shape_params))
+        lengths = [0.0]
+        for (r0, z0), (r1, z1) in zip(points, points[1:]):
+            dr, dz = r1 - r0, z1 - z0
+            lengths.append(lengths[-1] + math.sqrt(dr * dr + dz * dz))
+        total = lengths[-1]
+        return ([length / total for length in lengths],
+                [r / total for r, __ in points])
+
+    def _profile(self, m, rows, *shape_params):
+        """ The profile of a pattern, from a table, for single patterns. """
+        fractions, radii = self._table(shape_params)
+        scale = 2 * m.pi * (rows + 1)
+
+        def circumference(fraction):
+            index = min(max(bisect.bisect_right(fractions, fraction), 1),
+                        TABLE_SIZE - 1)
+            x0, x1 = fractions[index - 1], fractions[index]
+            return scale * ((radii[index] - radii[index - 1]) / (x1 - x0)
+                            * (fraction - x0) + radii[index - 1])
+        step = 1 / (rows + 1)
+        return step, step, circumference
+
+    def _values(self, np, pattern, row, params):
+        # Build a table for each distinct shape, and interpolate every row
+        # in one call, offsetting each table's fractions to keep them
+        # increasing:
+        shapes, shape_index = np.unique(np.stack(params[1:], axis=1),
+                                        axis=0, return_inverse=True)
+        shape_index = shape_index.ravel()
+        theta = np.linspace(0, np.pi, TABLE_SIZE)[np.newaxis, :]
+        r, z = np.broadcast_arrays(*self.curve(
+            np, theta, *[shapes[:, [column]]
+                         for column in range(shapes.shape[1])]))
+        lengths = np.concatenate([np.zeros((len(shapes), 1)), np.cumsum(
+            np.sqrt(np.diff(r, axis=1) ** 2 + np.diff(z, axis=1) ** 2),
+            axis=1)], axis=1)
+        total = lengths[:, -1:]
+        offset = 2.0 * np.arange(len(shapes))[:, np.newaxis]
+        rows = params[0][pattern]
+        step = 1 / (rows + 1)
+        radius = np.interp(step + row * step + 2.0 * shape_index[pattern],
+                           (lengths / total + offset).ravel(),
+                           (r / total).ravel())
+        return 2 * np.pi * (rows + 1) * radius
+
+
+def _rows(m, rows, *params):
+    """ The number of rows of a shape whose row-count is its parameter. """
+    return m.maximum(rows, 0)
+
+
+def _ball(m, rows):
+    """ A semicircle, with a row at each stitch between the poles. """
+    rad = (rows + 1) / m.pi
+    row_angle = m.pi / (rows + 1)
+    sin, pi = m.sin, m.pi
+
+    def circumference(s):
+        row_rad = rad * sin(s * row_angle)
+        return 2 * pi * row_rad
+    return 1, 1, circumference
+
+
+def _cone_length(m, rows, max_circ):
+    """ The number of rows in a cone pattern of `rows` rows. """
+    return m.maximum(rows, 2)
+
+
+def _cone(m, rows, max_circ):
+    """
+    A straight line, from 6 stitches to `max_circ`. Between the ends, the
+    stitch-count for the interpolated row `step` (step 0 being the second
+    row) is ``step * (max_circ - 6) / (rows - 2)`` plus 6.
+
+    For whole-number circumferences that is rational, and its numerator and
+    denominator are exact, so the single (correctly-rounded) division gives
+    the same result on every platform, and is exact whenever the count is a
+    whole or half number.
+
+    The counts are still floats, rather than integers or Fractions, because
+    every shape's counts are snapped by the same float code, in one pattern
+    or a NumPy batch. The quotient is only inexact when the exact count
+    isn't a whole or half number, and then its error is far smaller than
+    the distance to one, so it never changes which multiple the count
+    snaps to: snapped cone rows are the same as with exact arithmetic.
+    """
+    increase = max_circ - MIN_CONE_CIRC
+    steps = rows - 2
+
+    def circumference(step):
+        return step * increase / steps + MIN_CONE_CIRC
+    return -1, 1, circumference
+
+
+def _cone_ends(m, rows, max_circ):
+    """ A cone starts with 6 stitches and ends with `max_circ`. """
+    return float(MIN_CONE_CIRC), max_circ * 1.0
+
+
+def _donut_length(m, init_stitches, rows, initial_angle):
+    """ The number of rows of a donut. """
+    return m.maximum(rows, 0)
+
+
+def _donut(m, init_stitches, rows, initial_angle):
+    """
+    A circular cross-section of `rows` stitches around, starting
+    `initial_angle` radians from the inside of a hole of `init_stitches`.
+    """
+    # Radius of the hole in 'stitches':
+    hole_rad = init_stitches / (2 * m.pi)
+    # Radius of a donut vertical cross-section:
+    xrad = rows / (2 * m.pi)
+    row_angle = 2 * m.pi / rows
+    cos, pi = m.cos, m.pi
+
+    def circumference(s):
+        rad = hole_rad + (xrad - (xrad * cos(s * row_angle + initial_angle)))
+        return rad * 2 * pi
+    return 0, 1, circumference
+
+
+def _torus_arc_length(m, init_stitches, rows, start, sweep):
+    """
+    The number of rows in `sweep` degrees of a donut's cross-section, with
+    a row at each end, and no more than the whole donut's.
+    """
+    return m.maximum(m.minimum(m.floor(rows * sweep / 360 + 0.5) + 1, rows),
+                     0)
+
+
+def _torus_arc(m, init_stitches, rows, start, sweep):
+    """ A donut's cross-section, from `start` degrees. """
+    return _donut(m, init_stitches, rows, start * m.pi / 180)
+
+
+def _cylinder_length(m, circumference, rows):
+    """
+    The rows of a cylinder's base, and then of its side. A cylinder
+    without a circumference has no rows.
+    """
+    return (m.ceil(circumference / (2 * m.pi)) + m.maximum(rows, 0)) \
+        * (circumference > 0)
+
+
+def _cylinder(m, max_circ, rows):
+    """ A flat base, worked out from the centre, then a straight side. """
+    minimum, pi = m.minimum, m.pi
+
+    def circumference(s):
+        return minimum(2 * pi * s, max_circ)
+    return 1, 1, circumference
+
+
+def _hemisphere(m, rows):
+    """ A quarter-circle, from the pole to the equator at the last row. """
+    rad = 2 * rows / m.pi
+    row_angle = m.pi / (2 * rows)
+    sin, pi = m.sin, m.pi
+
+    def circumference(s):
+        return 2 * pi * (rad * sin(s * row_angle))
+    return 1, 1, circumference
+
+
+def _capsule_shape(m, max_circ, rows):
+    """
+    Return the arc length of a capsule's profile - two quarter-circles of
+    radius ``max_circ / (2 * pi)`` joined by `rows` straight rows - and its
+    number of rows, which is zero without a circumference.
+    """
+    length = max_circ / 2 + m.maximum(rows, 0)
+    return length, m.maximum(m.floor(length + 0.5) - 1, 0) * (max_circ > 0)
+
+
+def _capsule_length(m, max_circ, rows):
+    """ The number of rows of a capsule. """
+    return _capsule_shape(m, max_circ, rows)[1]
+
+
+def _capsule(m, max_circ, rows):
+    """ A capsule's profile, with its rows spread evenly along it. """
+    length, count = _capsule_shape(m, max_circ, rows)
+    cap = max_circ / 4
+    scale = 2 * m.pi / max_circ
+    minimum, sin = m.minimum, m.sin
+
+    def circumference(s):
+        # The arc length from the nearer pole, which is on a cap within a
+        # quarter of the circumference:
+        distance = minimum(minimum(s, length - s), cap)
+        return max_circ * sin(distance * scale)
+    step = length / (count + 1)
+    return step, step, circumference
+
+
+def _ellipse(m, theta, aspect):
+    """ Half an ellipse, `aspect` times as high as it is wide. """
+    return m.sin(theta), -aspect * m.cos(theta)
+
+
+def _egg(m, theta, aspect, point):
+    """
+    Two quarter-ellipses, together `aspect` times as high as they are wide,
+    with the upper one `point` times as high as the lower one.
+    """
+    lower = 2 * aspect / (1 + m.maximum(point, 0))
+    height = lower + (point * lower - lower) * (theta > m.pi / 2)
+    return m.sin(theta), -height * m.cos(theta)
+
+
+BALL = Surface((int,), _rows, _ball)
+CONE = Surface((int, float), _cone_length, _cone, _cone_ends)
+DONUT = Surface((float, int, float), _donut_length, _donut)
+TORUS_ARC = Surface((float, int, float, float), _torus_arc_length,
+                    _torus_arc)
+CYLINDER = Surface((float, int), _cylinder_length, _cylinder)
+HEMISPHERE = Surface((int,), _rows, _hemisphere)
+CAPSULE = Surface((float, int), _capsule_length, _capsule)
+ELLIPSOID = CurveSurface((int, float), _ellipse)
+EGG = CurveSurface((int, float, float), _egg)
+
+SURFACES = {
+    'ball': BALL,
+    'cone': CONE,
+    'donut': DONUT,
+    'partial-torus': TORUS_ARC,
+    'cylinder': CYLINDER,
+    'hemisphere': HEMISPHERE,
+    'capsule': CAPSULE,
+    'ellipsoid': ELLIPSOID,
+    'egg': EGG,
+}
+
+
+def ball_row(rows, row):
+    """ The stitch-count for zero-based `row` of a ball of `rows` rows. """
+    return BALL.row((rows,), row)
+
+
+def cone_length(rows):
+    """ The number of rows in a cone pattern of `rows` rows. """
+    return CONE.row_count((rows, None))
+
+
+def cone_row(rows, max_circ, row):
+    """ The stitch-count for zero-based `row` of a cone pattern. """
+    return CONE.row((rows, max_circ), row)
+
+
+def donut_row(init_stitches, rows, row, initial_angle=0):
+    """ The stitch-count for zero-based `row` of a donut pattern. """
+    return DONUT.row((init_stitches, rows, initial_angle), row)
+
+
+def ball_rows(rows):
+    """ Stitch-counts for a single ball pattern of `rows` rows. """
+    return BALL.rows((rows,))
+
+
+def cone_rows(rows, max_circ):
+    """ Stitch-counts for a single cone pattern. See `cone`. """
+    return CONE.rows((rows, max_circ))
+
+
+def donut_rows(init_stitches, rows, initial_angle=0):
+    """ Stitch-counts for a single donut pattern. See `donut`. """
+    return DONUT.rows((init_stitches, rows, initial_angle))
+
+
+class RaggedArray(object):
+    """
+    A sequence of patterns, each a variable-length array of stitch-counts.
+
+    The rows of pattern `n` are ``values[offsets[n]:offsets[n + 1]]``.
+    """
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = offsets
+
+    @property
+    def lengths(self):
+        """ The number of rows in each pattern. """
+        return _numpy().diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('pattern index out of range')
+        return self.values[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def snap(self, margin=1, min_val=0):
+        """ Return a copy of this array with every value snapped. """
+        return RaggedArray(snap(self.values, margin, min_val), self.offsets)
+
+
+def _row_layout(lengths):
+    """
+    Return the pattern index and zero-based row number of every row in a
+    batch of patterns with the provided lengths.
+    """
+    np = _numpy()
+    lengths = np.asarray(lengths, dtype=np.intp)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.intp)
+    np.cumsum(lengths, out=offsets[1:])
+    pattern = np.repeat(np.arange(len(lengths)), lengths)
+    row = np.arange(offsets[-1]) - offsets[pattern]
+    return pattern, row, offsets
+
+
+def ball(rows):
+    """ Stitch-counts for a ball pattern for each row-count in `rows`. """
+    return BALL.batch(rows)
+
+
+def cone(rows, max_circ):
+    """
+    Stitch-counts for a cone pattern for each (`rows`, `max_circ`) pair.
+
+    The first row is always 6 stitches and the last is always `max_circ`
+    stitches, so a pattern has at least 2 rows.
+    """
+    return CONE.batch(rows, max_circ)
+
+
+def donut(init_stitches, rows, initial_angle=0):
+    """
+    Stitch-counts for a donut pattern for each combination of parameters.
+
+    init_stitches - stitch-count of the inside row.
+    rows - number of rows around the torus
+    inital_angle - The angle (in radians) of the first row crocheted.
+    """
+    return DONUT.batch(init_stitches, rows, initial_angle)
+
+
+def snap(values, margin=1, min_val=0):
+    """
+    Return an array of `values`, each rounded to the nearest `margin`
+    (rounding halves up) and no smaller than `min_val`.
+
+    This matches `crocad.util.round_to_nearest` exactly, for every value.
+    """
+    np = _numpy()
+    values = np.asarray(values, dtype=np.float64)
+    result = (np.floor_divide(values, margin)
+              + np.floor(np.mod(values, margin) / margin + 0.5)) * margin
+    return np.maximum(min_val, result)
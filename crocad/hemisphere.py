@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.hemisphere - hemisphere crochet pattern generation for crochet-cad.
+"""
+
+import logging
+import optparse
+
+from crocad import engine, localization, shape
+
+
+__all__ = ['hemisphere']
+
+NAMES = ['hemisphere', 'dome']
+LOG = logging.getLogger('crocad.hemisphere')
+
+
+def hemisphere(rows):
+    """ Generator for stitch-counts for a hemisphere crochet pattern. """
+    for stitches in shape.generate(engine.HEMISPHERE, (rows,)):
+        yield stitches
+
+
+def options(_):
+    """ Return the description and options of the hemisphere command. """
+    return _("""
+Generate a crochet pattern for a hemisphere (half a ball), open at the rim.
+"""), [
+        optparse.make_option('-r', '--row-count', action='store',
+            type='int', default=16, metavar='ROWS',
+            help=_('the number of rows in the pattern. Defines the size'
+            ' of the hemisphere - the circumference of the rim is 4x this'
+            ' value. [%default]')),
+    ]
+
+
+def params(command_opts):
+    """ Return the Surface parameters for the command options. """
+    return (command_opts.row_count,)
+
+
+def title(command_opts):
+    """ Return the title of a hemisphere pattern. """
+    _ = localization.get_translation()
+    return _("Hemisphere (%d rows)") % (
+        command_opts.row_count)
+
+
+SHAPE = shape.Shape(NAMES[0], engine.HEMISPHERE, options, params, title)
+option_parser = SHAPE.option_parser
+pattern = SHAPE.pattern
+lazy_pattern = SHAPE.lazy_pattern
+main = SHAPE.main
@@ -20,16 +20,42 @@
 
 """
 crocad.localization - i18n support for crochet-cad.
+
+Translations are provided by immutable, per-language `Catalog` objects, which
+are safe to share between threads. Their .mo files are memory-mapped (see
+`crocad.mocatalog`), so loading a language is cheap and messages are only
+decoded when they are used. The catalog used by `get_translation()`
+is chosen by:
+
+ - the innermost `translation_context` (or `activate` call) in the current
+   thread or asyncio task, so that different locales can be rendered
+   concurrently without touching the process-wide C locale; or otherwise
+ - the process locale, as set with `locale.setlocale`.
 """
 
+import contextlib
+import contextvars
 import os.path
 import gettext
 import locale
 import logging
+import threading
+
+from crocad.mocatalog import MappedCatalog
 
 
 LOG = logging.getLogger('crocad.localization')
 
+LOCALE_DIRS = [
+    "usr/local/share/locale",
+    os.path.join(os.path.dirname(__file__), "locale"),
+]
+
+_CURRENT_CATALOG = contextvars.ContextVar('crocad_catalog', default=None)
+
+_CATALOGS = {}
+_CATALOGS_LOCK = threading.Lock()
+
 
 def pass_through(to_translate):
     """ A translation function for unsupported locales.
@@ -37,54 +63,129 @@ def pass_through(to_translate):
     return to_translate
 
 
+class Catalog(object):
+    """ The translations for a single language.
+    """
+    def __init__(self, language):
+        self.language = language
+        self.translator = pass_through
+        if language is not None:
+            for localedir in LOCALE_DIRS:
+                path = gettext.find("crochet-cad", localedir=localedir,
+                                    languages=[language])
+                if path is None:
+                    continue
+                try:
+                    self.translator = MappedCatalog(path).gettext
+                    break
+                except IOError as error:
+                    LOG.warning('Could not load %s: %s', path, error)
+
+    def __call__(self, to_translate):
+        """ Return translation for to_translate.
+        """
+        return self.translator(to_translate)
+
+    def is_passthrough(self):
+        """ Returns True if this catalog's language is not supported.
+        """
+        return self.translator == pass_through
+
+
+def language_of(locale_name):
+    """ Return the language part of a locale name, such as 'fi_FI.UTF-8'.
+    """
+    if not locale_name:
+        return None
+    return locale.normalize(locale_name).split('.')[0].split('@')[0]
+
+
+def catalog_for(language):
+    """ Return the (shared) Catalog for `language`, loading it if required.
+    """
+    if language in ('C', 'POSIX'):
+        language = None
+    catalog = _CATALOGS.get(language)
+    if catalog is None:
+        with _CATALOGS_LOCK:
+            catalog = _CATALOGS.get(language)
+            if catalog is None:
+                catalog = _CATALOGS[language] = Catalog(language)
+    return catalog
+
+
+def activate(locale_name):
+    """
+    Use the catalog for `locale_name` in the current context, until
+    `deactivate` is called with the returned token.
+    """
+    return _CURRENT_CATALOG.set(catalog_for(language_of(locale_name)))
+
+
+def deactivate(token):
+    """ Restore the catalog in use before the `activate` call which returned
+    `token`.
+    """
+    _CURRENT_CATALOG.reset(token)
+
+
+@contextlib.contextmanager
+def translation_context(locale_name):
+    """
+    A context manager which uses the catalog for `locale_name` in the
+    current thread or task for the duration of the block.
+    """
+    token = activate(locale_name)
+    try:
+        yield _CURRENT_CATALOG.get()
+    finally:
+        deactivate(token)
+
+
 class Translation(object):
     """ A callable which provides translations for provided strings.
+
+    If `current_locale` (a (language, encoding) pair) is provided, that
+    language is always used. Otherwise the catalog for the current context
+    is used, falling back to the process locale.
     """
     def __init__(self, current_locale=None):
-        self.translator = pass_through
-        if current_locale is None:
-            self.lang, self.charset = locale.getlocale()
-        else:
-            self.lang, self.charset = current_locale
-        self._lookup_translations()
+        self._fixed = None
+        if current_locale is not None:
+            self._fixed = catalog_for(current_locale[0])
+        # The process locale, and the catalog for it:
+        self._process = (None, catalog_for(None))
+
+    def catalog(self):
+        """ Return the Catalog currently used for translations.
+        """
+        if self._fixed is not None:
+            return self._fixed
+        catalog = _CURRENT_CATALOG.get()
+        if catalog is not None:
+            return catalog
+        # Querying the raw locale name is much cheaper than getlocale():
+        current = locale.setlocale(locale.LC_CTYPE)
+        process_locale, catalog = self._process
+        if current != process_locale:
+            catalog = catalog_for(locale.getlocale()[0])
+            self._process = (current, catalog)
+        return catalog
 
     def __call__(self, to_translate):
         """ Return translation for to_translate.
-
-        Checks to ensure the locale hasn't changed  (and re-loads translations
-        if it has) and returns suitable translation.
         """
-        if (self.lang, self.charset) != locale.getlocale():
-            self.lang, self.charset = locale.getlocale()
-            self._lookup_translations()
-        return self.translator(to_translate)
+        return self.catalog().translator(to_translate)
 
-    def _lookup_translations(self):
-        """ Load translations from disk.
+    def language(self):
+        """ Return the language translations are currently provided for.
         """
-        if self.lang is None:
-            self.translator = pass_through
-        else:
-            for localedir in [
-                "usr/local/share/locale",
-                os.path.join(os.path.dirname(__file__), "locale"),
-                ]:
-                try:
-                    trans = gettext.translation("crochet-cad",
-                        localedir=localedir,
-                        languages=[self.lang])
-                    trans.install(str=True)
-                    self.translator = _   # NOQA
-                    break
-                except IOError:
-                    pass
-            else:
-                self.translator = pass_through
+        return self.catalog().language
 
     def is_passthrough(self):
         """ Returns True if the current locale is not supported.
         """
-        return self.translator == pass_through
+        return self.catalog().is_passthrough()
 
 
 TRANSLATION = Translation()
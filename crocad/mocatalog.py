@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.mocatalog - a memory-mapped reader for GNU .mo message catalogs.
+
+Unlike `gettext.GNUTranslations`, which decodes every message into a dict
+when a catalog is loaded, a `MappedCatalog` only reads the .mo file's header.
+Messages are looked up directly in the mapped file, using the catalog's hash
+table if it has one and a binary search of its sorted message ids otherwise,
+and are only decoded when they are first requested. The mapping is
+read-only, so its pages are shared by every process using the catalog.
+"""
+
+import mmap
+import struct
+import logging
+
+
+__all__ = ['MappedCatalog', 'hashpjw']
+
+LOG = logging.getLogger('crocad.mocatalog')
+
+MAGIC = 0x950412de
+HEADER_SIZE = 28
+
+
+def hashpjw(data):
+    """ Return the hash used by GNU gettext for the bytes `data`. """
+    value = 0
+    for byte in data:
+        value = ((value << 4) + byte) & 0xffffffff
+        high = value & 0xf0000000
+        if high:
+            value ^= high >> 24
+            value ^= high
+    return value
+
+
+class MappedCatalog(object):
+    """
+    The translations in the .mo file at `path`.
+
+    Raises OSError if the file can't be read or isn't a .mo file.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as mo_file:
+            try:
+                self._data = mmap.mmap(mo_file.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+            except ValueError:
+                raise OSError('Empty message catalog: %s' % path)
+        if len(self._data) < HEADER_SIZE:
+            raise OSError('Truncated message catalog: %s' % path)
+        for order in '<>':
+            if struct.unpack_from(order + 'I', self._data)[0] == MAGIC:
+                break
+        else:
+            raise OSError('Bad magic number in message catalog: %s' % path)
+        (__, revision, self._count, self._originals, self._translations,
+         self._hash_size, self._hash_offset) = struct.unpack_from(
+            order + '7I', self._data)
+        if revision >> 16 not in (0, 1):
+            raise OSError('Unknown message catalog revision %d: %s' % (
+                revision, path))
+        self._entry = struct.Struct(order + '2I').unpack_from
+        self._hash_entry = struct.Struct(order + 'I').unpack_from
+        self._decoded = {}
+        self.charset = 'utf-8'
+        metadata = self._find(b'')
+        if metadata is not None:
+            for line in self._string(self._translations, metadata).split(
+                    b'\n'):
+                if line.lower().startswith(b'content-type:'):
+                    charset = line.partition(b'charset=')[2].strip()
+                    if charset:
+                        self.charset = charset.decode('ascii')
+
+    def __len__(self):
+        return self._count
+
+    def _string(self, table, index):
+        """ Return the bytes of string `index` in the table at offset
+        `table`.
+        """
+        length, offset = self._entry(self._data, table + index * 8)
+        return self._data[offset:offset + length]
+
+    def _find(self, key):
+        """ Return the index of the message with the id `key` (bytes), or
+        None.
+        """
+        if self._hash_size > 2:
+            value = hashpjw(key)
+            size = self._hash_size
+            index = value % size
+            increment = 1 + value % (size - 2)
+            while True:
+                entry = self._hash_entry(self._data,
+                                         self._hash_offset + index * 4)[0]
+                if entry == 0:
+                    return None
+                if self._string(self._originals, entry - 1) == key:
+                    return entry - 1
+                if index >= size - increment:
+                    index -= size - increment
+                else:
+                    index += increment
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            original = self._string(self._originals, middle)
+            if original < key:
+                low = middle + 1
+            elif original > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def gettext(self, message):
+        """ Return the translation of `message`, or `message` itself if the
+        catalog doesn't contain it.
+        """
+        try:
+            return self._decoded[message]
+        except KeyError:
+            pass
+        index = self._find(message.encode(self.charset))
+        if index is None:
+            translation = message
+        else:
+            translation = self._string(self._translations, index).decode(
+                self.charset)
+        self._decoded[message] = translation
+        return translation
+
+    def close(self):
+        """ Unmap the catalog's file. """
+        self._data.close()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.output - buffered writers for crochet-cad's output.
+
+A pattern can be many thousands of lines long, and printing each line makes
+a system call per line when output goes to a file or pipe. A `Writer`
+instead collects text in memory, and encodes and writes it in large blocks:
+whenever `buffer_size` characters are waiting, and when `flush` is called at
+a boundary such as the end of a pattern or a batch result.
+
+Use `writer` to wrap an open text or binary file, or `open_output` to open a
+file by name. Files with names ending in '.gz' are gzip-compressed.
+"""
+
+import io
+import logging
+import sys
+
+from crocad import localization
+
+
+__all__ = ['Writer', 'TextWriter', 'BinaryWriter', 'GzipWriter', 'writer',
+           'open_output', 'output_writer']
+
+LOG = logging.getLogger('crocad.output')
+
+BUFFER_SIZE = 64 * 1024
+
+
+class Writer(object):
+    """
+    Buffers text, and passes it to `_write` in blocks of at least
+    `buffer_size` characters. Subclasses implement `_write`, `_flush` and
+    `_close` for their kind of stream.
+
+    A Writer can be used wherever a text file is written to with `write`
+    and `flush`, and as a context manager which closes it.
+    """
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._pending = []
+        self._size = 0
+
+    def write(self, text):
+        """ Write `text`, which is buffered until enough is waiting. """
+        self._pending.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self._drain()
+
+    def write_line(self, line):
+        """ Write `line` followed by a newline. """
+        self.write(line + '\n')
+
+    def write_lines(self, lines):
+        """ Write each of `lines`, each followed by a newline. """
+        for line in lines:
+            self.write(line + '\n')
+
+    def _drain(self):
+        """ Pass all buffered text to `_write`. """
+        if self._pending:
+            text = ''.join(self._pending)
+            self._pending = []
+            self._size = 0
+            self._write(text)
+
+    def flush(self):
+        """ Write all buffered text, and flush the underlying stream. """
+        self._drain()
+        self._flush()
+
+    def close(self):
+        """ Flush the writer, and close any stream that it owns. """
+        self.flush()
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, text):
+        """ Write a block of text to the underlying stream. """
+        raise NotImplementedError
+
+    def _flush(self):
+        """ Flush the underlying stream. """
+        raise NotImplementedError
+
+    def _close(self):
+        """ Close the underlying stream, if owned. """
+        raise NotImplementedError
+
+
+class TextWriter(Writer):
+    """ A Writer for a text file, such as an io.StringIO. """
+    def __init__(self, stream, buffer_size=BUFFER_SIZE, close_stream=False):
+        Writer.__init__(self, buffer_size)
+        self.stream = stream
+        self.close_stream = close_stream
+
+    def _write(self, text):
+        self.stream.write(text)
+
+    def _flush(self):
+        self.stream.flush()
+
+    def _close(self):
+        if self.close_stream:
+            self.stream.close()
+
+
+class BinaryWriter(Writer):
+    """ A Writer which encodes text into a binary file. """
+    def __init__(self, stream, encoding='utf-8', errors='strict',
+                 buffer_size=BUFFER_SIZE, close_stream=False):
+        Writer.__init__(self, buffer_size)
+        self.stream = stream
+        self.encoding = encoding
+        self.errors = errors
+        self.close_stream = close_stream
+
+    def _write(self, text):
+        self.stream.write(text.encode(self.encoding, self.errors))
+
+    def _flush(self):
+        self.stream.flush()
+
+    def _close(self):
+        if self.close_stream:
+            self.stream.close()
+
+
+class GzipWriter(BinaryWriter):
+    """
+    A Writer which gzip-compresses encoded text into a binary file.
+
+    Each `flush` ends a compressed block, so flushing rarely gives better
+    compression. The gzip stream is completed when the writer is closed.
+    """
+    def __init__(self, stream, encoding='utf-8', errors='strict',
+                 buffer_size=BUFFER_SIZE, close_stream=False,
+                 compresslevel=6):
+        import gzip
+        # A fixed modification time makes the output reproducible:
+        compressed = gzip.GzipFile(fileobj=stream, mode='wb', mtime=0,
+                                   compresslevel=compresslevel)
+        BinaryWriter.__init__(self, compressed, encoding, errors, buffer_size,
+                              close_stream=True)
+        self.raw_stream = stream
+        self.close_raw_stream = close_stream
+
+    def _flush(self):
+        self.stream.flush()
+        self.raw_stream.flush()
+
+    def _close(self):
+        self.stream.close()
+        if self.close_raw_stream:
+            self.raw_stream.close()
+
+
+def writer(stream, buffer_size=BUFFER_SIZE):
+    """
+    Return a Writer for the open file `stream`, which is not closed with the
+    writer.
+
+    Text files with an underlying binary buffer, such as sys.stdout, are
+    written to through that buffer, using the text file's encoding.
+    """
+    if isinstance(stream, io.TextIOBase):
+        buffer = getattr(stream, 'buffer', None)
+        if buffer is None:
+            return TextWriter(stream, buffer_size)
+        # Anything already written to the text file must come first:
+        stream.flush()
+        return BinaryWriter(buffer, stream.encoding, stream.errors or 'strict',
+                            buffer_size)
+    return BinaryWriter(stream, buffer_size=buffer_size)
+
+
+def open_output(path=None, encoding='utf-8', buffer_size=BUFFER_SIZE):
+    """
+    Return a Writer for the file `path`, which is gzip-compressed if `path`
+    ends in '.gz'. If `path` is None or '-', the Writer is for stdout.
+    """
+    if path is None or path == '-':
+        return writer(sys.stdout, buffer_size)
+    stream = open(path, 'wb')
+    if path.endswith('.gz'):
+        return GzipWriter(stream, encoding, buffer_size=buffer_size,
+                          close_stream=True)
+    return BinaryWriter(stream, encoding, buffer_size=buffer_size,
+                        close_stream=True)
+
+
+def output_writer(global_options):
+    """
+    Return a Writer for the output file selected by the global options.
+
+    Raises crocad.UserError if the file can't be opened.
+    """
+    path = getattr(global_options, 'output', None)
+    try:
+        return open_output(path)
+    except (IOError, OSError) as error:
+        from crocad import UserError
+        _ = localization.get_translation()
+        raise UserError(_('Cannot write to {path}: {error}').format(
+            path=path, error=error.strerror or error))
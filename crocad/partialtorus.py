@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.partialtorus - partial torus crochet pattern generation for crochet-cad.
+"""
+
+import logging
+import optparse
+
+from crocad import engine, localization, shape
+
+
+__all__ = ['partial_torus']
+
+NAMES = ['partial-torus', 'torus-arc']
+LOG = logging.getLogger('crocad.partialtorus')
+
+
+def partial_torus(init_stitches, rows, start, sweep):
+    """ Generator for stitch-counts for a partial torus crochet pattern. """
+    for stitches in shape.generate(engine.TORUS_ARC,
+                                   (init_stitches, rows, start, sweep)):
+        yield stitches
+
+
+def options(_):
+    """ Return the description and options of the partial-torus command. """
+    return _("""
+Generate a pattern for part of a donut (torus), such as its outer half.
+
+The pattern covers SWEEP degrees of the donut's cross-section, starting START
+degrees around from the donut hole - so the defaults give the outer half, and
+a START of 0 and a SWEEP of 360 give a whole donut.
+"""), [
+        optparse.make_option('-i', '--inner-radius', action='store',
+            type='int', default=18, metavar='STITCHES',
+            help=_('the circumference of the donut hole, in stitches'
+            ' [%default]')),
+        optparse.make_option('-r', '--row-count', action='store',
+            type='int', default=16, metavar='ROWS',
+            help=_("the number of rows around the whole donut - defines its"
+            " 'thickness' [%default]")),
+        optparse.make_option('--start', action='store',
+            type='float', default=90.0, metavar='DEGREES',
+            help=_('the angle of the first row, from the donut hole'
+            ' [%default]')),
+        optparse.make_option('--sweep', action='store',
+            type='float', default=180.0, metavar='DEGREES',
+            help=_('the angle covered by the pattern [%default]')),
+    ]
+
+
+def params(command_opts):
+    """ Return the Surface parameters for the command options. """
+    return (command_opts.inner_radius, command_opts.row_count,
+            command_opts.start, command_opts.sweep)
+
+
+def title(command_opts):
+    """ Return the title of a partial torus pattern. """
+    _ = localization.get_translation()
+    return _("Partial torus (inner-radius: %d, %d rows, %g-%g degrees)") % (
+        command_opts.inner_radius, command_opts.row_count,
+        command_opts.start, command_opts.start + command_opts.sweep)
+
+
+SHAPE = shape.Shape(NAMES[0], engine.TORUS_ARC, options, params, title, 0)
+option_parser = SHAPE.option_parser
+pattern = SHAPE.pattern
+lazy_pattern = SHAPE.lazy_pattern
+main = SHAPE.main
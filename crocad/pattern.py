@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.pattern - compact and lazy representations of crochet patterns.
+"""
+
+from array import array
+import logging
+
+from crocad.cache import LRUCache
+from crocad.engine import _numpy
+from crocad.util import Row, round_to_nearest, row_instructions
+
+
+__all__ = ['Pattern', 'LazyPattern']
+
+LOG = logging.getLogger('crocad.pattern')
+
+
+def _uint_array(values):
+    """ Copy a NumPy array of non-negative integers into an array('I'). """
+    np = _numpy()
+    result = array('I')
+    result.frombytes(np.asarray(values, dtype=result.typecode).tobytes())
+    return result
+
+
+class Pattern(object):
+    """
+    A compact, immutable crochet pattern.
+
+    Stitch-counts are stored one per row in an unsigned int array. Rows
+    usually repeat the same few transitions between stitch-counts, so each
+    distinct (prev, count) transition is stored once in a flat table and
+    every row holds an index into it.
+
+    A Pattern behaves as a sequence of stitch-counts, so it can be used
+    anywhere a stitch-count generator is accepted. Use `row` or `rows` for
+    the corresponding `crocad.util.Row` objects.
+    """
+    __slots__ = ('title', 'counts', 'row_transitions',
+                 'transition_prev', 'transition_count')
+
+    def __init__(self, stitches, title=None):
+        np = _numpy()
+        self.title = title
+        if isinstance(stitches, np.ndarray):
+            counts = stitches.astype(np.uint32)
+        else:
+            counts = np.fromiter((int(x) for x in stitches), dtype=np.uint32)
+        prevs = np.zeros_like(counts)
+        prevs[1:] = counts[:-1]
+        # Each transition is keyed on both stitch-counts. A prev-count of 0
+        # marks the first row:
+        keys = (prevs.astype(np.uint64) << 32) | counts
+        keys, transitions = np.unique(keys, return_inverse=True)
+        self.counts = _uint_array(counts)
+        self.row_transitions = _uint_array(transitions)
+        self.transition_prev = _uint_array(keys >> 32)
+        self.transition_count = _uint_array(keys & 0xffffffff)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, index):
+        return self.counts[index]
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def row(self, index):
+        """ Return the `crocad.util.Row` at zero-based `index`. """
+        if index < 0:
+            index += len(self.counts)
+        transition = self.row_transitions[index]
+        return Row(index + 1, self.transition_prev[transition] or None,
+                   self.counts[index])
+
+    def rows(self):
+        """ Generate a `crocad.util.Row` for each row in the pattern. """
+        for index in range(len(self.counts)):
+            yield self.row(index)
+
+    def instructions(self, index):
+        """ Return the InstructionGroup for the row at zero-based `index`.
+        """
+        transition = self.row_transitions[index]
+        return row_instructions(self.transition_prev[transition] or None,
+                                self.transition_count[transition])
+
+    @property
+    def transitions(self):
+        """ The number of distinct transitions in the pattern. """
+        return len(self.transition_prev)
+
+    @property
+    def total_stitches(self):
+        """ The total number of stitches in the pattern. """
+        return sum(self.counts)
+
+    @property
+    def nbytes(self):
+        """ The number of bytes used to store the pattern's data. """
+        return sum(data.itemsize * len(data) for data in (
+            self.counts, self.row_transitions,
+            self.transition_prev, self.transition_count))
+
+
+class LazyPattern(object):
+    """
+    A crochet pattern whose rows are computed on demand.
+
+    `row_function` returns the (unsnapped) stitch-count for a zero-based row
+    index, which is rounded to the nearest `margin`, and no less than
+    `min_val`. Since each row is computed independently, indexing or slicing
+    a LazyPattern only computes the rows required, so a page from the end of
+    a large pattern is as cheap as one from the start.
+
+    A LazyPattern behaves as a sequence of stitch-counts, and slicing it
+    returns a list. Recently used rows and the total stitch-count are
+    cached.
+    """
+    __slots__ = ('title', 'length', 'row_function', 'margin', 'min_val',
+                 '_counts', '_total')
+
+    def __init__(self, length, row_function, margin=1, min_val=0,
+                 title=None, cache_size=1024):
+        self.title = title
+        self.length = max(0, length)
+        self.row_function = row_function
+        self.margin = margin
+        self.min_val = min_val
+        self._counts = LRUCache(cache_size)
+        self._total = None
+
+    def __len__(self):
+        return self.length
+
+    def _index(self, index):
+        """ Return a non-negative row index, or raise IndexError. """
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('pattern row out of range')
+        return index
+
+    def _snap(self, index):
+        """ Compute the snapped stitch-count for non-negative `index`. """
+        return round_to_nearest(self.row_function(index), self.margin,
+                                self.min_val)
+
+    def _count(self, index):
+        """ Return the (cached) stitch-count for non-negative `index`. """
+        count = self._counts.get(index)
+        if count is None:
+            count = self._snap(index)
+            self._counts.put(index, count)
+        return count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._count(i) for i in range(*index.indices(self.length))]
+        return self._count(self._index(index))
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self._count(index)
+
+    def row(self, index):
+        """ Return the `crocad.util.Row` at zero-based `index`. """
+        index = self._index(index)
+        prev = self._count(index - 1) if index else None
+        return Row(index + 1, prev, self._count(index))
+
+    def rows(self, start=0, stop=None):
+        """ Generate a `crocad.util.Row` for each row in `start:stop`. """
+        for index in range(*slice(start, stop).indices(self.length)):
+            yield self.row(index)
+
+    def instructions(self, index):
+        """ Return the InstructionGroup for the row at zero-based `index`.
+        """
+        return self.row(index).instructions
+
+    @property
+    def total_stitches(self):
+        """ The total number of stitches in the pattern. """
+        if self._total is None:
+            self._total = sum(self._snap(index)
+                              for index in range(self.length))
+        return self._total
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.profiling - per-stage timers and counters for crochet-cad.
+
+Pattern generation is split into stages, such as 'options', 'generate',
+'snap', 'instructions' and 'print'. Code marks a stage with `stage` (for a
+block) or `stage_iter` (for each step of a lazy iterator), and counts events
+with `count`. Stages nest, and each stage is only charged for the time not
+spent in the stages nested inside it.
+
+Nothing is recorded unless a `Profiler` has been enabled with `enable`, and
+while disabled the hooks do no work: `stage_iter` returns its iterator
+unchanged and `stage` returns a shared, empty context manager. When the
+profiler is disabled its exporters - callables taking the Profiler, such as
+`write_report` - are called.
+"""
+
+import contextlib
+import logging
+import sys
+import threading
+import time
+
+
+__all__ = ['Profiler', 'enable', 'disable', 'active', 'stage', 'stage_iter',
+           'count', 'write_report']
+
+LOG = logging.getLogger('crocad.profiling')
+
+_PROFILER = None
+
+_NO_STAGE = contextlib.nullcontext()
+
+
+class Profiler(object):
+    """
+    Records the exclusive time spent in, and the number of entries into,
+    each stage, plus named counters.
+    """
+    def __init__(self, exporters=None, clock=time.perf_counter):
+        self.exporters = list(exporters or [])
+        self.clock = clock
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        self.started = clock()
+        self.finished = None
+        self._local = threading.local()
+
+    def _stack(self):
+        """ Return the current thread's stack of stage names. """
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def enter(self, name):
+        """ Start charging time to the stage `name`. """
+        now = self.clock()
+        stack = self._stack()
+        if stack:
+            self.add(stack[-1], now - self._local.since)
+        stack.append(name)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self._local.since = now
+
+    def exit(self):
+        """ Leave the current stage, resuming the stage it was nested in.
+        """
+        now = self.clock()
+        self.add(self._stack().pop(), now - self._local.since)
+        self._local.since = now
+
+    def add(self, name, seconds):
+        """ Charge `seconds` to the stage `name`. """
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def count(self, name, increment=1):
+        """ Add `increment` to the counter `name`. """
+        self.counters[name] = self.counters.get(name, 0) + increment
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ A context manager charging the block's time to stage `name`. """
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def stage_iter(self, name, iterable):
+        """ Generate the items of `iterable`, charging the time taken to
+        produce each one to stage `name`.
+        """
+        iterator = iter(iterable)
+        while True:
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            yield item
+
+    @property
+    def total(self):
+        """ The seconds between the profiler being created and finished. """
+        return (self.finished or self.clock()) - self.started
+
+    def stages(self):
+        """ Return (name, seconds, calls) for each stage, slowest first. """
+        return sorted(((name, seconds, self.calls.get(name, 0))
+                       for name, seconds in self.seconds.items()),
+                      key=lambda stage: -stage[1])
+
+    def finish(self):
+        """ Stop the profiler's clock and call each of its exporters. """
+        self.finished = self.clock()
+        for exporter in self.exporters:
+            exporter(self)
+
+
+def write_report(profiler, out=None):
+    """ An exporter which writes a per-stage breakdown to `out` (by default
+    stderr).
+    """
+    out = out or sys.stderr
+    total = profiler.total
+    out.write('%-16s %10s %6s %8s\n' % ('Stage', 'Time (ms)', '%', 'Calls'))
+    unattributed = total
+    for name, seconds, calls in profiler.stages():
+        unattributed -= seconds
+        out.write('%-16s %10.3f %6.1f %8d\n' % (
+            name, seconds * 1000, 100 * seconds / total if total else 0,
+            calls))
+    out.write('%-16s %10.3f %6.1f\n' % (
+        '(other)', unattributed * 1000,
+        100 * unattributed / total if total else 0))
+    out.write('%-16s %10.3f\n' % ('Total', total * 1000))
+    for name in sorted(profiler.counters):
+        out.write('%-32s %10d\n' % (name, profiler.counters[name]))
+
+
+def enable(profiler=None):
+    """ Start recording with `profiler` (or a new Profiler), and return it.
+    """
+    global _PROFILER
+    _PROFILER = profiler or Profiler()
+    return _PROFILER
+
+
+def disable():
+    """ Stop recording, finish the active Profiler and return it. """
+    global _PROFILER
+    profiler, _PROFILER = _PROFILER, None
+    if profiler is not None:
+        profiler.finish()
+    return profiler
+
+
+def active():
+    """ Return the active Profiler, or None. """
+    return _PROFILER
+
+
+def stage(name):
+    """ Return a context manager charging its block to the stage `name`. """
+    if _PROFILER is None:
+        return _NO_STAGE
+    return _PROFILER.stage(name)
+
+
+def stage_iter(name, iterable):
+    """ Return `iterable`, charging the time taken to produce each of its
+    items to the stage `name`.
+    """
+    if _PROFILER is None:
+        return iterable
+    return _PROFILER.stage_iter(name, iterable)
+
+
+def count(name, increment=1):
+    """ Add `increment` to the counter `name`. """
+    if _PROFILER is not None:
+        _PROFILER.count(name, increment)
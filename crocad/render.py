@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.render - output formats for crochet-cad patterns.
+
+Each renderer consumes the `crocad.util.Row` objects for a pattern, so the
+instructions for a row are calculated once and can be rendered into several
+formats in a single pass - see `render`.
+
+When rows are grouped, renderers are also given `crocad.util.RowGroup`
+objects. Formats listing every row, such as counts and JSON, expand each
+group back into its rows.
+"""
+
+import logging
+import sys
+
+from crocad import localization, output, profiling
+from crocad.util import group_rows, group_txt, instruction_txt, pattern_rows
+from crocad.util import InstructionGroup, MultipleStitchesInstruction
+from crocad.util import RowGroup, StitchTogetherInstruction
+
+
+__all__ = ['RENDERERS', 'render', 'render_rows', 'print_pattern',
+           'output_format', 'group_option']
+
+_ = localization.get_translation()
+
+LOG = logging.getLogger('crocad.render')
+
+
+class TextRenderer(object):
+    """ Renders a pattern as plain-text instructions. """
+    def begin(self, title):
+        """ Return the lines preceding the first row. """
+        return [title, '=' * len(title)]
+
+    def row(self, row):
+        """ Return the lines for `row`. """
+        return [instruction_txt(row.number, row.prev, row.count,
+                                row.instructions)]
+
+    def group(self, group):
+        """ Return the lines for a RowGroup. """
+        return [group_txt(group)]
+
+    def end(self):
+        """ Return the lines following the last row. """
+        return []
+
+
+class CountsRenderer(object):
+    """ Renders just the stitch-count of each row, one per line. """
+    def begin(self, title):
+        """ Return the lines preceding the first row. """
+        return []
+
+    def row(self, row):
+        """ Return the lines for `row`. """
+        return [str(row.count)]
+
+    def group(self, group):
+        """ Return the lines for each row of a RowGroup. """
+        return [str(row.count) for row in group.expand()]
+
+    def end(self):
+        """ Return the lines following the last row. """
+        return []
+
+
+class JSONRenderer(object):
+    """ Renders a pattern as a JSON document, one row per line. """
+    def __init__(self):
+        # json is only imported for JSON output:
+        import json
+        self._dumps = json.dumps
+        self._pending = None
+
+    def begin(self, title):
+        """ Return the lines preceding the first row. """
+        self._pending = None
+        return ['{"title": %s, "rows": [' % self._dumps(title)]
+
+    def row(self, row):
+        """ Return the lines for `row`. """
+        # Each row is held back until the next arrives, so that the
+        # separating comma is only written between rows:
+        lines = [] if self._pending is None else [self._pending + ',']
+        self._pending = '  ' + self._dumps(row.as_dict(), sort_keys=True)
+        return lines
+
+    def group(self, group):
+        """ Return the lines for each row of a RowGroup. """
+        lines = []
+        for row in group.expand():
+            lines.extend(self.row(row))
+        return lines
+
+    def end(self):
+        """ Return the lines following the last row. """
+        lines = [] if self._pending is None else [self._pending]
+        self._pending = None
+        return lines + [']}']
+
+
+class ChartRenderer(object):
+    """
+    Renders a pattern as a simple stitch chart, with one symbol for each
+    stitch worked into the previous row. Increases and decreases of more
+    than three stitches are shown with their count, such as '[4V]'.
+    """
+    SYMBOLS = {
+        'ch': 'O',
+        'sc': 'X',
+        'inc': 'V',
+        'dec': 'A',
+        'inc3': 'W',
+        'dec3': 'M',
+    }
+
+    def begin(self, title):
+        """ Return the lines preceding the first row. """
+        return [title, '=' * len(title),
+                _('O = ch, X = sc, V = 2sc in next, W = 3sc in next,'
+                  ' A = sc2tog, M = sc3tog, [4V] = 4sc in next,'
+                  ' [4A] = sc4tog')]
+
+    def row(self, row):
+        """ Return the lines for `row`. """
+        symbols = ''.join(self._symbols(row.instructions))
+        return ['%3d (%d): %s' % (row.number, row.count, symbols)]
+
+    def group(self, group):
+        """ Return the lines for a RowGroup. """
+        numbers = '%3d-%d' % (group.first, group.last)
+        if len(group.rows) > 1:
+            return ['%s (%d): %s' % (numbers, group.count, _(
+                'repeat rows {start}-{end}').format(
+                    start=group.rows[0].number, end=group.rows[-1].number))]
+        row = group.rows[0]
+        symbols = ''.join(self._symbols(row.instructions))
+        return ['%s (%d): %s' % (numbers, row.count, symbols)]
+
+    def end(self):
+        """ Return the lines following the last row. """
+        return []
+
+    def _symbols(self, instructions):
+        """ Generate the chart symbols for an InstructionGroup. """
+        for inst in instructions:
+            if isinstance(inst, InstructionGroup):
+                symbols = ''.join(self._symbols(inst))
+                yield symbols * inst.repeats
+            elif isinstance(inst, MultipleStitchesInstruction):
+                yield self._symbol('inc', inst.multiple_count) \
+                    * int(inst.stitch_count)
+            elif isinstance(inst, StitchTogetherInstruction):
+                yield self._symbol('dec', inst.together_count) \
+                    * int(inst.stitch_count)
+            else:
+                symbol = self.SYMBOLS.get(inst.stitch, self.SYMBOLS['sc'])
+                yield symbol * int(inst.stitch_count)
+
+    def _symbol(self, kind, count):
+        """ Return the symbol for an increase or decrease ('inc' or 'dec')
+        of `count` stitches.
+        """
+        if count == 2:
+            return self.SYMBOLS[kind]
+        if count == 3:
+            return self.SYMBOLS[kind + '3']
+        return '[%d%s]' % (count, self.SYMBOLS[kind])
+
+
+RENDERERS = {
+    'txt': TextRenderer,
+    'counts': CountsRenderer,
+    'json': JSONRenderer,
+    'chart': ChartRenderer,
+}
+
+
+def _render_row(renderer, row):
+    """ Return the lines rendered for a Row or RowGroup. """
+    if isinstance(row, RowGroup):
+        return renderer.group(row)
+    return renderer.row(row)
+
+
+def render(title, stitches, output_formats, group=False):
+    """
+    Render the pattern for `stitches` into each of `output_formats` in a
+    single pass over its rows. If `group` is true, runs and cycles of rows
+    are collapsed - see `crocad.util.group_rows`.
+
+    Returns a dict mapping each output format to a list of lines.
+    """
+    return render_rows(title, pattern_rows(stitches), output_formats, group)
+
+
+def render_rows(title, rows, output_formats, group=False):
+    """
+    Render `crocad.util.Row` objects, which may be any part of a pattern,
+    into each of `output_formats` - see `render`.
+    """
+    renderers = [(fmt, RENDERERS[fmt]()) for fmt in output_formats]
+    if group:
+        rows = group_rows(rows)
+    result = {}
+    for fmt, renderer in renderers:
+        result[fmt] = renderer.begin(title)
+    for row in rows:
+        for fmt, renderer in renderers:
+            result[fmt].extend(_render_row(renderer, row))
+    for fmt, renderer in renderers:
+        result[fmt].extend(renderer.end())
+    return result
+
+
+def group_option(global_options):
+    """ Return whether the global options select grouping of rows. """
+    return bool(getattr(global_options, 'group_rows', False))
+
+
+def output_format(global_options):
+    """ Return the output format selected by the global options. """
+    if getattr(global_options, 'inhuman', False):
+        return 'counts'
+    return getattr(global_options, 'format', None) or 'txt'
+
+
+def print_pattern(title, stitches, fmt='txt', out=None, group=False):
+    """
+    Print the pattern for `stitches` in the output format `fmt`, to the
+    `crocad.output.Writer` `out`, or stdout. The writer is flushed at the
+    end of the pattern. If `group` is true, runs and cycles of rows are
+    collapsed - see `crocad.util.group_rows`.
+    """
+    renderer = RENDERERS[fmt]()
+    rows = pattern_rows(stitches)
+    if group:
+        rows = group_rows(rows)
+    with profiling.stage('print'):
+        out = out or output.writer(sys.stdout)
+        out.write_lines(renderer.begin(title))
+        for lines in profiling.stage_iter('instructions', (
+                _render_row(renderer, row) for row in rows)):
+            out.write_lines(lines)
+        out.write_lines(renderer.end())
+        out.flush()
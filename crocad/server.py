@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.server - a long-running HTTP server for crochet pattern generation.
+
+Patterns are requested either with a GET request to the shape's name, with
+options in the query string::
+
+    GET /ball?row_count=20&format=json&first_row=11&last_row=20
+
+or by POSTing a job, in the format accepted by `crocad.batch`, to /pattern.
+Responses are JSON objects containing either an "output" or an "error".
+Connections are kept alive between requests, and requests pipelined on a
+connection are answered in order.
+"""
+
+import concurrent.futures
+import http.server
+import json
+import logging
+import optparse
+import os
+import socketserver
+from urllib.parse import parse_qsl, urlsplit
+
+from crocad import batch, localization
+from crocad.cache import LRUCache
+
+
+__all__ = ['PatternService', 'ServiceError', 'make_server']
+
+NAMES = ['serve', 'server']
+LOG = logging.getLogger('crocad.server')
+
+# Query-string parameters which are part of the job, rather than options
+# for the shape:
+JOB_PARAMETERS = ['id', 'format', 'accurate', 'locale', 'rounding',
+                  'first_row', 'last_row', 'group_rows']
+
+
+class ServiceError(Exception):
+    """ Indicates that a job failed unexpectedly, rather than being
+    invalid.
+    """
+
+
+class PatternService(object):
+    """
+    Runs pattern jobs on a pool of worker threads or processes, caching
+    successful results.
+    """
+    def __init__(self, defaults, workers=4, processes=False,
+                 cache_size=1024):
+        self.defaults = defaults
+        if processes:
+            self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.cache = LRUCache(cache_size)
+
+    def run(self, job):
+        """
+        Return the result dict for `job`.
+
+        Raises ServiceError if the job fails unexpectedly.
+        """
+        key = json.dumps(dict(job, id=None), sort_keys=True)
+        result = self.cache.get(key)
+        if result is None:
+            try:
+                result = self.executor.submit(
+                    batch.run_job, dict(job, id=None), self.defaults,
+                    False).result()
+            except Exception as error:
+                LOG.exception('Job %r failed', job.get('id'))
+                raise ServiceError(str(error) or error.__class__.__name__)
+            if 'error' not in result:
+                self.cache.put(key, result)
+        return dict(result, id=job.get('id'))
+
+    def close(self):
+        """ Shut down the worker pool. """
+        self.executor.shutdown()
+
+
+def job_from_query(shape, query):
+    """ Convert a shape name and query-string into a batch job dict. """
+    job = {'shape': shape, 'options': {}}
+    for key, value in parse_qsl(query):
+        key = key.replace('-', '_')
+        if key in JOB_PARAMETERS:
+            job[key] = value
+        else:
+            job['options'][key] = value
+    for key in ['accurate', 'group_rows']:
+        if key in job:
+            job[key] = job[key].lower() in ('1', 'true', 'yes')
+    return job
+
+
+class PatternRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Answers pattern requests using the server's PatternService. """
+    protocol_version = 'HTTP/1.1'
+    # Buffer each response so its headers and body are sent together, and
+    # flushed once the request has been handled:
+    wbufsize = -1
+
+    def do_GET(self):
+        """ Handle a GET for a shape, '/' or '/stats'. """
+        url = urlsplit(self.path)
+        name = url.path.strip('/')
+        if not name:
+            self._send_json(200, {'shapes': sorted(batch.SHAPES)})
+        elif name == 'stats':
+            self._send_json(200, {'cache': self.server.service.cache.stats()
+                                  ._asdict()})
+        elif name in batch.SHAPES:
+            self._run(job_from_query(name, url.query))
+        else:
+            self._send_json(404, {'error': 'Not found: %s' % url.path})
+
+    def do_POST(self):
+        """ Handle a job POSTed to '/pattern'. """
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            # The body can't be found, so neither can the next request:
+            self.close_connection = True
+            self._send_json(400, {'id': None,
+                                  'error': 'Invalid Content-Length.'})
+            return
+        body = self.rfile.read(length)
+        if urlsplit(self.path).path.rstrip('/') != '/pattern':
+            self._send_json(404, {'error': 'Not found: %s' % self.path})
+            return
+        try:
+            job = json.loads(body.decode('utf-8'))
+            if not isinstance(job, dict):
+                raise ValueError('A job must be a JSON object.')
+        except ValueError as error:
+            self._send_json(400, {'id': None, 'error': str(error)})
+        else:
+            self._run(job)
+
+    def _run(self, job):
+        """ Run `job`, and send its result. """
+        try:
+            result = self.server.service.run(job)
+        except ServiceError as error:
+            self._send_json(500, {'id': job.get('id'), 'error': str(error)})
+        else:
+            self._send_result(result)
+
+    def _send_result(self, result):
+        """ Send a job result, with a status reflecting its success. """
+        self._send_json(400 if 'error' in result else 200, result)
+
+    def _send_json(self, status, obj):
+        """ Send `obj` as a JSON response. """
+        body = json.dumps(obj, sort_keys=True).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        """ Return the client address, which is empty for UNIX sockets. """
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return self.client_address or 'unix'
+
+    def log_message(self, format, *args):
+        """ Log requests to the crocad.server logger. """
+        LOG.info('%s - %s', self.address_string(), format % args)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                          http.server.HTTPServer):
+    """ An HTTP server which handles each connection in its own thread. """
+    daemon_threads = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn,
+                                  socketserver.UnixStreamServer):
+        """ An HTTP server listening on a UNIX socket. """
+        daemon_threads = True
+
+
+def make_server(service, host='127.0.0.1', port=8080, unix_socket=None):
+    """
+    Return an HTTP server, bound to `unix_socket` if provided or otherwise
+    `host` and `port`, answering requests with `service`.
+    """
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, PatternRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), PatternRequestHandler)
+    server.service = service
+    return server
+
+
+def main(argv, global_options):
+    """ Command entry-point for the pattern server. """
+    _ = localization.get_translation()
+    opt_parser = optparse.OptionParser(
+        '%prog [GLOBAL-OPTIONS] serve [--host=HOST] [--port=PORT]'
+        ' [--unix-socket=PATH] [--workers=N] [--processes]',
+        description=_("""
+Run a long-running HTTP server which generates patterns. Request a pattern
+with 'GET /SHAPE?OPTION=VALUE', or by POSTing a batch job to /pattern.
+""").strip())
+    opt_parser.add_option('-H', '--host', action='store',
+        default='127.0.0.1',
+        help=_('the address to listen on [%default]'))
+    opt_parser.add_option('-p', '--port', action='store', type='int',
+        default=8080, help=_('the port to listen on [%default]'))
+    opt_parser.add_option('-u', '--unix-socket', action='store',
+        metavar='PATH', help=_('listen on a UNIX socket instead of a port'))
+    opt_parser.add_option('-w', '--workers', action='store', type='int',
+        default=4, metavar='N',
+        help=_('the number of workers generating patterns [%default]'))
+    opt_parser.add_option('--processes', action='store_true', default=False,
+        help=_('use worker processes instead of threads'))
+    opt_parser.add_option('--cache-size', action='store', type='int',
+        default=1024, metavar='N',
+        help=_('the number of responses to cache [%default]'))
+    command_opts, __ = opt_parser.parse_args(argv)
+
+    service = PatternService(batch.job_defaults(global_options),
+                             command_opts.workers, command_opts.processes,
+                             command_opts.cache_size)
+    server = make_server(service, command_opts.host, command_opts.port,
+                         command_opts.unix_socket)
+    LOG.info('Serving patterns on %s', command_opts.unix_socket
+                or '%s:%d' % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.shape - the commands for shapes defined by an engine Surface.
+
+A shape module, such as `crocad.cylinder`, defines its geometry, options
+and title, and builds its command from them with a `Shape`. These functions
+generate, snap and print the patterns of every shape.
+"""
+
+import functools
+import logging
+import optparse
+
+from crocad import localization, profiling
+from crocad.output import output_writer
+from crocad.util import snapper
+
+
+__all__ = ['Shape', 'generate', 'stitches', 'lazy_pattern', 'main']
+
+LOG = logging.getLogger('crocad.shape')
+
+
+def generate(surface, params):
+    """ Generator for the stitch-counts of a pattern for `surface`. """
+    for count in surface.rows(params):
+        yield count
+
+
+def stitches(surface, params, global_options, min_val=6):
+    """
+    Return the stitch-counts of the pattern for `surface` with `params`,
+    snapped as selected by the global options, and no smaller than
+    `min_val`.
+    """
+    counts = profiling.stage_iter('generate', generate(surface, params))
+    margin = 1 if global_options.accurate else 6
+    snap = snapper(global_options)
+    return profiling.stage_iter('snap', snap(counts, margin, min_val))
+
+
+def lazy_pattern(surface, params, global_options, min_val, title):
+    """ Return a LazyPattern for `surface`, whose rows are computed on
+    demand.
+    """
+    from crocad.pattern import LazyPattern
+    return LazyPattern(surface.row_count(params),
+                       functools.partial(surface.row, params),
+                       1 if global_options.accurate else 6, min_val, title)
+
+
+def main(name, option_parser, pattern, argv, global_options):
+    """
+    Command entry-point for the shape `name`, whose options are parsed by
+    ``option_parser()`` and whose pattern is ``pattern(command_opts,
+    global_options)``.
+    """
+    from crocad.store import print_stored
+    with profiling.stage('options'):
+        command_opts, __ = option_parser().parse_args(argv)
+    with output_writer(global_options) as out:
+        print_stored(name, pattern, command_opts, global_options, out)
+
+
+class Shape(object):
+    """
+    The command for the shape `name`, whose patterns are rows of `surface`.
+
+    `options(_)` returns the command's description and its options, made
+    by ``optparse.make_option`` with their help translated by `_`.
+    `params(command_opts)` returns the surface parameters for the parsed
+    options, and `title(command_opts)` the title of their pattern. Rows are
+    snapped no smaller than `min_val`.
+
+    A shape module exports the methods as its `option_parser`, `pattern`,
+    `lazy_pattern` and `main` functions.
+    """
+
+    def __init__(self, name, surface, options, params, title, min_val=6):
+        self.name = name
+        self.surface = surface
+        self.options = options
+        self.params = params
+        self.title = title
+        self.min_val = min_val
+
+    def option_parser(self):
+        """ Return the OptionParser for the command's options. """
+        _ = localization.get_translation()
+        description, options = self.options(_)
+        usage = ' '.join(['%prog [GLOBAL-OPTIONS]', self.name] + [
+            '[%s=%s]' % (option.get_opt_string(), option.metavar)
+            for option in options])
+        opt_parser = optparse.OptionParser(usage,
+                                           description=description.strip())
+        opt_parser.add_options(options)
+        return opt_parser
+
+    def pattern(self, command_opts, global_options):
+        """ Return the title and snapped stitch-counts for a pattern. """
+        return self.title(command_opts), stitches(
+            self.surface, self.params(command_opts), global_options,
+            self.min_val)
+
+    def lazy_pattern(self, command_opts, global_options):
+        """ Return a LazyPattern, whose rows are computed on demand. """
+        return lazy_pattern(self.surface, self.params(command_opts),
+                            global_options, self.min_val,
+                            self.title(command_opts))
+
+    def main(self, argv, global_options):
+        """ Command entry-point for the shape's pattern-generator. """
+        main(self.name, self.option_parser, self.pattern, argv,
+             global_options)
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.similar - find the generated patterns closest to a stitch profile.
+
+Each pattern's stitch-counts are resampled to a fixed-length profile, so
+that patterns with different numbers of rows can be compared, and the
+distance between two patterns is the root-mean-square difference of their
+profiles.
+
+A `ProfileIndex` holds the profiles of many patterns in one array, sorted by
+their mean stitch-count. The difference between the means of two profiles is
+never more than the distance between them, so a query only computes
+distances for the patterns whose mean is within the distance of the best
+matches found so far - usually a small slice of the index - in a few
+vectorized operations.
+"""
+
+import itertools
+import json
+import logging
+import optparse
+import os
+
+from crocad import ball, capsule, cone, cylinder, donut, egg, ellipsoid
+from crocad import engine, hemisphere, localization, partialtorus, sweep
+from crocad.engine import _numpy
+from crocad.output import output_writer
+
+
+__all__ = ['ProfileIndex', 'resample', 'resample_ragged', 'shape_profiles']
+
+NAMES = ['similar']
+LOG = logging.getLogger('crocad.similar')
+
+PROFILE_LENGTH = 32
+
+# The shapes which can be indexed: their module, the options passed to their
+# batch generator in `crocad.engine` and the generator, and their smallest
+# stitch-count:
+SHAPES = {
+    'ball': (ball, ['row_count'], engine.ball, 6),
+    'cone': (cone, ['row_count', 'max_circumference'], engine.cone, 6),
+    'donut': (donut, ['inner_radius', 'row_count'], engine.donut, 0),
+    'cylinder': (cylinder, ['circumference', 'row_count'],
+                 engine.CYLINDER.batch, 6),
+    'hemisphere': (hemisphere, ['row_count'], engine.HEMISPHERE.batch, 6),
+    'capsule': (capsule, ['circumference', 'row_count'],
+                engine.CAPSULE.batch, 6),
+    'ellipsoid': (ellipsoid, ['row_count', 'aspect'], engine.ELLIPSOID.batch,
+                  6),
+    'egg': (egg, ['row_count', 'aspect', 'point'], engine.EGG.batch, 6),
+    'partial-torus': (partialtorus,
+                      ['inner_radius', 'row_count', 'start', 'sweep'],
+                      engine.TORUS_ARC.batch, 0),
+}
+
+# The number of patterns generated at once while building an index:
+BUILD_CHUNK = 4096
+
+# The number of patterns nearest to a query's mean whose distances are
+# computed first, to bound the search:
+PROBE = 256
+
+
+def resample_ragged(values, offsets, length=PROFILE_LENGTH):
+    """
+    Return an array with a row for each pattern in the ragged array
+    (`values`, `offsets`) - see `crocad.engine.RaggedArray` - holding its
+    stitch-counts linearly interpolated at `length` evenly spaced points.
+    Every pattern must have at least one row.
+    """
+    np = _numpy()
+    values = np.asarray(values, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.intp)
+    last = (offsets[1:] - offsets[:-1] - 1)[:, np.newaxis]
+    position = np.linspace(0.0, 1.0, length)[np.newaxis, :] * last
+    lower = np.floor(position).astype(np.intp)
+    fraction = position - lower
+    upper = np.minimum(lower + 1, last)
+    start = offsets[:-1, np.newaxis]
+    return (values[start + lower] * (1 - fraction)
+            + values[start + upper] * fraction)
+
+
+def resample(stitches, length=PROFILE_LENGTH):
+    """ Return the profile of `length` points for a single pattern. """
+    np = _numpy()
+    values = np.fromiter((float(x) for x in stitches), dtype=np.float64)
+    if not len(values):
+        raise ValueError(localization.get_translation()(
+            'A pattern must have at least one row.'))
+    return resample_ragged(values, [0, len(values)], length)[0]
+
+
+def shape_profiles(shape, ranges, accurate=False, length=PROFILE_LENGTH):
+    """
+    Generate (entries, profiles, rows) for chunks of the patterns for
+    `shape` with every combination of the option values in `ranges` - a
+    list of (option destination, values) pairs, as for `crocad.sweep`.
+    Options not in `ranges` take their default values.
+
+    Each entry is a JSON string describing a pattern, `profiles` is an
+    array with a row for each pattern, and `rows` is each pattern's number
+    of rows. Patterns without any rows are skipped.
+    """
+    np = _numpy()
+    module, arguments, generator, min_val = SHAPES[shape]
+    defaults = vars(module.option_parser().get_default_values())
+    values = dict((name, [defaults[name]]) for name in arguments)
+    for name, option_values in ranges:
+        if name not in values:
+            raise ValueError(localization.get_translation()(
+                'Unknown option: {option}').format(option=name))
+        values[name] = list(option_values)
+    names = sorted(values)
+    grid = itertools.product(*[values[name] for name in names])
+    margin = 1 if accurate else 6
+    for chunk in sweep.chunks(grid, BUILD_CHUNK):
+        # Options may be floats, and are converted to each generator's types:
+        columns = dict(zip(names, np.array(chunk, dtype=np.float64).T))
+        counts = generator(*[columns[name] for name in arguments]).snap(
+            margin, min_val)
+        lengths = counts.lengths
+        keep = lengths > 0
+        offsets = np.concatenate([[0], np.cumsum(lengths[keep])])
+        kept_values = counts.values[np.repeat(keep, lengths)]
+        entries = [json.dumps({'shape': shape, 'accurate': accurate,
+                               'options': dict(zip(names, options))},
+                              sort_keys=True)
+                   for options, kept in zip(chunk, keep) if kept]
+        yield (entries, resample_ragged(kept_values, offsets, length),
+               lengths[keep])
+
+
+class ProfileIndex(object):
+    """
+    The profiles of many patterns, for nearest-pattern queries.
+
+    `entries` holds a JSON description of each pattern, `profiles` their
+    profiles and `rows` their numbers of rows.
+    """
+    def __init__(self, entries=(), profiles=None, rows=None,
+                 length=PROFILE_LENGTH):
+        np = _numpy()
+        self.length = length
+        # Entries are ASCII JSON, so are stored as bytes to save space:
+        entries = np.asarray(entries, dtype=bytes)
+        if profiles is None:
+            profiles = np.zeros((0, length))
+            rows = np.zeros(0, dtype=np.int64)
+        profiles = np.asarray(profiles, dtype=np.float64).reshape(-1, length)
+        means = profiles.mean(axis=1)
+        order = np.argsort(means, kind='stable')
+        self.entries = entries[order]
+        self.profiles = profiles[order]
+        self.rows = np.asarray(rows, dtype=np.int64)[order]
+        self.means = means[order]
+        self._norms = (self.profiles ** 2).sum(axis=1)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def extend(self, chunks):
+        """
+        Return a new ProfileIndex including the patterns in `chunks` of
+        (entries, profiles, rows), as generated by `shape_profiles`.
+        """
+        np = _numpy()
+        entries, profiles, rows = [self.entries], [self.profiles], [self.rows]
+        for chunk_entries, chunk_profiles, chunk_rows in chunks:
+            entries.append(np.asarray(chunk_entries, dtype=bytes))
+            profiles.append(chunk_profiles)
+            rows.append(chunk_rows)
+        return ProfileIndex(np.concatenate(entries),
+                            np.concatenate(profiles),
+                            np.concatenate(rows), self.length)
+
+    def _distances(self, start, stop, query):
+        """ Return the distances from `query` to patterns start:stop. """
+        np = _numpy()
+        squares = (self._norms[start:stop]
+                   - 2 * self.profiles[start:stop].dot(query)
+                   + query.dot(query))
+        return np.sqrt(np.maximum(squares, 0) / self.length)
+
+    def nearest(self, stitches, count=5, prune=True):
+        """
+        Return (distance, entry, rows) for the `count` patterns closest to
+        the stitch-counts `stitches`, closest first. If `prune` is false,
+        the distance to every pattern is computed.
+        """
+        np = _numpy()
+        query = resample(stitches, self.length)
+        total = len(self)
+        start, stop = 0, total
+        if prune and total > count:
+            middle = np.searchsorted(self.means, query.mean())
+            probe = max(PROBE, count)
+            start, stop = max(0, middle - probe), min(total, middle + probe)
+        distances = self._distances(start, stop, query)
+        if start > 0 or stop < total:
+            bound = np.partition(distances, count - 1)[count - 1] \
+                if len(distances) >= count else np.inf
+            # Allow for rounding in the distances:
+            bound = bound * (1 + 1e-9) + 1e-9
+            low = np.searchsorted(self.means, query.mean() - bound, 'left')
+            high = np.searchsorted(self.means, query.mean() + bound, 'right')
+            low, high = min(low, start), max(high, stop)
+            distances = np.concatenate([self._distances(low, start, query),
+                                        distances,
+                                        self._distances(stop, high, query)])
+            start = low
+        best = np.argsort(distances, kind='stable')[:count]
+        return [(float(distances[i]), json.loads(self.entries[start + i]),
+                 int(self.rows[start + i])) for i in best]
+
+    def save(self, path):
+        """ Write the index to the file `path`. """
+        np = _numpy()
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as stream:
+            np.savez(stream, entries=self.entries, profiles=self.profiles,
+                     rows=self.rows)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Read an index written by `save`. """
+        np = _numpy()
+        with np.load(path, allow_pickle=False) as data:
+            profiles = data['profiles']
+            return cls(data['entries'], profiles, data['rows'],
+                       profiles.shape[1])
+
+
+def main(argv, global_options):
+    """ Command entry-point for similarity searches. """
+    from crocad import UserError
+    from crocad.counts import open_lines, read_counts
+    _ = localization.get_translation()
+    opt_parser = optparse.OptionParser(
+        '%prog [GLOBAL-OPTIONS] similar build INDEX SHAPE'
+        ' --option=NAME=RANGE ...\n'
+        '       %prog [GLOBAL-OPTIONS] similar query INDEX [FILE] [--count=N]',
+        description=_("""
+Find the patterns closest to a stitch-count profile. 'build' adds the
+patterns for SHAPE with every combination of the option ranges (as for the
+sweep command) to INDEX, creating it if required. 'query' reads
+stitch-counts, one per line, from FILE (or stdin) and writes a JSON line
+for each of the closest patterns in INDEX, closest first.
+""").strip())
+    opt_parser.add_option('-o', '--option', action='append', default=[],
+        metavar='NAME=RANGE', help=_('the range of values for an option'))
+    opt_parser.add_option('-n', '--count', action='store', type='int',
+        default=5, metavar='N',
+        help=_('the number of patterns to find [%default]'))
+    command_opts, args = opt_parser.parse_args(argv)
+
+    if len(args) < 2 or args[0] not in ('build', 'query'):
+        opt_parser.error(_('Provide build or query, and an INDEX.'))
+    action, path = args[0], args[1]
+    if action == 'build':
+        if len(args) != 3 or args[2] not in SHAPES:
+            opt_parser.error(_('Provide one SHAPE, from: {shapes}').format(
+                shapes=', '.join(sorted(SHAPES))))
+        try:
+            ranges = sweep.option_ranges(command_opts.option)
+            index = ProfileIndex.load(path) if os.path.exists(path) \
+                else ProfileIndex()
+            index = index.extend(shape_profiles(
+                args[2], ranges, global_options.accurate, index.length))
+        except ValueError as error:
+            raise UserError(str(error))
+        index.save(path)
+        LOG.info('%d patterns in %s', len(index), path)
+        return
+
+    if len(args) > 3:
+        opt_parser.error(_('Provide at most one FILE.'))
+    index = ProfileIndex.load(path)
+    with open_lines(args[2] if len(args) == 3 else None) as lines:
+        try:
+            matches = index.nearest(read_counts(lines),
+                                    max(1, command_opts.count))
+        except ValueError as error:
+            raise UserError(str(error))
+    with output_writer(global_options) as out:
+        for distance, entry, rows in matches:
+            out.write_line(json.dumps(dict(entry, distance=distance,
+                                           rows=rows), sort_keys=True))
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.solve - find the shape options giving a pattern of a target size.
+
+A pattern is measured by its number of rows, its circumference (its largest
+stitch-count) and, for a donut, the circumference of its hole. Each
+measurement grows with one of the shape's options - such as a ball's
+circumference with its row-count - so a `Solver` finds each option by
+bracketing the target (doubling the option until the measurement passes the
+target) and then bisecting, measuring the same patterns that crochet-cad
+generates. Measurements are memoized, so a solution takes a few dozen
+patterns rather than a search of every combination of options.
+"""
+
+import logging
+import math
+import optparse
+
+from crocad import ball, capsule, cone, cylinder, donut, egg, ellipsoid
+from crocad import hemisphere, localization
+
+
+__all__ = ['Solver', 'solve', 'measure', 'parse_gauge']
+
+NAMES = ['solve']
+LOG = logging.getLogger('crocad.solve')
+
+MEASUREMENTS = ['rows', 'circumference', 'hole']
+
+# For each shape: its module, and for each measurement the options which
+# control it, in order of preference, with their smallest values:
+SHAPES = {
+    'ball': (ball, {
+        'rows': [('row_count', 1)],
+        'circumference': [('row_count', 1)],
+    }),
+    'cone': (cone, {
+        'rows': [('row_count', 2)],
+        'circumference': [('max_circumference', 6)],
+    }),
+    'donut': (donut, {
+        'rows': [('row_count', 1)],
+        'hole': [('inner_radius', 1)],
+        'circumference': [('row_count', 1), ('inner_radius', 1)],
+    }),
+    'cylinder': (cylinder, {
+        'rows': [('row_count', 0)],
+        'circumference': [('circumference', 1)],
+    }),
+    'hemisphere': (hemisphere, {
+        'rows': [('row_count', 1)],
+        'circumference': [('row_count', 1)],
+    }),
+    'capsule': (capsule, {
+        'rows': [('row_count', 0)],
+        'circumference': [('circumference', 1)],
+    }),
+    'ellipsoid': (ellipsoid, {
+        'rows': [('row_count', 1)],
+        'circumference': [('row_count', 1)],
+    }),
+    'egg': (egg, {
+        'rows': [('row_count', 1)],
+        'circumference': [('row_count', 1)],
+    }),
+}
+
+# The largest value considered for any option:
+MAX_VALUE = 100000
+
+# The most passes over the options, when several are solved for at once:
+MAX_PASSES = 8
+
+
+def measure(stitches):
+    """ Return a dict of the measurements of the stitch-counts `stitches`.
+    """
+    stitches = list(stitches)
+    return {
+        'rows': len(stitches),
+        'circumference': max(stitches) if stitches else 0,
+        'hole': stitches[0] if stitches else 0,
+    }
+
+
+def parse_gauge(text):
+    """
+    Return the (stitches, rows) per 10cm for a gauge such as '16,18'.
+
+    Raises ValueError if `text` is not a valid gauge.
+    """
+    stitches, __, rows = text.partition(',')
+    stitches, rows = float(stitches), float(rows or stitches)
+    if stitches <= 0 or rows <= 0:
+        raise ValueError(localization.get_translation()(
+            'A gauge must be positive.'))
+    return stitches, rows
+
+
+class Solver(object):
+    """
+    Finds options for `shape` whose pattern has target measurements.
+    Patterns are generated with the given global options.
+    """
+    def __init__(self, shape, global_options):
+        self.shape = shape
+        self.module, self.controls = SHAPES[shape]
+        self.global_options = global_options
+        self.defaults = vars(self.module.option_parser().get_default_values())
+        self.evaluations = 0
+        self._measurements = {}
+
+    def measure(self, options):
+        """ Return the measurements of the pattern for the `options` dict.
+        """
+        key = tuple(sorted(options.items()))
+        result = self._measurements.get(key)
+        if result is None:
+            self.evaluations += 1
+            command_opts = optparse.Values(dict(self.defaults, **options))
+            __, stitches = self.module.pattern(command_opts,
+                                               self.global_options)
+            result = self._measurements[key] = measure(stitches)
+        return result
+
+    def _value(self, options, name, value, measurement):
+        """ Measure the pattern with option `name` set to `value`. """
+        return self.measure(dict(options, **{name: value}))[measurement]
+
+    def solve_option(self, options, name, lowest, measurement, target):
+        """
+        Return the value (from `lowest`) of the option `name` for which the
+        pattern's `measurement` is closest to `target`, with the other
+        options as in `options`. The measurement must not decrease as the
+        option increases.
+        """
+        # Bracket the target by doubling...
+        low, high = lowest, max(lowest, 1)
+        while (high < MAX_VALUE
+               and self._value(options, name, high, measurement) < target):
+            low, high = high + 1, min(high * 2, MAX_VALUE)
+        # ...then bisect, for the smallest value reaching the target:
+        while low < high:
+            middle = (low + high) // 2
+            if self._value(options, name, middle, measurement) < target:
+                low = middle + 1
+            else:
+                high = middle
+        candidates = [low - 1, low] if low > lowest else [low]
+        return min(candidates, key=lambda value: abs(
+            self._value(options, name, value, measurement) - target))
+
+    def assignments(self, targets, fixed):
+        """
+        Return a list of (option, lowest value, measurement) for the
+        measurements in `targets`, giving each its own option which isn't
+        `fixed`.
+
+        Raises ValueError if a measurement can't be controlled.
+        """
+        _ = localization.get_translation()
+        for name in fixed:
+            if name not in self.defaults:
+                raise ValueError(_('Unknown option: {option}').format(
+                    option=name))
+        used = set(fixed)
+        result = []
+        # Measurements with fewer choices of option are assigned first:
+        for measurement in sorted(targets, key=lambda measurement: len(
+                self.controls.get(measurement, []))):
+            for name, lowest in self.controls.get(measurement, []):
+                if name not in used:
+                    used.add(name)
+                    result.append((name, lowest, measurement))
+                    break
+            else:
+                raise ValueError(_(
+                    "A {shape}'s {measurement} can't be chosen with these"
+                    " options.").format(shape=self.shape,
+                                        measurement=measurement))
+        return result
+
+    def solve(self, targets, fixed=None):
+        """
+        Return the options dict whose pattern is closest to the `targets`,
+        a dict of measurements. Options in the `fixed` dict aren't changed,
+        and the others start from their defaults.
+        """
+        fixed = dict(fixed or {})
+        assignments = self.assignments(targets, fixed)
+        options = dict((name, self.defaults[name]) for name, __, __ in
+                       assignments)
+        options.update(fixed)
+        for __ in range(MAX_PASSES):
+            previous = dict(options)
+            for name, lowest, measurement in assignments:
+                options[name] = self.solve_option(
+                    options, name, lowest, measurement, targets[measurement])
+            if options == previous:
+                break
+        return options
+
+
+def solve(shape, targets, global_options, fixed=None):
+    """
+    Return (options, measurements, evaluations) for the pattern for `shape`
+    closest to `targets` - see `Solver.solve`.
+    """
+    solver = Solver(shape, global_options)
+    options = solver.solve(targets, fixed)
+    return options, solver.measure(options), solver.evaluations
+
+
+def main(argv, global_options):
+    """ Command entry-point for solving for shape options. """
+    from crocad import UserError
+    from crocad.output import output_writer
+    from crocad.store import print_stored
+    _ = localization.get_translation()
+    opt_parser = optparse.OptionParser(
+        '%prog [GLOBAL-OPTIONS] solve SHAPE [--rows=ROWS]'
+        ' [--circumference=STITCHES] [--hole=STITCHES] [--height=CM]'
+        ' [--diameter=CM] [--hole-diameter=CM] [--gauge=STITCHES,ROWS]'
+        ' [--fix=OPTION=VALUE] [--pattern]',
+        description=_("""
+Find the options for SHAPE (such as ball, cone or donut) whose pattern has
+the given number of rows, circumference (its largest row) or, for a donut,
+hole circumference. Sizes in centimetres are converted with the --gauge, the
+number of stitches and rows in 10cm.
+""").strip())
+    for name, metavar, help_text in [
+            ('rows', 'ROWS', _('the number of rows')),
+            ('circumference', 'STITCHES',
+             _('the number of stitches in the largest row')),
+            ('hole', 'STITCHES',
+             _("the number of stitches around a donut's hole")),
+            ('height', 'CM', _('the height, along the rows')),
+            ('diameter', 'CM', _('the largest diameter')),
+            ('hole-diameter', 'CM', _("the diameter of a donut's hole"))]:
+        opt_parser.add_option('--' + name, action='store', type='float',
+                              metavar=metavar, help=help_text)
+    opt_parser.add_option('--gauge', action='store', metavar='STITCHES,ROWS',
+        help=_('the stitches and rows in 10cm, for sizes in centimetres'))
+    opt_parser.add_option('--fix', action='append', default=[],
+        metavar='OPTION=VALUE', help=_('keep an option at a fixed value'))
+    opt_parser.add_option('-p', '--pattern', action='store_true',
+        default=False, help=_('print the pattern for the options found'))
+    command_opts, args = opt_parser.parse_args(argv)
+
+    if len(args) != 1 or args[0] not in SHAPES:
+        opt_parser.error(_('Provide one SHAPE, from: {shapes}').format(
+            shapes=', '.join(sorted(SHAPES))))
+    shape = args[0]
+
+    targets = {}
+    for measurement in MEASUREMENTS:
+        if getattr(command_opts, measurement) is not None:
+            targets[measurement] = getattr(command_opts, measurement)
+    sizes = [command_opts.height, command_opts.diameter,
+             command_opts.hole_diameter]
+    if sizes != [None, None, None]:
+        try:
+            stitch_gauge, row_gauge = parse_gauge(command_opts.gauge or '')
+        except ValueError:
+            opt_parser.error(_('Sizes in centimetres need a --gauge, such'
+                               ' as --gauge=16,18.'))
+        if command_opts.height is not None:
+            targets['rows'] = command_opts.height * row_gauge / 10.0
+        if command_opts.diameter is not None:
+            targets['circumference'] = \
+                math.pi * command_opts.diameter * stitch_gauge / 10.0
+        if command_opts.hole_diameter is not None:
+            targets['hole'] = \
+                math.pi * command_opts.hole_diameter * stitch_gauge / 10.0
+    if not targets:
+        opt_parser.error(_('Provide at least one target size.'))
+
+    fixed = {}
+    try:
+        for text in command_opts.fix:
+            name, __, value = text.partition('=')
+            value = float(value)
+            fixed[name.strip().lstrip('-').replace('-', '_')] = \
+                int(value) if value.is_integer() else value
+    except ValueError:
+        opt_parser.error(_('Provide fixed options as OPTION=VALUE.'))
+
+    try:
+        options, measurements, evaluations = solve(shape, targets,
+                                                   global_options, fixed)
+    except ValueError as error:
+        raise UserError(str(error))
+    LOG.info('Solved in %d evaluations', evaluations)
+
+    with output_writer(global_options) as out:
+        out.write_line('%s %s' % (shape, ' '.join(
+            '--%s=%s' % (name.replace('_', '-'), value)
+            for name, value in sorted(options.items()))))
+        for measurement in MEASUREMENTS:
+            if measurement in targets:
+                out.write_line(_('{measurement}: {value} (target {target:g})'
+                                 ).format(measurement=measurement,
+                                          value=measurements[measurement],
+                                          target=targets[measurement]))
+        if command_opts.pattern:
+            out.write_line('')
+            module = SHAPES[shape][0]
+            command_opts = module.option_parser().get_default_values()
+            for name, value in options.items():
+                setattr(command_opts, name, value)
+            print_stored(module.NAMES[0], module.pattern, command_opts,
+                         global_options, out)
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.store - a persistent, size-bounded store of rendered patterns.
+
+A `PatternStore` keeps rendered patterns in a directory, keyed by a
+fingerprint of everything which affects the output: the shape, its options,
+the global options and the language. Output is content-addressed - each
+distinct output is written once, to a file named by its SHA-256 digest - and
+an SQLite index maps fingerprints to digests, recording when each was last
+used. When the files exceed the store's size, the least recently used
+patterns are evicted.
+
+Any number of processes may share a store. Files are written under a
+temporary name and renamed into place, so they're never seen half-written,
+and the index is only changed in SQLite transactions.
+
+The store is only used when it's selected with the ``--store`` global option
+(or the CROCHET_CAD_STORE environment variable), and SQLite is only imported
+then, so other invocations don't pay for it at start-up.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from crocad import localization, profiling
+from crocad.output import writer
+from crocad.render import group_option, output_format, print_pattern
+
+
+__all__ = ['PatternStore', 'fingerprint', 'pattern_key', 'open_store',
+           'stored_text', 'print_stored']
+
+LOG = logging.getLogger('crocad.store')
+
+# Change this whenever the rendered output of a pattern changes, so that
+# outputs stored by older versions aren't used:
+FORMAT_VERSION = 2
+
+DEFAULT_SIZE_MB = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patterns (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS patterns_used ON patterns (used);
+CREATE INDEX IF NOT EXISTS patterns_digest ON patterns (digest);
+"""
+
+sqlite3 = None
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def _sqlite3():
+    """ Import sqlite3 on first use. """
+    global sqlite3
+    if sqlite3 is None:
+        import sqlite3 as module
+        sqlite3 = module
+    return sqlite3
+
+
+def fingerprint(values):
+    """ Return the SHA-256 hex digest of the canonical JSON for `values`. """
+    import hashlib
+    import json
+    canonical = json.dumps(values, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def pattern_key(shape, command_opts, global_options, selection=(None, None)):
+    """
+    Return the fingerprint of the output for a pattern: the `shape` (the
+    first of its module's NAMES), its options, the global options which
+    affect the output, the current language and the rows selected.
+    """
+    return fingerprint({
+        'version': FORMAT_VERSION,
+        'shape': shape,
+        'options': vars(command_opts),
+        'accurate': bool(global_options.accurate),
+        'format': output_format(global_options),
+        'rounding': getattr(global_options, 'rounding', None) or 'nearest',
+        'group_rows': group_option(global_options),
+        'language': localization.get_translation().language(),
+        'rows': list(selection),
+    })
+
+
+class PatternStore(object):
+    """
+    Rendered patterns stored under the directory `path`, using no more than
+    `max_size` bytes. A PatternStore may be shared between threads.
+    """
+    def __init__(self, path, max_size=DEFAULT_SIZE_MB * 1024 * 1024,
+                 clock=time.time):
+        self.path = path
+        self.max_size = max_size
+        self.clock = clock
+        self._objects = os.path.join(path, 'objects')
+        os.makedirs(self._objects, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = _sqlite3().connect(os.path.join(path, 'index.sqlite'),
+                                      timeout=60, isolation_level=None,
+                                      check_same_thread=False)
+        try:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+        except BaseException:
+            self._db.close()
+            raise
+
+    def _object_path(self, digest):
+        """ Return the path of the file for `digest`. """
+        return os.path.join(self._objects, digest[:2], digest[2:])
+
+    def get(self, key):
+        """ Return the text stored for `key`, or None. """
+        with self._lock:
+            row = self._db.execute('SELECT digest FROM patterns WHERE'
+                                   ' key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            try:
+                with open(self._object_path(row[0]), 'rb') as stream:
+                    data = stream.read()
+            except FileNotFoundError:
+                # The file was evicted by another process:
+                self._db.execute('DELETE FROM patterns WHERE key = ?', (key,))
+                self._db.execute('DELETE FROM objects WHERE digest = ? AND'
+                                 ' NOT EXISTS (SELECT 1 FROM patterns WHERE'
+                                 ' digest = ?)', (row[0], row[0]))
+                return None
+            self._db.execute('UPDATE patterns SET used = ? WHERE key = ?',
+                             (self.clock(), key))
+        return data.decode('utf-8')
+
+    def put(self, key, text):
+        """
+        Store `text` for `key`, evicting the least recently used patterns
+        if the store is full. Returns False if `text` is too large to store.
+        """
+        import hashlib
+        import tempfile
+        data = text.encode('utf-8')
+        if len(data) > self.max_size:
+            return False
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(handle, 'wb') as stream:
+                    stream.write(data)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.execute('INSERT OR IGNORE INTO objects (digest, size)'
+                                 ' VALUES (?, ?)', (digest, len(data)))
+                self._db.execute('INSERT OR REPLACE INTO patterns (key,'
+                                 ' digest, used) VALUES (?, ?, ?)',
+                                 (key, digest, self.clock()))
+                evicted = self._evict()
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+        for digest in evicted:
+            try:
+                os.unlink(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+        return True
+
+    def _evict(self):
+        """
+        Remove the least recently used patterns from the index until the
+        objects fit in the store, returning the digests of the objects which
+        are no longer used. Must be called in a transaction.
+        """
+        total = self._size()
+        evicted = []
+        if total <= self.max_size:
+            return evicted
+        oldest = self._db.execute('SELECT key, digest FROM patterns'
+                                  ' ORDER BY used').fetchall()
+        for key, digest in oldest:
+            if total <= self.max_size:
+                break
+            self._db.execute('DELETE FROM patterns WHERE key = ?', (key,))
+            if self._db.execute('SELECT 1 FROM patterns WHERE digest = ?',
+                                (digest,)).fetchone() is None:
+                total -= self._db.execute('SELECT size FROM objects WHERE'
+                                          ' digest = ?', (digest,)
+                                          ).fetchone()[0]
+                self._db.execute('DELETE FROM objects WHERE digest = ?',
+                                 (digest,))
+                evicted.append(digest)
+        return evicted
+
+    def size(self):
+        """ Return the number of bytes used by the stored outputs. """
+        with self._lock:
+            return self._size()
+
+    def _size(self):
+        """ Return the size of the stored outputs, with the lock held. """
+        row = self._db.execute('SELECT SUM(size) FROM objects').fetchone()
+        return row[0] or 0
+
+    def __len__(self):
+        with self._lock:
+            row = self._db.execute('SELECT COUNT(*) FROM patterns'
+                                   ).fetchone()
+        return row[0]
+
+    def close(self):
+        """ Close the store's index. """
+        self._db.close()
+
+
+def open_store(path, max_size_mb=DEFAULT_SIZE_MB):
+    """
+    Return the PatternStore for the directory `path`, which is shared by
+    every caller in the process, or None if `path` is None.
+
+    If the store can't be opened, a warning is logged (once per process)
+    and None is returned, so that patterns are rendered without it.
+    """
+    if not path:
+        return None
+    key = (os.path.abspath(path), max_size_mb)
+    with _STORES_LOCK:
+        if key not in _STORES:
+            try:
+                _STORES[key] = PatternStore(path, max_size_mb * 1024 * 1024)
+            except (IOError, OSError, _sqlite3().Error) as error:
+                LOG.warning('Cannot open the pattern store %s: %s', path,
+                            error)
+                _STORES[key] = None
+        return _STORES[key]
+
+
+def stored_text(store, key, render):
+    """
+    Return the text stored for `key` in `store`, or call `render` to produce
+    it and store the result. Problems with the store are logged, and the
+    text is rendered.
+    """
+    try:
+        text = store.get(key)
+    except (IOError, OSError, _sqlite3().Error) as error:
+        LOG.warning('Cannot read from the pattern store: %s', error)
+        return render()
+    if text is not None:
+        profiling.count('store.hits')
+        return text
+    profiling.count('store.misses')
+    text = render()
+    try:
+        store.put(key, text)
+    except (IOError, OSError, _sqlite3().Error) as error:
+        LOG.warning('Cannot write to the pattern store: %s', error)
+    return text
+
+
+def print_stored(shape, pattern, command_opts, global_options, out):
+    """
+    Print the pattern for `shape` to the `crocad.output.Writer` `out`, from
+    the store selected by the global options if it's there. Otherwise the
+    pattern is generated with ``pattern(command_opts, global_options)``,
+    printed, and stored.
+    """
+    fmt = output_format(global_options)
+    group = group_option(global_options)
+    store = open_store(getattr(global_options, 'store', None),
+                       getattr(global_options, 'store_size', None)
+                       or DEFAULT_SIZE_MB)
+    if store is None:
+        title, stitches = pattern(command_opts, global_options)
+        print_pattern(title, stitches, fmt, out, group)
+        return
+
+    def render():
+        import io
+        buffer = io.StringIO()
+        title, stitches = pattern(command_opts, global_options)
+        print_pattern(title, stitches, fmt, writer(buffer), group)
+        return buffer.getvalue()
+
+    with profiling.stage('store'):
+        text = stored_text(store, pattern_key(shape, command_opts,
+                                              global_options), render)
+    out.write(text)
+    out.flush()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.sweep - generate patterns for every combination of a range of
+options.
+
+A sweep is the grid of `crocad.batch` jobs for one shape, with each option
+taking every value in its range. The jobs are run in chunks on a pool of
+worker processes, and results are produced in the order of the grid, so the
+output of a sweep doesn't depend on the number of workers.
+"""
+
+import collections
+import concurrent.futures
+import functools
+import itertools
+import json
+import logging
+import optparse
+import os
+
+from crocad import batch, localization
+from crocad.output import output_writer
+
+
+__all__ = ['parse_range', 'option_ranges', 'sweep_jobs', 'run_chunk',
+           'run_sweep']
+
+NAMES = ['sweep']
+LOG = logging.getLogger('crocad.sweep')
+
+
+def parse_range(text):
+    """
+    Return the list of integers described by `text`, which is either
+    'START..STOP' or 'START..STOP:STEP' (both inclusive of STOP), or a
+    comma-separated list of integers.
+
+    Raises ValueError if `text` is not a valid range.
+    """
+    _ = localization.get_translation()
+    text = text.strip()
+    if '..' in text:
+        start, __, stop = text.partition('..')
+        stop, __, step = stop.partition(':')
+        start, stop, step = int(start), int(stop), int(step or 1)
+        if step < 1:
+            raise ValueError(_('The step of a range must be positive.'))
+        return list(range(start, stop + 1, step))
+    return [int(value) for value in text.split(',')]
+
+
+def option_ranges(options):
+    """
+    Return a list of (option destination, values) pairs for a list of
+    'NAME=RANGE' strings, such as 'row-count=4..400'.
+
+    Raises ValueError if a range is invalid.
+    """
+    _ = localization.get_translation()
+    ranges = []
+    for option in options:
+        name, __, text = option.partition('=')
+        try:
+            values = parse_range(text)
+        except ValueError:
+            raise ValueError(_('Invalid range for {name}: {range}').format(
+                name=name, range=text))
+        ranges.append((name.strip().lstrip('-').replace('-', '_'), values))
+    return ranges
+
+
+def sweep_jobs(shape, ranges, **job):
+    """
+    Generate a `crocad.batch` job for `shape` for every combination of the
+    values in `ranges`, which is a list of (option destination, values)
+    pairs. The last option varies fastest. Jobs are numbered from 0 in their
+    "id", and any extra keyword arguments are added to every job.
+    """
+    names = [name for name, __ in ranges]
+    grid = itertools.product(*[values for __, values in ranges])
+    for index, values in enumerate(grid):
+        yield dict(job, id=index, shape=shape,
+                   options=dict(zip(names, values)))
+
+
+def run_chunk(jobs, defaults):
+    """ Run a list of jobs in a worker, returning their results, which
+    include each job's options.
+    """
+    return [dict(batch.run_job(job, defaults), options=job['options'])
+            for job in jobs]
+
+
+def chunks(iterable, size):
+    """ Generate lists of up to `size` items from `iterable`. """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_sweep(jobs, defaults, workers=None, chunk_size=16):
+    """
+    Run `jobs` in chunks of `chunk_size` on `workers` processes (by default
+    one per CPU), and generate their results in the same order as `jobs`.
+
+    With a single worker, jobs are run in the current process.
+    """
+    workers = workers or os.cpu_count() or 1
+    run = functools.partial(run_chunk, defaults=defaults)
+    if workers == 1:
+        for chunk in chunks(jobs, chunk_size):
+            for result in run(chunk):
+                yield result
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        # Only a few chunks per worker are submitted ahead of those being
+        # written, so memory use doesn't grow with the size of the grid:
+        pending = collections.deque()
+        for chunk in chunks(jobs, chunk_size):
+            pending.append(executor.submit(run, chunk))
+            if len(pending) >= workers * 4:
+                for result in pending.popleft().result():
+                    yield result
+        while pending:
+            for result in pending.popleft().result():
+                yield result
+
+
+def main(argv, global_options):
+    """ Command entry-point for parameter sweeps. """
+    _ = localization.get_translation()
+    opt_parser = optparse.OptionParser(
+        '%prog [GLOBAL-OPTIONS] sweep SHAPE --option=NAME=RANGE ...'
+        ' [--workers=N] [--chunk-size=N]',
+        description=_("""
+Generate patterns for SHAPE with every combination of the given option
+values. Each RANGE is 'START..STOP', 'START..STOP:STEP' or a comma-separated
+list, such as '--option=row_count=4..400'. One JSON result is written to
+stdout for each pattern, in order, as with the batch command.
+""").strip())
+    opt_parser.add_option('-o', '--option', action='append', default=[],
+        metavar='NAME=RANGE', help=_('the range of values for an option'))
+    opt_parser.add_option('-w', '--workers', action='store', type='int',
+        metavar='N', help=_('the number of worker processes'
+                            ' [the number of CPUs]'))
+    opt_parser.add_option('--chunk-size', action='store', type='int',
+        default=16, metavar='N',
+        help=_('the number of patterns given to a worker at once [%default]'))
+    command_opts, args = opt_parser.parse_args(argv)
+
+    if len(args) != 1 or args[0] not in batch.SHAPES:
+        opt_parser.error(_('Provide one SHAPE, from: {shapes}').format(
+            shapes=', '.join(sorted(batch.SHAPES))))
+    try:
+        ranges = option_ranges(command_opts.option)
+    except ValueError as error:
+        opt_parser.error(str(error))
+
+    jobs = sweep_jobs(args[0], ranges)
+    results = run_sweep(jobs, batch.job_defaults(global_options),
+                        command_opts.workers, max(1, command_opts.chunk_size))
+    with output_writer(global_options) as out:
+        for result in results:
+            out.write_line(json.dumps(result, sort_keys=True))
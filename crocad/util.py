@@ -24,16 +24,64 @@ crocad.util - Shared functionality for crochet pattern generation.
 
 
 
+import collections
+import itertools
 import logging
-from crocad import localization
+import math
+import sys
+
+from crocad import localization, output, profiling
+from crocad.cache import LRUCache
 
 __all__ = ['instruction_txt', 'round_to_nearest',
-           'round_to_nearest_iter', 'print_instructions_txt']
+           'round_to_nearest_iter', 'round_optimal', 'snapper',
+           'print_instructions_txt',
+           'row_instructions', 'instructions_txt', 'pattern_rows', 'Row',
+           'RowGroup', 'group_rows', 'group_txt',
+           'set_instruction_caches', 'instruction_cache_stats']
 
 _ = localization.get_translation()
 
 LOG = logging.getLogger('crocad.util')
 
+# Caches for instruction plans, keyed by (prev, count), and for their
+# rendered text, keyed by (language, prev, count, expand):
+_PLAN_CACHE = LRUCache(4096)
+_TEXT_CACHE = LRUCache(4096)
+
+# Runs of more than this many identical instructions are written in
+# compressed form, such as ', 2sc in next 12 times', unless expanded text is
+# requested:
+COMPRESS_AFTER = 4
+
+# The longest cycle of rows that `group_rows` looks for:
+MAX_PERIOD = 4
+
+
+def set_instruction_caches(plan_cache=None, text_cache=None):
+    """
+    Replace the caches used by `instruction_plan` and `instruction`.
+
+    Any object with `get`, `put`, `clear` and `stats` methods may be
+    provided - see `crocad.cache`. Caches which are not provided are left
+    unchanged. Returns the previous (plan_cache, text_cache) pair.
+    """
+    global _PLAN_CACHE, _TEXT_CACHE
+    previous = (_PLAN_CACHE, _TEXT_CACHE)
+    if plan_cache is not None:
+        _PLAN_CACHE = plan_cache
+    if text_cache is not None:
+        _TEXT_CACHE = text_cache
+    return previous
+
+
+def instruction_cache_stats():
+    """
+    Return a dict containing the `crocad.cache.CacheStats` for the 'plan'
+    and 'text' instruction caches.
+    """
+    return {'plan': _PLAN_CACHE.stats(), 'text': _TEXT_CACHE.stats()}
+
 
 def gcd_backport(num1, num2):    # NOQA
     """Returns the greatest common divisor of two numbers."""
@@ -43,13 +91,18 @@ def gcd_backport(num1, num2):    # NOQA
 
 
 try:
-    from fractions import gcd
+    from math import gcd
 except ImportError:
-    gcd = gcd_backport
+    try:
+        from fractions import gcd
+    except ImportError:
+        gcd = gcd_backport
 
 
 class Instruction(object):
     """ A bunch of 'stitch' in 'stitch' instructions. """
+    __slots__ = ('stitch', 'stitch_count')
+
     def __init__(self, stitch='sc', stitch_count=1):
         self.stitch = stitch
         self.stitch_count = stitch_count
@@ -94,9 +147,16 @@ class Instruction(object):
         """Plain-text representation of this instruction."""
         return _('%s in next %d') % (self.stitch, self.stitch_count)
 
+    def as_dict(self):
+        """ A JSON-compatible representation of this instruction. """
+        return {'instruction': 'stitch', 'stitch': self.stitch,
+                'count': self.stitch_count}
+
 
 class StitchTogetherInstruction(Instruction):
     """ A bunch of stXtog instructions. """
+    __slots__ = ('together_count',)
+
     def __init__(self, stitch='sc', stitch_count=1, together_count=2):
         super(StitchTogetherInstruction, self).__init__(stitch=stitch,
                 stitch_count=stitch_count)
@@ -137,9 +197,17 @@ class StitchTogetherInstruction(Instruction):
             and self.together_count == other.together_count
         )
 
+    def as_dict(self):
+        """ A JSON-compatible representation of this instruction. """
+        result = super(StitchTogetherInstruction, self).as_dict()
+        result.update(instruction='together', together=self.together_count)
+        return result
+
 
 class MultipleStitchesInstruction(Instruction):
     """ A bunch of 'X st' in st commands. """
+    __slots__ = ('multiple_count',)
+
     def __init__(self, stitch=_('sc'), stitch_count=1, multiple_count=2):
         super(MultipleStitchesInstruction, self).__init__(stitch=stitch,
                 stitch_count=stitch_count)
@@ -180,11 +248,19 @@ class MultipleStitchesInstruction(Instruction):
             and self.multiple_count == other.multiple_count
         )
 
+    def as_dict(self):
+        """ A JSON-compatible representation of this instruction. """
+        result = super(MultipleStitchesInstruction, self).as_dict()
+        result.update(instruction='multiple', multiple=self.multiple_count)
+        return result
+
 
 class InstructionGroup(Instruction):
     """
     Encapsulates a sequence of instructions which may or may not be repeated.
     """
+    __slots__ = ('_instructions', 'repeats')
+
     def __init__(self, instructions=None, repeats=1):
         self.stitch = None
         self._instructions = instructions or []
@@ -205,16 +281,35 @@ class InstructionGroup(Instruction):
         else:
             self._instructions.append(inst)
 
+    def __iter__(self):
+        return iter(self._instructions)
+
+    def __len__(self):
+        return len(self._instructions)
+
     @property
     def stitches(self):
-        return sum(x.stitches() for x in self._instructions) * self.repeats
+        """ The number of stitches produced by this InstructionGroup. """
+        return sum(x.stitches for x in self._instructions) * self.repeats
 
     @property
     def stitches_into(self):
         """ The number of stitches in the previous row required to crochet
         this InstructionGroup.
         """
-        return sum(x.stitchesInto() for x in self._instructions) * self.repeats
+        return sum(x.stitches_into for x in self._instructions) * self.repeats
+
+    def __eq__(self, other):
+        return (
+            self.__class__ == other.__class__
+            and self.repeats == other.repeats
+            and self._instructions == other._instructions
+        )
+
+    def as_dict(self):
+        """ A JSON-compatible representation of this instruction. """
+        return {'instruction': 'group', 'repeats': self.repeats,
+                'instructions': [x.as_dict() for x in self._instructions]}
 
     def __str__(self):
         if self.repeats == 1 or len(self._instructions) == 0:
@@ -232,72 +327,377 @@ def _first_instruction(count):
         return _('ch %d, sc in each chain') % count
 
 
-def instruction(prev, count):
+def instruction_plan(prev, count):
     """
-    Returns the instructions for a circular row with `count` stitches,
-    crocheted on to a row of `prev` stitches.
+    Calculate how to crochet a circular row with `count` stitches on to a row
+    of `prev` stitches, without producing any text. Returns one of:
+
+    ('first', count) - the first row of a pattern.
+    ('same',) - a row with the same number of stitches as the previous row.
+    ('change', diff, repeats, stcount, sc_rem, row_rem) - a row with `diff`
+        increases (or decreases, if negative) in each of `repeats` repeats,
+        separated by `stcount` sc, with `sc_rem` extra sc at the end of each
+        repeat and `row_rem` sc at the end of the row.
+    ('spread', repeats, prev_part, count_part) - a row which more than
+        doubles (or halves) the stitch-count, by crocheting `count_part`
+        stitches into `prev_part` stitches in each of `repeats` repeats.
     """
     prev = int(prev) if prev else None
-    count = int(count) if count else None
-    result = ''
+    count = int(count) if count is not None else None
+    key = (prev, count)
+    plan = _PLAN_CACHE.get(key)
+    if plan is None:
+        profiling.count('instruction_plan.misses')
+        plan = _instruction_plan(prev, count)
+        _PLAN_CACHE.put(key, plan)
+    return plan
+
+
+def _instruction_plan(prev, count):
+    """ Calculates the (uncached) plan for `instruction_plan`. """
     if prev is None:
-        return _first_instruction(count)
+        return ('first', count)
+    diff = count - prev
+    if diff == 0:
+        return ('same',)
+    repeats = gcd(count, prev)
+    if count > 2 * prev or prev > 2 * count:
+        return ('spread', repeats, prev // repeats, count // repeats)
+    row_rem = 0
+    if repeats == 1:
+        repeats = abs(diff)
+    prev = prev // repeats
+    count, row_rem = divmod(count, repeats)
+    diff = count - prev
+    scs = min(prev, count) - abs(diff)
+    stcount, sc_rem = divmod(scs, abs(diff))
+    return ('change', diff, repeats, stcount, sc_rem, row_rem)
+
+
+def row_instructions(prev, count):
+    """
+    Returns an InstructionGroup describing how to crochet a circular row
+    with `count` stitches on to a row of `prev` stitches.
+
+    The first row of a pattern is a single 'ch' Instruction, and a row with
+    no increases or decreases is a single 'sc' Instruction. Otherwise the
+    result contains the (possibly repeated) increases or decreases, followed
+    by any sc left over at the end of the row.
+    """
+    plan = instruction_plan(prev, count)
+    result = InstructionGroup()
+    if plan[0] == 'first':
+        result.append(Instruction('ch', plan[1]))
+    elif plan[0] == 'same':
+        result.append(Instruction(stitch_count=int(count)))
+    elif plan[0] == 'spread':
+        __, repeats, prev_part, count_part = plan
+        rep = _repeat_group(result, repeats)
+        # Each stitch is worked into (or worked together from) `per_stitch`
+        # stitches, or one more for the first `extra` stitches:
+        if count_part > prev_part:
+            per_stitch, extra = divmod(count_part, prev_part)
+            runs = [(extra, per_stitch + 1), (prev_part - extra, per_stitch)]
+            step = MultipleStitchesInstruction
+        else:
+            per_stitch, extra = divmod(prev_part, count_part)
+            runs = [(extra, per_stitch + 1), (count_part - extra, per_stitch)]
+            step = StitchTogetherInstruction
+        for stitch_count, per_stitch in runs:
+            if stitch_count:
+                rep.append(step('sc', stitch_count, per_stitch))
     else:
-        diff = count - prev
-        if diff == 0:
-            result += _('sc in each sc')
+        __, diff, repeats, stcount, sc_rem, row_rem = plan
+        rep = _repeat_group(result, repeats)
+        step = MultipleStitchesInstruction if diff > 0 \
+            else StitchTogetherInstruction
+        steps = int(abs(diff))
+        # Every increase (or decrease) but the last is followed by `stcount`
+        # sc, so they are built as a single repeated group, rather than one
+        # instruction at a time:
+        if stcount and steps > 1:
+            rep.append(InstructionGroup(
+                [step('sc'), Instruction(stitch_count=stcount)],
+                repeats=steps - 1))
+            rep.append(step('sc'))
+        else:
+            rep.append(step('sc', steps))
+        if stcount + sc_rem:
+            rep.append(Instruction(stitch_count=stcount + sc_rem))
+        if row_rem:
+            result.append(Instruction(stitch_count=row_rem))
+    return result
+
+
+def _repeat_group(result, repeats):
+    """ Return the group to build each of `repeats` repeats of a row in,
+    which is `result` itself if there is only one.
+    """
+    if repeats > 1:
+        rep = InstructionGroup(repeats=repeats)
+        result.append(rep)
+        return rep
+    return result
+
+
+def instructions_txt(instructions, expand=False):
+    """
+    Produce the plain-text instructions for an InstructionGroup returned by
+    `row_instructions`.
+
+    Runs of more than COMPRESS_AFTER identical instructions are written
+    once, followed by the number of times to repeat them, so the length of
+    the text doesn't depend on the number of stitches. If `expand` is true,
+    every instruction is written out in full.
+    """
+    insts = list(instructions)
+    if len(insts) == 1 and insts[0].__class__ == Instruction:
+        if insts[0].stitch == 'ch':
+            return _first_instruction(insts[0].stitch_count)
+        return _('sc in each sc')
+
+    parts = []
+    after_group = False
+    for inst in insts:
+        if isinstance(inst, InstructionGroup):
+            parts.append('*')
+            _append_parts_txt(parts, inst, expand)
+            parts.append(_(', repeat from * %d times') % inst.repeats)
+            after_group = True
+        elif after_group and inst.__class__ == Instruction:
+            parts.append(_(' %dsc ') % inst.stitch_count)
+        else:
+            _append_parts_txt(parts, [inst], expand)
+    return ''.join(parts)
+
+
+def _append_parts_txt(parts, instructions, expand=False):
+    """ Append the plain-text fragments for `instructions` to `parts`. """
+    for inst in instructions:
+        if isinstance(inst, InstructionGroup):
+            inner = []
+            _append_parts_txt(inner, inst, expand)
+            _append_run_txt(parts, inner, inst.repeats, expand)
+        elif isinstance(inst, MultipleStitchesInstruction):
+            if inst.multiple_count == 2:
+                fragment = _(', 2sc in next')
+            else:
+                fragment = _(', {multiple}sc in next').format(
+                    multiple=inst.multiple_count)
+            _append_run_txt(parts, [fragment], inst.stitch_count, expand)
+        elif isinstance(inst, StitchTogetherInstruction):
+            if inst.together_count == 2:
+                fragment = _(', sc2tog')
+            else:
+                fragment = _(', sc{together}tog').format(
+                    together=inst.together_count)
+            _append_run_txt(parts, [fragment], inst.stitch_count, expand)
         else:
-            repeats = gcd(count, prev)
-            row_rem = 0
-            if repeats == 1:
-                repeats = abs(diff)
-            prev = prev / repeats
-            count, row_rem = divmod(count, repeats)
-            diff = count - prev
-            scs = min(prev, count) - abs(diff)
-            stcount, sc_rem = divmod(scs, abs(diff))
-            if repeats > 1:
-                result += '*'
-            part_count = int(abs(diff))
-            for i in range(part_count):
-                result += (_(', 2sc in next') if diff > 0 else _(', sc2tog'))
-                if i < abs(diff) - 1:
-                    if stcount:
-                        result += _(', %dsc') % stcount
-                else:
-                    if (stcount + sc_rem):
-                        result += _(', %dsc') % (stcount + sc_rem)
-            if repeats > 1:
-                result += _(', repeat from * %d times') % repeats
-
-            if row_rem:
-                result += _(' %dsc ') % row_rem
+            parts.append(_(', %dsc') % inst.stitch_count)
+
+
+def _append_run_txt(parts, fragments, times, expand):
+    """
+    Append `fragments` to `parts` `times` times over, or once in brackets,
+    followed by the number of times to work them, if that is more than
+    COMPRESS_AFTER.
+    """
+    if expand or times <= COMPRESS_AFTER:
+        parts.extend(fragments * times)
+        return
+    # Fragments start with ', ', which moves outside the brackets:
+    text = ', (%s)' % ''.join(fragments)[2:]
+    parts.append(text + _(' {count} times').format(count=times))
+
+
+def instruction(prev, count, instructions=None, expand=False):
+    """
+    Returns the instructions for a circular row with `count` stitches,
+    crocheted on to a row of `prev` stitches.
 
+    If the result of `row_instructions(prev, count)` is already available,
+    it can be provided as `instructions` to avoid rebuilding it. Long runs
+    of identical instructions are compressed unless `expand` is true - see
+    `instructions_txt`.
+    """
+    prev = int(prev) if prev else None
+    count = int(count) if count is not None else None
+    key = (_.language(), prev, count, expand)
+    result = _TEXT_CACHE.get(key)
+    if result is None:
+        profiling.count('instruction.misses')
+        if instructions is None:
+            instructions = row_instructions(prev, count)
+        result = instructions_txt(instructions, expand)
+        _TEXT_CACHE.put(key, result)
     return result
 
 
-def instruction_txt(row, prev, count):
+class Row(object):
+    """ A single row of a pattern, with its instructions. """
+    __slots__ = ('number', 'prev', 'count', '_instructions')
+
+    def __init__(self, number, prev, count):
+        self.number = number
+        self.prev = int(prev) if prev else None
+        self.count = int(count)
+        self._instructions = None
+
+    @property
+    def instructions(self):
+        """ The InstructionGroup for this row, built on first use. """
+        if self._instructions is None:
+            self._instructions = row_instructions(self.prev, self.count)
+        return self._instructions
+
+    def as_dict(self):
+        """ A JSON-compatible representation of this row. """
+        return {'row': self.number, 'stitches': self.count,
+                'instructions': self.instructions.as_dict()['instructions']}
+
+
+def pattern_rows(stitches):
+    """ Generate a `Row` for each stitch-count in `stitches`. """
+    prev = None
+    for index, stitch_count in enumerate(stitches):
+        yield Row(index + 1, prev, stitch_count)
+        prev = stitch_count
+
+
+class RowGroup(object):
+    """
+    Rows `first` to `last` of a pattern, which repeat the `Row` objects in
+    `rows` in turn.
+
+    A group of one row is a run of identical rows, starting with that row.
+    A group of several rows repeats the cycle of rows just before it.
+    """
+    __slots__ = ('first', 'last', 'rows')
+
+    def __init__(self, first, last, rows):
+        self.first = first
+        self.last = last
+        self.rows = rows
+
+    @property
+    def count(self):
+        """ The stitch-count of the last row in the group. """
+        return self.rows[(self.last - self.first) % len(self.rows)].count
+
+    def expand(self):
+        """ Generate a `Row` for each row in the group. """
+        period = len(self.rows)
+        for number in range(self.first, self.last + 1):
+            row = self.rows[(number - self.first) % period]
+            yield Row(number, row.prev, row.count)
+
+
+def _cycle_period(keys, max_period):
+    """
+    Return the length of the shortest cycle of up to `max_period` keys at
+    the start of `keys` which is immediately repeated, or 0 if there's none.
+    """
+    for period in range(1, min(max_period, len(keys) // 2) + 1):
+        if keys[:period] == keys[period:2 * period]:
+            return period
+    return 0
+
+
+def group_rows(rows, max_period=MAX_PERIOD):
+    """
+    Generate the `Row` objects from `rows`, replacing each run of identical
+    rows with a `RowGroup`, and each repetition of a cycle of up to
+    `max_period` rows with a RowGroup following the first cycle.
+
+    No more than 2 * `max_period` rows are held at once, and each row is
+    compared with a fixed number of others, so grouping takes linear time
+    and constant memory.
+    """
+    iterator = iter(rows)
+    pending = collections.deque()
+
+    def fill(size):
+        for row in itertools.islice(iterator, max(0, size - len(pending))):
+            pending.append(row)
+
+    while True:
+        fill(2 * max_period)
+        if not pending:
+            return
+        period = _cycle_period([(row.prev, row.count) for row in pending],
+                               max_period)
+        if not period:
+            yield pending.popleft()
+            continue
+        cycle = [pending.popleft() for __ in range(period)]
+        keys = [(row.prev, row.count) for row in cycle]
+        last = cycle[-1].number
+        while True:
+            fill(period)
+            if [(row.prev, row.count) for row in
+                    itertools.islice(pending, period)] != keys:
+                break
+            for __ in range(period):
+                last = pending.popleft().number
+        if period == 1:
+            yield RowGroup(cycle[0].number, last, cycle)
+        else:
+            for row in cycle:
+                yield row
+            yield RowGroup(cycle[-1].number + 1, last, cycle)
+
+
+def instruction_txt(row, prev, count, instructions=None):
     """ Produce a line of output in plain text format. """
     return _('Row {row_number}: {instructions} ({stitch_count})').format(
         row_number=row,
-        instructions=instruction(prev, count),
+        instructions=instruction(prev, count, instructions),
         stitch_count=int(count)
     )
 
 
-def print_instructions_txt(title, stitches):
-    """ Print plain text instructions for `stitches`. """
-    print(title)
-    print('=' * len(title))
-    prev = None
-    for row, stitch_count in enumerate(stitches):
-        print(instruction_txt(row + 1, prev, stitch_count))
-        prev = stitch_count
+def group_txt(group):
+    """ Produce a line of output in plain text format for a RowGroup. """
+    if len(group.rows) == 1:
+        row = group.rows[0]
+        return _('Rows {first}-{last}: {instructions} ({stitch_count})'
+                 ).format(first=group.first, last=group.last,
+                          instructions=instruction(row.prev, row.count,
+                                                   row.instructions),
+                          stitch_count=row.count)
+    return _('Rows {first}-{last}: repeat rows {start}-{end} ({stitch_count})'
+             ).format(first=group.first, last=group.last,
+                      start=group.rows[0].number, end=group.rows[-1].number,
+                      stitch_count=group.count)
+
+
+def print_instructions_txt(title, stitches, out=None, group=False):
+    """
+    Print plain text instructions for `stitches` to the
+    `crocad.output.Writer` `out`, or stdout. If `group` is true, runs and
+    cycles of rows are collapsed - see `group_rows`.
+    """
+    with profiling.stage('print'):
+        out = out or output.writer(sys.stdout)
+        out.write_line(title)
+        out.write_line('=' * len(title))
+        rows = pattern_rows(stitches)
+        if group:
+            rows = group_rows(rows)
+        out.write_lines(profiling.stage_iter('instructions', (
+            group_txt(row) if isinstance(row, RowGroup)
+            else instruction_txt(row.number, row.prev, row.count)
+            for row in rows)))
+        out.flush()
 
 
 def round_to_nearest(i, margin=1, min_val=0):
-    """ Return i rounded to the nearest margin. """
-    val = ((i // margin) + round(float(i % margin) / margin)) * margin
+    """ Return i rounded to the nearest margin, rounding halves up. """
+    if isinstance(i, int) and isinstance(margin, int):
+        # Exact integer arithmetic:
+        return max(min_val, (2 * i + margin) // (2 * margin) * margin)
+    val = ((i // margin) + math.floor(float(i % margin) / margin + 0.5)) \
+        * margin
     return max(min_val, val)
 
 
@@ -310,9 +710,79 @@ def round_to_nearest_iter(i, margin=1, min_val=0):
         yield round_to_nearest(val, margin, min_val)
 
 
-def print_row_counts(stitches):
+def round_optimal(i, margin=1, min_val=0, smoothness=1.0, band=1):
+    """
+    Return a list of each item in i rounded to a multiple of margin, no
+    smaller than min_val, chosen to minimise the total squared deviation
+    from the items plus `smoothness` times the total squared deviation of
+    each row's increase from the increase between the original items.
+
+    Each row is rounded to one of the `band` multiples of margin either side
+    of its nearest multiple, so the rounding takes time linear in the number
+    of rows. The result is never worse than `round_to_nearest_iter`'s.
+    """
+    values = [float(val) for val in i]
+    if not values:
+        return []
+    candidates = []
+    for val in values:
+        nearest = round_to_nearest(val, margin, min_val)
+        row = [nearest]
+        for step in range(1, band + 1):
+            row.extend(candidate for candidate in (nearest - step * margin,
+                                                   nearest + step * margin)
+                       if candidate >= min_val)
+        candidates.append(row)
+
+    # costs[k] is the least cost of the rows so far, ending with the k-th
+    # candidate for the current row, and choices[row][k] is the candidate
+    # for the previous row which achieved it:
+    costs = [(candidate - values[0]) ** 2 for candidate in candidates[0]]
+    choices = []
+    for row in range(1, len(values)):
+        ideal = values[row] - values[row - 1]
+        prev_candidates = candidates[row - 1]
+        row_costs = []
+        row_choices = []
+        for candidate in candidates[row]:
+            best = None
+            for k, prev in enumerate(prev_candidates):
+                cost = costs[k] + smoothness * (candidate - prev - ideal) ** 2
+                if best is None or cost < best:
+                    best, best_k = cost, k
+            row_costs.append(best + (candidate - values[row]) ** 2)
+            row_choices.append(best_k)
+        costs = row_costs
+        choices.append(row_choices)
+
+    k = min(range(len(costs)), key=costs.__getitem__)
+    result = [candidates[-1][k]]
+    for row in range(len(values) - 2, -1, -1):
+        k = choices[row][k]
+        result.append(candidates[row][k])
+    result.reverse()
+    return result
+
+
+SNAPPERS = {
+    'nearest': round_to_nearest_iter,
+    'optimal': round_optimal,
+}
+
+
+def snapper(global_options):
+    """
+    Return the rounding function selected by the global options: either
+    the fast `round_to_nearest_iter` or `round_optimal`.
+    """
+    return SNAPPERS[getattr(global_options, 'rounding', None) or 'nearest']
+
+
+def print_row_counts(stitches, out=None):
     """
-    Simply prints out the each stitch-count on its own line, as an integer.
+    Simply prints out the each stitch-count on its own line, as an integer,
+    to the `crocad.output.Writer` `out`, or stdout.
     """
-    for stitch in stitches:
-        print(int(stitch))
+    out = out or output.writer(sys.stdout)
+    out.write_lines(str(int(stitch)) for stitch in stitches)
+    out.flush()
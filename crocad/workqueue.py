@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+crocad.workqueue - resumable sweeps, shared between worker processes and
+hosts.
+
+The jobs of a sweep (see `crocad.sweep`) are split into work units, which
+are recorded in an SQLite journal along with their results. Workers claim a
+unit for a limited time (its lease), run its jobs and record the results.
+Units whose lease expires before they are completed - because their worker
+died - are claimed again by another worker, so a sweep can be resumed after a
+crash without repeating the units which were completed.
+
+Workers on the same host use the journal directly. Workers on other hosts
+connect to a `QueueServer`, which answers newline-delimited JSON requests
+over a plain TCP socket::
+
+    {"op": "claim", "worker": "host:1234", "lease": 300}
+    {"op": "complete", "unit": 7, "results": [...]}
+    {"op": "remaining"}
+"""
+
+import json
+import logging
+import optparse
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+
+from crocad import batch, localization, sweep
+from crocad.output import output_writer
+
+
+__all__ = ['WorkQueue', 'RemoteQueue', 'QueueServer', 'work', 'journal_jobs']
+
+NAMES = ['queue']
+LOG = logging.getLogger('crocad.workqueue')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    jobs TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    claimed_at REAL,
+    results TEXT
+)
+"""
+
+
+def worker_name():
+    """ Return a name identifying the current process and host. """
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+class WorkQueue(object):
+    """
+    The work units of a sweep, stored in the SQLite journal at `path`.
+
+    A WorkQueue may be shared between threads, and any number of processes
+    may use the same journal.
+    """
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(SCHEMA)
+
+    def add(self, jobs, unit_size=16):
+        """ Add units of up to `unit_size` of `jobs`, returning the number of
+        units added.
+        """
+        units = [(json.dumps(chunk, sort_keys=True),)
+                 for chunk in sweep.chunks(jobs, unit_size)]
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            self._db.executemany('INSERT INTO units (jobs) VALUES (?)', units)
+            self._db.execute('COMMIT')
+        return len(units)
+
+    def claim(self, worker, lease=300):
+        """
+        Claim the first unit which is pending or whose lease has expired,
+        for `lease` seconds. Returns a (unit id, jobs) pair, or None if no
+        unit can be claimed.
+        """
+        now = self.clock()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute(
+                    "SELECT id, jobs FROM units WHERE state = 'pending'"
+                    " OR (state = 'claimed' AND claimed_at <= ?)"
+                    " ORDER BY id LIMIT 1", (now - lease,)).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE units SET state = 'claimed', worker = ?,"
+                        " claimed_at = ? WHERE id = ?", (worker, now, row[0]))
+            finally:
+                self._db.execute('COMMIT')
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def complete(self, unit_id, results):
+        """ Record the `results` of the unit `unit_id`. """
+        with self._lock:
+            self._db.execute(
+                "UPDATE units SET state = 'done', results = ?"
+                " WHERE id = ? AND state != 'done'",
+                (json.dumps(results, sort_keys=True), unit_id))
+
+    def release(self):
+        """ Release every claimed unit, so they can be claimed at once. """
+        with self._lock:
+            self._db.execute("UPDATE units SET state = 'pending', worker ="
+                             " NULL, claimed_at = NULL"
+                             " WHERE state = 'claimed'")
+
+    def progress(self):
+        """ Return a dict of the number of units in each state. """
+        with self._lock:
+            rows = self._db.execute('SELECT state, COUNT(*) FROM units'
+                                    ' GROUP BY state').fetchall()
+        result = {'pending': 0, 'claimed': 0, 'done': 0}
+        result.update(rows)
+        return result
+
+    def remaining(self):
+        """ Return the number of units which haven't been completed. """
+        progress = self.progress()
+        return progress['pending'] + progress['claimed']
+
+    def results(self):
+        """ Generate the results of the completed units, in job order. """
+        with self._lock:
+            rows = self._db.execute("SELECT results FROM units WHERE state"
+                                    " = 'done' ORDER BY id").fetchall()
+        for row in rows:
+            for result in json.loads(row[0]):
+                yield result
+
+    def close(self):
+        """ Close the journal. """
+        self._db.close()
+
+
+class QueueRequestHandler(socketserver.StreamRequestHandler):
+    """ Answers JSON requests, one per line, from remote workers. """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                response = self.server.respond(request)
+            except (ValueError, KeyError, TypeError) as error:
+                response = {'error': str(error)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class QueueServer(socketserver.ThreadingTCPServer):
+    """ Serves a WorkQueue to remote workers over TCP. """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, queue, address):
+        socketserver.ThreadingTCPServer.__init__(self, address,
+                                                 QueueRequestHandler)
+        self.queue = queue
+
+    def respond(self, request):
+        """ Return the response to a request dict. """
+        if request['op'] == 'claim':
+            unit = self.queue.claim(request['worker'],
+                                    request.get('lease', 300))
+            return {'unit': unit}
+        elif request['op'] == 'complete':
+            self.queue.complete(request['unit'], request['results'])
+            return {'ok': True}
+        elif request['op'] == 'remaining':
+            return {'remaining': self.queue.remaining()}
+        raise ValueError('Unknown request: %s' % request['op'])
+
+
+class RemoteQueue(object):
+    """ A WorkQueue served by a QueueServer at `address`. """
+    def __init__(self, address):
+        self._socket = socket.create_connection(address)
+        self._file = self._socket.makefile('rwb')
+
+    def _request(self, request):
+        """ Send a request dict, and return the response. """
+        self._file.write(json.dumps(request).encode('utf-8') + b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise IOError('The queue server closed the connection.')
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            raise IOError(response['error'])
+        return response
+
+    def claim(self, worker, lease=300):
+        """ Claim a unit - see `WorkQueue.claim`. """
+        response = self._request({'op': 'claim', 'worker': worker,
+                                  'lease': lease})
+        return tuple(response['unit']) if response['unit'] else None
+
+    def complete(self, unit_id, results):
+        """ Record a unit's results - see `WorkQueue.complete`. """
+        self._request({'op': 'complete', 'unit': unit_id,
+                       'results': results})
+
+    def remaining(self):
+        """ Return the number of units which haven't been completed. """
+        return self._request({'op': 'remaining'})['remaining']
+
+    def close(self):
+        """ Close the connection to the server. """
+        self._file.close()
+        self._socket.close()
+
+
+def work(queue, defaults, worker=None, lease=300, poll=5):
+    """
+    Claim and run units from `queue` until every unit has been completed,
+    returning the number of units this worker completed. While other
+    workers hold the last units, wait `poll` seconds between claims, in case
+    their leases expire.
+    """
+    worker = worker or worker_name()
+    completed = 0
+    while True:
+        unit = queue.claim(worker, lease)
+        if unit is None:
+            if not queue.remaining():
+                return completed
+            time.sleep(poll)
+            continue
+        unit_id, jobs = unit
+        LOG.info('%s running unit %d', worker, unit_id)
+        queue.complete(unit_id, sweep.run_chunk(jobs, defaults))
+        completed += 1
+
+
+def journal_jobs(shape, ranges, defaults):
+    """
+    Generate the sweep jobs for `shape` and `ranges` (see
+    `crocad.sweep.sweep_jobs`) to record in a journal. Every option which
+    affects the output is recorded in each job, from the job `defaults`, so
+    that workers with different global options produce the same results.
+    """
+    return sweep.sweep_jobs(shape, ranges, accurate=bool(defaults.accurate),
+                            format=defaults.format,
+                            rounding=defaults.rounding or 'nearest',
+                            group_rows=bool(defaults.group_rows))
+
+
+def _work_locally(path, defaults, lease, poll):
+    """ Run a worker process on the journal at `path`. """
+    queue = WorkQueue(path)
+    try:
+        return work(queue, defaults, lease=lease, poll=poll)
+    finally:
+        queue.close()
+
+
+def _address(text, default_host='127.0.0.1'):
+    """ Parse 'HOST:PORT' (or just 'PORT') into an address pair. """
+    host, __, port = text.rpartition(':')
+    return host or default_host, int(port)
+
+
+def main(argv, global_options):
+    """ Command entry-point for resumable sweeps. """
+    _ = localization.get_translation()
+    opt_parser = optparse.OptionParser(
+        '%prog [GLOBAL-OPTIONS] queue init JOURNAL SHAPE'
+        ' --option=NAME=RANGE ...\n'
+        '       %prog queue work JOURNAL [--workers=N] [--reclaim]\n'
+        '       %prog queue work --connect=HOST:PORT\n'
+        '       %prog queue serve JOURNAL --listen=[HOST:]PORT\n'
+        '       %prog queue status JOURNAL\n'
+        '       %prog queue results JOURNAL',
+        description=_("""
+Run a sweep which can be resumed, and shared between hosts. 'init' records
+the sweep's work units in JOURNAL. 'work' runs workers until every unit is
+complete, either on JOURNAL or on the units served by another host's 'serve'.
+'results' writes the results in order, as JSON lines.
+""").strip())
+    opt_parser.add_option('-o', '--option', action='append', default=[],
+        metavar='NAME=RANGE', help=_('the range of values for an option'))
+    opt_parser.add_option('--unit-size', action='store', type='int',
+        default=16, metavar='N',
+        help=_('the number of patterns in each work unit [%default]'))
+    opt_parser.add_option('-w', '--workers', action='store', type='int',
+        default=1, metavar='N',
+        help=_('the number of worker processes [%default]'))
+    opt_parser.add_option('--lease', action='store', type='float',
+        default=300, metavar='SECONDS',
+        help=_('the time a worker has to complete a unit before it is'
+               ' given to another worker [%default]'))
+    opt_parser.add_option('--reclaim', action='store_true', default=False,
+        help=_('release the units claimed by workers which have stopped'))
+    opt_parser.add_option('-c', '--connect', action='store',
+        metavar='HOST:PORT', help=_("work on units from a 'serve' command"))
+    opt_parser.add_option('-l', '--listen', action='store', default='8765',
+        metavar='[HOST:]PORT',
+        help=_('the address to serve units on, which is only this host'
+               ' unless HOST is given [%default]'))
+    command_opts, args = opt_parser.parse_args(argv)
+    subcommand = args.pop(0) if args else None
+    defaults = batch.job_defaults(global_options)
+
+    if subcommand == 'work' and command_opts.connect:
+        queue = RemoteQueue(_address(command_opts.connect))
+        try:
+            work(queue, defaults, lease=command_opts.lease)
+        finally:
+            queue.close()
+        return
+    if len(args) < 1 or subcommand not in ('init', 'work', 'serve',
+                                           'status', 'results'):
+        opt_parser.error(_('Provide a queue command and JOURNAL.'))
+    queue = WorkQueue(args[0])
+    try:
+        if subcommand == 'init':
+            if len(args) != 2 or args[1] not in batch.SHAPES:
+                opt_parser.error(_('Provide one SHAPE, from: {shapes}')
+                    .format(shapes=', '.join(sorted(batch.SHAPES))))
+            try:
+                ranges = sweep.option_ranges(command_opts.option)
+            except ValueError as error:
+                opt_parser.error(str(error))
+            if any(queue.progress().values()):
+                opt_parser.error(_('{journal} already contains a sweep.')
+                                 .format(journal=args[0]))
+            units = queue.add(journal_jobs(args[1], ranges, defaults),
+                              max(1, command_opts.unit_size))
+            LOG.info('Added %d work units to %s', units, args[0])
+        elif subcommand == 'work':
+            if command_opts.reclaim:
+                queue.release()
+            if command_opts.workers == 1:
+                work(queue, defaults, lease=command_opts.lease)
+            else:
+                import concurrent.futures
+                with concurrent.futures.ProcessPoolExecutor(
+                        command_opts.workers) as executor:
+                    workers = [executor.submit(_work_locally, args[0],
+                                               defaults, command_opts.lease,
+                                               5)
+                               for __ in range(command_opts.workers)]
+                    for worker in workers:
+                        worker.result()
+        elif subcommand == 'serve':
+            if command_opts.reclaim:
+                queue.release()
+            # Anyone who can connect can complete units, so other hosts
+            # can only connect if they're explicitly listened for:
+            server = QueueServer(queue, _address(command_opts.listen))
+            LOG.info('Serving work units on %s:%d', *server.server_address)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+        elif subcommand == 'status':
+            with output_writer(global_options) as out:
+                out.write_line(json.dumps(queue.progress(), sort_keys=True))
+        else:
+            with output_writer(global_options) as out:
+                out.write_lines(json.dumps(result, sort_keys=True)
+                                for result in queue.results())
+    finally:
+        queue.close()
@@ -89,6 +89,37 @@ class TestUtil(unittest.TestCase, UtilTestCaseMixin):
         self.assertEqual([4,4,4,4,4,6,6,8,8,10],
             list(self._rtni(list(range(10)), 2, 4)))
 
+    def test_round_optimal(self):
+        """ round_optimal respects the margin, and never costs more than
+        round_to_nearest_iter
+        """
+        import crocad.cone
+        import crocad.donut
+        opt = self._util.round_optimal
+
+        def cost(rounded, values, smoothness=1.0):
+            return sum((r - v) ** 2 for r, v in zip(rounded, values)) + \
+                smoothness * sum(((rounded[i] - rounded[i - 1])
+                                  - (values[i] - values[i - 1])) ** 2
+                                 for i in range(1, len(values)))
+
+        self.assertEqual([], opt([], 6, 6))
+        self.assertEqual(list(self._rtni(list(range(10)), 2, 4)),
+                         opt(list(range(10)), 2, 4))
+        for values in [list(crocad.cone.cone(30, 40)),
+                       list(crocad.donut.donut(18, 16)),
+                       [6, 9.2, 12.4, 15.6, 18.8, 22.0, 25.2]]:
+            for smoothness in [0, 1, 4]:
+                rounded = opt(values, 6, 6, smoothness)
+                self.assertEqual(len(values), len(rounded))
+                self.assertTrue(all(r % 6 == 0 and r >= 6 for r in rounded))
+                self.assertTrue(cost(rounded, values, smoothness) <= cost(
+                    list(self._rtni(values, 6, 6)), values, smoothness))
+        # The cone's last increase is smoothed away:
+        values = list(crocad.cone.cone(30, 40))
+        self.assertEqual(42, list(self._rtni(values, 6, 6))[-1])
+        self.assertEqual(36, opt(values, 6, 6)[-1])
+
     def test_instruction(self):
         """ instruction produces the correct output
         """
@@ -101,6 +132,48 @@ class TestUtil(unittest.TestCase, UtilTestCaseMixin):
         self.assertEqual('sc in each sc', self._inst(12, 12))
         self.assertEqual('ch 12, sc in each chain', self._inst(None, 12))
 
+    def test_stitches_are_conserved(self):
+        """ Every row's instructions use exactly the previous row's stitches
+        and make exactly its own, using whole numbers throughout
+        """
+        import random
+        rand = random.Random(16)
+        pairs = [(prev, count) for prev in range(1, 80)
+                 for count in range(1, 80)]
+        pairs += [(rand.randint(1, 10 ** 6), rand.randint(1, 10 ** 6))
+                  for __ in range(500)]
+        for prev, count in pairs:
+            plan = self._util.instruction_plan(prev, count)
+            self.assertTrue(all(isinstance(x, int) for x in plan[1:]))
+            group = self._util.row_instructions(prev, count)
+            self.assertEqual(count, group.stitches)
+            self.assertEqual(prev, group.stitches_into)
+
+    def test_instruction_plan_changes(self):
+        """ Integer plans only change rows whose repeats didn't divide the
+        previous row, which lost their increases and decreases
+        """
+        locale.setlocale(locale.LC_ALL, 'en_GB.utf-8')
+        for prev, count, text in [
+                (6, 12, '*, 2sc in next, repeat from * 6 times'),
+                (12, 18, '*, 2sc in next, 1sc, repeat from * 6 times'),
+                (36, 30, '*, sc2tog, 4sc, repeat from * 6 times'),
+                (34, 38, '*, 2sc in next, 7sc, 2sc in next, 8sc,'
+                         ' repeat from * 2 times'),
+                (12, 11, ', sc2tog, 10sc'),
+                (6, 18, '*, 3sc in next, repeat from * 6 times')]:
+            self.assertEqual(text, self._inst(prev, count))
+        # The instructions from the previous, floating-point plan:
+        for prev, count, before, after in [
+                (34, 37, '*, repeat from * 3 times 1sc ',
+                 '*, 2sc in next, 10sc, repeat from * 3 times 1sc '),
+                (9, 11, '*, repeat from * 2 times 1sc ',
+                 '*, 2sc in next, 3sc, repeat from * 2 times 1sc '),
+                (7, 5, '*, sc2tog, 0sc, repeat from * 2 times 1sc ',
+                 '*, sc2tog, 1sc, repeat from * 2 times 1sc ')]:
+            self.assertNotEqual(before, self._inst(prev, count))
+            self.assertEqual(after, self._inst(prev, count))
+
     def test_gcd_backport(self):
         gcd = self._util.gcd_backport
 
@@ -328,6 +401,341 @@ class TestInstructionGroup(unittest.TestCase, UtilTestCaseMixin):
                 repeats=6)))
 
 
+class TestRowInstructions(unittest.TestCase, UtilTestCaseMixin):
+    def test_row_instructions(self):
+        """ row_instructions produces an InstructionGroup for each row
+        """
+        u = self._util
+        self.assertEqual(
+            u.InstructionGroup([u.Instruction('ch', 12)]),
+            u.row_instructions(None, 12))
+        self.assertEqual(
+            u.InstructionGroup([u.Instruction(stitch_count=12)]),
+            u.row_instructions(12, 12))
+        self.assertEqual(
+            u.InstructionGroup([u.StitchTogetherInstruction(),
+                                u.Instruction(stitch_count=10)]),
+            u.row_instructions(12, 11))
+        group = u.row_instructions(12, 18)
+        self.assertEqual(18, group.stitches)
+        self.assertEqual(12, group.stitches_into)
+
+    def test_large_changes(self):
+        """ Rows which more than double or halve use several stitches in
+        (or together from) each stitch
+        """
+        u = self._util
+        self.assertEqual(
+            u.InstructionGroup([u.InstructionGroup(
+                [u.MultipleStitchesInstruction('sc', 1, 100)], repeats=60)]),
+            u.row_instructions(60, 6000))
+        self.assertEqual('*, 4sc in next, repeat from * 6 times',
+                         u.instruction(6, 24))
+        self.assertEqual('*, 4sc in next, 3sc in next, repeat from * 10 times',
+                         u.instruction(20, 70))
+        self.assertEqual('*, sc100tog, repeat from * 60 times',
+                         u.instruction(6000, 60))
+        for prev, count in [(6, 24), (20, 70), (60, 6000), (70, 20)]:
+            group = u.row_instructions(prev, count)
+            self.assertEqual(count, group.stitches)
+            self.assertEqual(prev, group.stitches_into)
+
+    def test_compressed_runs(self):
+        """ Long runs of instructions are compressed unless expanded
+        """
+        u = self._util
+        self.assertEqual('*, (2sc in next, 13sc) 6 times, 2sc in next, 15sc,'
+                         ' repeat from * 2 times', u.instruction(200, 214))
+        self.assertEqual('*' + ', 2sc in next, 13sc' * 6 + ', 2sc in next,'
+                         ' 15sc, repeat from * 2 times',
+                         u.instruction(200, 214, expand=True))
+        self.assertEqual('*, (2sc in next) 9 times, 1sc, repeat from * 10'
+                         ' times', u.instruction(100, 190))
+        # Compressed runs are always bracketed, so it's clear what repeats:
+        self.assertEqual(', sc15tog, sc15tog, (sc14tog) 5 times',
+                         u.instruction(100, 7))
+        self.assertEqual(', (3sc in next) 6 times, 2sc in next',
+                         u.instruction(7, 20))
+        self.assertEqual(', 15sc in next, 15sc in next, (14sc in next) 5'
+                         ' times', u.instruction(7, 100))
+        # The size of the instructions doesn't depend on the stitch-counts:
+        self.assertEqual(1, len(u.row_instructions(2000, 2140)))
+        self.assertEqual(3, len(list(u.row_instructions(2000, 2140))[0]))
+
+    def test_instructions_txt(self):
+        """ instructions_txt matches the text produced by instruction
+        """
+        u = self._util
+        for prev, count in [(None, 6), (12, 12), (11, 12), (12, 11),
+                            (34, 38), (18, 24), (24, 18)]:
+            self.assertEqual(u.instruction(prev, count),
+                u.instructions_txt(u.row_instructions(prev, count)))
+
+
+class TestPattern(unittest.TestCase):
+    @property
+    def _Pattern(self):
+        import crocad.pattern
+        return crocad.pattern.Pattern
+
+    def test_counts(self):
+        """ A Pattern behaves as a sequence of integer stitch-counts
+        """
+        pattern = self._Pattern([6.0, 12.0, 12.0, 12.0, 6.0], 'Test')
+        self.assertEqual(5, len(pattern))
+        self.assertEqual([6, 12, 12, 12, 6], list(pattern))
+        self.assertEqual(12, pattern[1])
+        self.assertEqual(48, pattern.total_stitches)
+
+    def test_transitions_are_shared(self):
+        """ Identical transitions are stored once
+        """
+        pattern = self._Pattern([6, 12, 12, 12, 6])
+        self.assertEqual(4, pattern.transitions)
+        self.assertEqual(pattern.row_transitions[2],
+                         pattern.row_transitions[3])
+
+    def test_rows(self):
+        import crocad.util
+        pattern = self._Pattern([6, 12, 12])
+        rows = list(pattern.rows())
+        self.assertEqual([None, 6, 12], [row.prev for row in rows])
+        self.assertEqual(crocad.util.row_instructions(6, 12),
+                         pattern.instructions(1))
+        self.assertEqual(3, pattern.row(-1).number)
+
+    def test_slots(self):
+        """ Instructions don't carry a per-instance __dict__
+        """
+        import crocad.util
+        self.assertFalse(hasattr(crocad.util.Instruction(), '__dict__'))
+        self.assertFalse(hasattr(crocad.util.InstructionGroup(), '__dict__'))
+
+
+class TestLazyPattern(unittest.TestCase):
+    def _patterns(self, module, **options):
+        import optparse
+        command_opts, __ = module.option_parser().parse_args([])
+        for name, value in options.items():
+            setattr(command_opts, name, value)
+        global_options = optparse.Values({'accurate': False,
+                                          'rounding': 'nearest'})
+        title, stitches = module.pattern(command_opts, global_options)
+        return ((title, list(stitches)),
+                module.lazy_pattern(command_opts, global_options))
+
+    def test_matches_pattern(self):
+        """ A LazyPattern has the same rows as the shape's generator
+        """
+        import crocad.ball, crocad.cone, crocad.donut
+        for module, options in [(crocad.ball, {'row_count': 30}),
+                                (crocad.cone, {'row_count': 1}),
+                                (crocad.cone, {'row_count': 20}),
+                                (crocad.donut, {'row_count': 24})]:
+            (title, stitches), lazy = self._patterns(module, **options)
+            self.assertEqual(title, lazy.title)
+            self.assertEqual(stitches, list(lazy))
+            self.assertEqual(stitches[5:9], lazy[5:9])
+            self.assertEqual(stitches[-1], lazy[-1])
+            self.assertEqual(sum(stitches), lazy.total_stitches)
+
+    def test_rows(self):
+        """ Rows selected from a LazyPattern know their previous row
+        """
+        import crocad.ball
+        __, lazy = self._patterns(crocad.ball, row_count=100000)
+        rows = list(lazy.rows(50000, 50002))
+        self.assertEqual([50001, 50002], [row.number for row in rows])
+        self.assertEqual(lazy[49999], rows[0].prev)
+        self.assertEqual(None, lazy.row(0).prev)
+        self.assertRaises(IndexError, lazy.row, 100000)
+
+    def test_negative_row_count(self):
+        """ Shapes with a negative row-count have no rows, as they do when
+        generated
+        """
+        import crocad.ball, crocad.cone, crocad.donut
+        for module in [crocad.ball, crocad.cone, crocad.donut]:
+            (__, stitches), lazy = self._patterns(module, row_count=-4)
+            self.assertEqual(stitches, list(lazy))
+            self.assertEqual(len(stitches), len(list(lazy.rows(0))))
+
+
+class TestShape(unittest.TestCase):
+    def test_usage(self):
+        """ A shape's usage lists its options
+        """
+        import crocad.cone
+        self.assertEqual('%prog [GLOBAL-OPTIONS] cone [--row-count=ROWS]'
+                         ' [--max-circumference=STITCHES]',
+                         crocad.cone.option_parser().usage)
+
+    def test_generators(self):
+        """ A shape's generator has the rows of its default pattern, before
+        snapping
+        """
+        import crocad.ball, crocad.cylinder, crocad.donut
+        for module, generator, params in [
+                (crocad.ball, crocad.ball.ball, (16,)),
+                (crocad.cylinder, crocad.cylinder.cylinder, (36, 16)),
+                (crocad.donut, crocad.donut.donut, (18, 16))]:
+            command_opts = module.option_parser().get_default_values()
+            self.assertEqual(list(module.SHAPE.surface.rows(
+                                 module.params(command_opts))),
+                             list(generator(*params)))
+
+
+class TestRender(unittest.TestCase):
+    @property
+    def _render(self):
+        import crocad.render
+        return crocad.render
+
+    def test_render_several_formats(self):
+        """ A pattern can be rendered into several formats in one pass
+        """
+        import json
+        result = self._render.render('Test', [6, 12, 12, 6],
+                                     ['txt', 'json', 'counts', 'chart'])
+        self.assertEqual(['6', '12', '12', '6'], result['counts'])
+        self.assertEqual(['Test', '===='], result['txt'][:2])
+        self.assertEqual(6, len(result['txt']))
+        doc = json.loads('\n'.join(result['json']))
+        self.assertEqual('Test', doc['title'])
+        self.assertEqual([1, 2, 3, 4], [row['row'] for row in doc['rows']])
+        self.assertEqual('  2 (12): VVVVVV', result['chart'][4])
+
+    def test_chart_spread_rows(self):
+        """ Charts show increases and decreases of more than two stitches
+        """
+        chart = self._render.render('Test', [6, 18, 72, 18, 6],
+                                    ['chart'])['chart']
+        self.assertEqual(['  2 (18): WWWWWW',
+                          '  3 (72): [4V][4V][4V][4V][4V][4V][4V][4V][4V]'
+                          '[4V][4V][4V][4V][4V][4V][4V][4V][4V]',
+                          '  4 (18): [4A][4A][4A][4A][4A][4A][4A][4A][4A]'
+                          '[4A][4A][4A][4A][4A][4A][4A][4A][4A]',
+                          '  5 (6): MMMMMM'], chart[4:])
+
+    def test_output_format(self):
+        import optparse
+        options = optparse.Values({'inhuman': False, 'format': 'json'})
+        self.assertEqual('json', self._render.output_format(options))
+        options.inhuman = True
+        self.assertEqual('counts', self._render.output_format(options))
+
+
+class TestGroupRows(unittest.TestCase, UtilTestCaseMixin):
+    def _lines(self, counts):
+        util = self._util
+        return [util.group_txt(row) if isinstance(row, util.RowGroup)
+                else util.instruction_txt(row.number, row.prev, row.count)
+                for row in util.group_rows(util.pattern_rows(counts))]
+
+    def test_runs(self):
+        """ Runs of identical rows are collapsed
+        """
+        lines = self._lines([6, 12, 12, 12, 12, 6])
+        self.assertEqual(4, len(lines))
+        self.assertEqual('Rows 3-5: sc in each sc (12)', lines[2])
+
+    def test_cycles(self):
+        """ Repeated cycles of rows refer back to the first cycle
+        """
+        lines = self._lines([6, 12, 18, 12, 18, 12, 18, 12])
+        self.assertEqual(5, len(lines))
+        self.assertTrue(lines[3].startswith('Row 4: '))
+        self.assertEqual('Rows 5-8: repeat rows 3-4 (12)', lines[4])
+
+    def test_expand(self):
+        """ Expanding every group gives the original rows
+        """
+        import random
+        util = self._util
+        generator = random.Random(5)
+        for __ in range(200):
+            counts = [generator.choice([6, 12, 18]) for __ in range(
+                generator.randint(0, 30))]
+            rows = []
+            for row in util.group_rows(util.pattern_rows(counts),
+                                       generator.randint(1, 5)):
+                if isinstance(row, util.RowGroup):
+                    rows.extend(row.expand())
+                else:
+                    rows.append(row)
+            self.assertEqual(list(range(1, len(counts) + 1)),
+                             [row.number for row in rows])
+            self.assertEqual(counts, [row.count for row in rows])
+
+    def test_render(self):
+        """ Formats listing every row are unchanged by grouping
+        """
+        import crocad.render
+        counts = [6, 12, 18, 18, 18, 12, 18, 12, 18, 6]
+        for fmt in ['counts', 'json']:
+            self.assertEqual(
+                crocad.render.render('Test', counts, [fmt]),
+                crocad.render.render('Test', counts, [fmt], group=True))
+        lines = crocad.render.render('Test', counts, ['chart'], group=True)
+        # The title, its underline and the key, then rows 1, 2, 3, 4-5, 6,
+        # 7, 8-9 and 10:
+        self.assertEqual(11, len(lines['chart']))
+
+
+class TestOutput(unittest.TestCase):
+    @property
+    def _output(self):
+        import crocad.output
+        return crocad.output
+
+    def test_buffering(self):
+        """ Text is only written when enough is waiting, or on flush
+        """
+        import io
+        stream = io.BytesIO()
+        out = self._output.BinaryWriter(stream, buffer_size=10)
+        out.write_line('Row 1')
+        self.assertEqual(b'', stream.getvalue())
+        out.write_lines(['Row 2', 'Row 3'])
+        self.assertEqual(b'Row 1\nRow 2\n', stream.getvalue())
+        out.flush()
+        self.assertEqual(b'Row 1\nRow 2\nRow 3\n', stream.getvalue())
+
+    def test_writer(self):
+        """ Text files are written to through their binary buffer, if any
+        """
+        import io
+        stream = io.StringIO()
+        with self._output.writer(stream) as out:
+            out.write_line(u'Ympyrä')
+        self.assertEqual(u'Ympyrä\n', stream.getvalue())
+        self.assertFalse(stream.closed)
+
+        raw = io.BytesIO()
+        stream = io.TextIOWrapper(raw, encoding='latin-1')
+        stream.write('Title\n')
+        with self._output.writer(stream) as out:
+            out.write_line(u'Ympyrä')
+        self.assertEqual(u'Title\nYmpyrä\n'.encode('latin-1'),
+                         raw.getvalue())
+
+    def test_gzip(self):
+        """ Files with names ending in .gz are compressed
+        """
+        import gzip
+        import os
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'pattern.txt.gz')
+        with self._output.open_output(path) as out:
+            out.write_lines(str(count) for count in range(1000))
+        with gzip.open(path, 'rt') as stream:
+            self.assertEqual([str(count) for count in range(1000)],
+                             stream.read().splitlines())
+
+
 class Test_output_txt(unittest.TestCase, UtilTestCaseMixin):
     def test_output_text(self):
         locale.setlocale(locale.LC_ALL, 'en_GB.utf-8')
@@ -339,6 +747,1069 @@ class Test_output_txt(unittest.TestCase, UtilTestCaseMixin):
         self.assertEqual('2. krs: ks jokaiseen ks:aan(6)', self._util.instruction_txt(2, 6., 6.))
 
 
+class TestEngine(unittest.TestCase, UtilTestCaseMixin):
+    @property
+    def _engine(self):
+        import crocad.engine
+        return crocad.engine
+
+    def test_ragged_offsets(self):
+        """ Batches are split into patterns by their offsets
+        """
+        balls = self._engine.ball([3, 0, 5])
+        self.assertEqual(3, len(balls))
+        self.assertEqual([0, 3, 3, 8], list(balls.offsets))
+        self.assertEqual([3, 0, 5], list(balls.lengths))
+        self.assertEqual(5, len(balls[-1]))
+        self.assertRaises(IndexError, lambda: balls[3])
+
+    def test_batches_match_generators(self):
+        """ Batch results are identical to the per-pattern generators
+        """
+        import crocad.ball
+        import crocad.cone
+        import crocad.donut
+        rows = list(range(1, 40))
+        for row_count, values in zip(rows, self._engine.ball(rows)):
+            self.assertEqual(list(crocad.ball.ball(row_count)),
+                             values.tolist())
+        for row_count, values in zip(rows, self._engine.cone(rows, 60)):
+            self.assertEqual(list(crocad.cone.cone(row_count, 60)),
+                             values.tolist())
+        for row_count, values in zip(rows, self._engine.donut(18, rows)):
+            self.assertEqual(list(crocad.donut.donut(18, row_count)),
+                             values.tolist())
+
+    def test_batches_broadcast_grids(self):
+        """ A column and a row of parameters give every combination
+        """
+        import numpy
+        rows, circs = numpy.array([[3], [5], [9]]), numpy.array([[20, 30]])
+        cones = self._engine.cone(rows, circs)
+        self.assertEqual(6, len(cones))
+        for (row_count, max_circ), values in zip(
+                [(r, c) for r in [3, 5, 9] for c in [20, 30]], cones):
+            self.assertEqual(self._engine.cone_rows(row_count, max_circ),
+                             values.tolist())
+        eggs = self._engine.EGG.batch(rows, circs / 20.0, 1.4)
+        self.assertEqual(6, len(eggs))
+        for (row_count, aspect), values in zip(
+                [(r, c / 20.0) for r in [3, 5, 9] for c in [20, 30]], eggs):
+            expected = self._engine.EGG.rows((row_count, aspect, 1.4))
+            for value, count in zip(expected, values.tolist()):
+                self.assertAlmostEqual(value, count)
+
+    def test_cone_has_at_least_two_rows(self):
+        self.assertEqual([6.0, 60.0], self._engine.cone(1, 60)[0].tolist())
+        self.assertEqual([6.0, 6.0, 60.0],
+                         self._engine.cone(3, 60)[0].tolist())
+
+    def test_cone_is_exact(self):
+        """ Snapped cone rows match exact rational arithmetic
+        """
+        import random
+        from fractions import Fraction
+        rtn = self._util.round_to_nearest
+        rand = random.Random(16)
+        for __ in range(200):
+            rows, max_circ = rand.randint(3, 300), rand.randint(6, 600)
+            counts = self._engine.cone_rows(rows, max_circ)
+            batch = self._engine.cone(rows, max_circ)[0].tolist()
+            self.assertEqual(counts, batch)
+            for step, count in enumerate(counts[1:-1]):
+                exact = Fraction(step * (max_circ - 6), rows - 2) + 6
+                for margin in [1, 6]:
+                    self.assertEqual(
+                        max(6, int(exact / margin + Fraction(1, 2))
+                            * margin),
+                        rtn(count, margin, 6))
+        # Rows which are exactly half-way between multiples round up:
+        self.assertEqual([6, 6, 8, 9], [
+            rtn(count) for count in self._engine.cone_rows(4, 9)])
+        self.assertEqual([6.0, 6.0, 8.0, 9.0],
+                         self._engine.snap(self._engine.cone(4, 9)[0]
+                                           ).tolist())
+
+    def test_snap(self):
+        """ snap matches round_to_nearest for every value
+        """
+        values = [x / 4.0 for x in range(-40, 400)]
+        for margin, min_val in [(1, 0), (6, 6), (2, 4)]:
+            self.assertEqual(
+                [self._util.round_to_nearest(x, margin, min_val)
+                 for x in values],
+                self._engine.snap(values, margin, min_val).tolist())
+
+    def test_surface_batches_match_rows(self):
+        """ Every surface's batches match its rows, one at a time or all
+        """
+        engine = self._engine
+        for surface, params in [
+                (engine.TORUS_ARC, (18.0, 16, 90.0, 180.0)),
+                (engine.CYLINDER, (36.0, 5)),
+                (engine.HEMISPHERE, (10,)),
+                (engine.CAPSULE, (36.0, 8)),
+                (engine.ELLIPSOID, (16, 1.5)),
+                (engine.EGG, (16, 1.3, 1.4))]:
+            rows = surface.rows(params)
+            self.assertEqual(surface.row_count(params), len(rows))
+            self.assertEqual(rows, [surface.row(params, row)
+                                    for row in range(len(rows))])
+            batch = surface.batch(*[[value, value] for value in params])
+            for values in batch:
+                self.assertEqual(len(rows), len(values))
+                for expected, value in zip(rows, values.tolist()):
+                    self.assertAlmostEqual(expected, value)
+
+    def test_surfaces_match_simple_shapes(self):
+        """ Special cases of the new surfaces are the ball and donut
+        """
+        engine = self._engine
+        rtn = self._util.round_to_nearest
+        self.assertEqual(engine.ball_rows(19)[:10],
+                         engine.HEMISPHERE.rows((10,)))
+        self.assertEqual(engine.donut_rows(18, 12),
+                         engine.TORUS_ARC.rows((18.0, 12, 0.0, 360.0)))
+        self.assertEqual(
+            [rtn(count, 6, 6) for count in engine.ball_rows(30)],
+            [rtn(count, 6, 6)
+             for count in engine.ELLIPSOID.rows((30, 1.0))])
+
+    def test_degenerate_surfaces(self):
+        """ Surfaces with no size have no rows
+        """
+        engine = self._engine
+        self.assertEqual([], engine.CYLINDER.rows((0.0, 5)))
+        self.assertEqual([], engine.CAPSULE.rows((0.0, 5)))
+        self.assertEqual([], engine.ELLIPSOID.rows((0, 1.5)))
+        self.assertEqual([0, 0], list(engine.EGG.batch([0, 0], 1.3,
+                                                       1.4).lengths))
+
+
+class TestCache(unittest.TestCase, UtilTestCaseMixin):
+    @property
+    def _cache(self):
+        import crocad.cache
+        return crocad.cache
+
+    def test_lru_eviction(self):
+        """ LRUCache evicts the least-recently used item when full
+        """
+        cache = self._cache.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertFalse('b' in cache)
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual((2, 1, 1, 2, 2), tuple(cache.stats()))
+
+    def test_instruction_caches(self):
+        """ instruction is served from the pluggable caches
+        """
+        plan_cache = self._cache.LRUCache(8)
+        text_cache = self._cache.LRUCache(8)
+        previous = self._util.set_instruction_caches(plan_cache, text_cache)
+        try:
+            first = self._util.instruction(34, 38)
+            self.assertEqual(first, self._util.instruction(34, 38))
+            stats = self._util.instruction_cache_stats()
+            self.assertEqual((1, 1), stats['text'][:2])
+            self.assertEqual((0, 1), stats['plan'][:2])
+        finally:
+            self._util.set_instruction_caches(*previous)
+
+    def test_null_cache(self):
+        cache = self._cache.NullCache()
+        cache.put('a', 1)
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual(0, len(cache))
+
+
+class TestBatch(unittest.TestCase):
+    @property
+    def _batch(self):
+        import crocad.batch
+        return crocad.batch
+
+    def _run(self, *jobs):
+        import io
+        import json
+        import optparse
+        out = io.StringIO()
+        defaults = optparse.Values({'accurate': False, 'format': 'txt'})
+        self._batch.run_jobs(
+            [json.dumps(job) if isinstance(job, dict) else job
+             for job in jobs], defaults, out)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_jobs(self):
+        """ Each job produces one result line, in order
+        """
+        locale.setlocale(locale.LC_ALL, 'en_GB.utf-8')
+        results = self._run(
+            {'id': 'a', 'shape': 'cone', 'format': 'counts', 'accurate': True,
+             'options': {'row_count': 4, 'max_circumference': 20}},
+            {'id': 'b', 'shape': 'sphere', 'options': {'row_count': 5}})
+        self.assertEqual(['a', 'b'], [result['id'] for result in results])
+        self.assertEqual('6\n6\n13\n20', results[0]['output'])
+        self.assertTrue(results[1]['output'].startswith('Ball (5 rows)\n'))
+
+    def test_errors(self):
+        """ Invalid jobs produce an error result and don't stop the batch
+        """
+        results = self._run(
+            'not json',
+            {'id': 1, 'shape': 'notexist'},
+            {'id': 2, 'shape': 'ball', 'options': {'notexist': 1}},
+            {'id': 3, 'shape': 'ball', 'options': {'row_count': 'x'}},
+            {'id': 4, 'shape': 'ball', 'format': 'notexist'},
+            {'id': 5, 'shape': 'ball'})
+        self.assertEqual([None, 1, 2, 3, 4],
+                         [result['id'] for result in results
+                          if 'error' in result])
+        self.assertTrue('output' in results[-1])
+
+    def test_failing_job(self):
+        """ A job which fails unexpectedly produces an error result and
+        doesn't stop the batch
+        """
+        import crocad.ball
+
+        class Failing(object):
+            NAMES = ['failing']
+            option_parser = crocad.ball.option_parser
+
+            @staticmethod
+            def pattern(command_opts, global_options):
+                raise RuntimeError('broken')
+
+        self._batch.SHAPES['failing'] = Failing
+        self.addCleanup(self._batch.SHAPES.pop, 'failing')
+        results = self._run(
+            {'id': 1, 'shape': 'donut', 'options': {'inner_radius': 2}},
+            {'id': 2, 'shape': 'failing'},
+            {'id': 3, 'shape': 'ball'})
+        self.assertEqual([1, 2, 3], [result['id'] for result in results])
+        self.assertTrue('output' in results[0])
+        self.assertTrue('broken' in results[1]['error'])
+        self.assertTrue('output' in results[2])
+
+    def test_malformed_fields(self):
+        """ Fields of the wrong JSON type produce an error result
+        """
+        results = self._run(
+            {'id': 1, 'shape': 'ball', 'options': ['x']},
+            {'id': 2, 'shape': 'ball', 'locale': 5},
+            {'id': 3, 'shape': 'ball', 'format': ['x']},
+            {'id': 4, 'shape': 'ball', 'rounding': ['x']},
+            {'id': 5, 'shape': ['ball']},
+            {'id': 6, 'shape': 'ball'})
+        self.assertEqual([1, 2, 3, 4, 5],
+                         [result['id'] for result in results
+                          if 'error' in result])
+        self.assertTrue('output' in results[-1])
+
+    def test_row_selection(self):
+        """ A job can select part of a pattern
+        """
+        locale.setlocale(locale.LC_ALL, 'en_GB.utf-8')
+        results = self._run(
+            {'shape': 'cone', 'format': 'counts', 'first_row': 2,
+             'last_row': 3, 'options': {'row_count': 4}},
+            {'shape': 'ball', 'first_row': 0},
+            {'shape': 'ball', 'first_row': 1, 'rounding': 'optimal'},
+            {'shape': 'ball', 'first_row': 1,
+             'options': {'row_count': -4}},
+            {'shape': 'ball', 'last_row': 1,
+             'options': {'row_count': -4}},
+            {'shape': 'ball', 'first_row': 4, 'last_row': 3},
+            {'shape': 'ball', 'first_row': 17},
+            {'shape': 'ball', 'first_row': 16, 'last_row': 20})
+        self.assertEqual('6\n36', results[0]['output'])
+        self.assertTrue('error' in results[1])
+        self.assertTrue('error' in results[2])
+        # A selection past the end of the pattern, or which is inverted, is
+        # an error:
+        self.assertTrue('error' in results[3])
+        self.assertTrue('output' in results[4])
+        self.assertTrue('error' in results[5])
+        self.assertTrue('error' in results[6])
+        self.assertTrue(results[7]['output'].endswith(
+            '*, sc2tog, repeat from * 6 times (6)'))
+
+
+class TestCounts(unittest.TestCase):
+    @property
+    def _counts(self):
+        import crocad.counts
+        return crocad.counts
+
+    def test_read_counts(self):
+        """ Counts are read one per line, skipping blanks and comments
+        """
+        counts = self._counts.read_counts(
+            [b'6\n', b'\n', b'# A comment\n', b' 12 \n', b'17.6'])
+        self.assertEqual([6, 12, 18], list(counts))
+        import crocad
+        self.assertRaises(crocad.UserError, list,
+                          self._counts.read_counts([b'6', b'six']))
+        self.assertRaises(crocad.UserError, list,
+                          self._counts.read_counts([b'0']))
+
+    def test_render_file(self):
+        """ Counts read from a file render as the original pattern
+        """
+        import os
+        import shutil
+        import tempfile
+        import crocad.ball
+        import crocad.render
+        import crocad.util
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        stitches = list(crocad.util.round_to_nearest_iter(
+            crocad.ball.ball(40), 6, 6))
+        path = os.path.join(directory, 'counts.txt')
+        with open(path, 'w') as stream:
+            stream.write(''.join('%d\n' % count for count in stitches))
+        with self._counts.open_lines(path) as lines:
+            read = list(self._counts.read_counts(lines))
+        self.assertEqual(stitches, read)
+
+        path = os.path.join(directory, 'empty.txt')
+        open(path, 'w').close()
+        with self._counts.open_lines(path) as lines:
+            self.assertEqual([], list(lines))
+
+
+class TestSweep(unittest.TestCase):
+    @property
+    def _sweep(self):
+        import crocad.sweep
+        return crocad.sweep
+
+    def test_parse_range(self):
+        self.assertEqual([4, 5, 6], self._sweep.parse_range('4..6'))
+        self.assertEqual([30, 36, 42], self._sweep.parse_range('30..45:6'))
+        self.assertEqual([10, 20], self._sweep.parse_range('10,20'))
+        self.assertRaises(ValueError, self._sweep.parse_range, '4..x')
+        self.assertRaises(ValueError, self._sweep.parse_range, '4..6:0')
+
+    def test_sweep_jobs(self):
+        jobs = list(self._sweep.sweep_jobs('cone', [
+            ('row_count', [4, 5]), ('max_circumference', [30, 60])],
+            format='counts'))
+        self.assertEqual([0, 1, 2, 3], [job['id'] for job in jobs])
+        self.assertEqual({'row_count': 4, 'max_circumference': 60},
+                         jobs[1]['options'])
+        self.assertEqual('counts', jobs[3]['format'])
+
+    def test_results_are_ordered(self):
+        """ Results are in grid order, however many workers are used
+        """
+        import optparse
+        import crocad.batch
+        defaults = optparse.Values({'accurate': False, 'format': 'counts'})
+        jobs = list(self._sweep.sweep_jobs('ball',
+                                           [('row_count', range(4, 30))]))
+        expected = [dict(crocad.batch.run_job(job, defaults),
+                         options=job['options']) for job in jobs]
+        for workers in [1, 2]:
+            self.assertEqual(expected, list(self._sweep.run_sweep(
+                jobs, defaults, workers, chunk_size=3)))
+
+
+class TestSimilar(unittest.TestCase):
+    @property
+    def _similar(self):
+        import crocad.similar
+        return crocad.similar
+
+    def test_resample(self):
+        """ Profiles interpolate stitch-counts at evenly spaced points
+        """
+        self.assertEqual([6.0, 9.0, 12.0],
+                         list(self._similar.resample([6, 12], 3)))
+        self.assertEqual([6.0, 6.0], list(self._similar.resample([6], 2)))
+        self.assertRaises(ValueError, self._similar.resample, [])
+
+    def test_nearest(self):
+        """ Pruned queries find the same patterns as a full scan
+        """
+        import random
+        import crocad.cone
+        import crocad.util
+        similar = self._similar
+        index = similar.ProfileIndex().extend(similar.shape_profiles(
+            'cone', [('row_count', range(1, 60)),
+                     ('max_circumference', range(6, 100))]))
+        self.assertEqual(59 * 94, len(index))
+        stitches = crocad.util.round_to_nearest_iter(
+            crocad.cone.cone(30, 42), 6, 6)
+        distance, entry, rows = index.nearest(stitches, 1)[0]
+        self.assertEqual(0.0, distance)
+        self.assertEqual({'shape': 'cone', 'accurate': False, 'options': {
+            'row_count': 30, 'max_circumference': 42}}, entry)
+        self.assertEqual(30, rows)
+
+        generator = random.Random(22)
+        for __ in range(50):
+            query = [generator.randint(6, 120)
+                     for __ in range(generator.randint(1, 80))]
+            self.assertEqual(
+                [match[0] for match in index.nearest(query, 3)],
+                [match[0] for match in index.nearest(query, 3, False)])
+
+    def test_save(self):
+        """ An index can be saved and loaded
+        """
+        import os
+        import shutil
+        import tempfile
+        similar = self._similar
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'index.npz')
+        index = similar.ProfileIndex().extend(similar.shape_profiles(
+            'ball', [('row_count', range(0, 40))]))
+        self.assertEqual(39, len(index))
+        index.save(path)
+        loaded = similar.ProfileIndex.load(path)
+        self.assertEqual(index.nearest([6, 12, 12, 6], 3),
+                         loaded.nearest([6, 12, 12, 6], 3))
+
+
+class TestSolve(unittest.TestCase):
+    @property
+    def _solve(self):
+        import crocad.solve
+        return crocad.solve
+
+    @property
+    def _global_options(self):
+        import optparse
+        return optparse.Values({'accurate': False, 'format': 'txt'})
+
+    def test_solve(self):
+        """ Solving for a pattern's measurements finds its options
+        """
+        import crocad.cone
+        import crocad.util
+        solve = self._solve
+        targets = solve.measure(crocad.util.round_to_nearest_iter(
+            crocad.cone.cone(30, 42), 6, 6))
+        del targets['hole']
+        options, measurements, evaluations = solve.solve(
+            'cone', targets, self._global_options)
+        self.assertEqual(targets['rows'], measurements['rows'])
+        self.assertEqual(targets['circumference'],
+                         measurements['circumference'])
+        self.assertTrue(evaluations < 50)
+
+    def test_fixed(self):
+        """ Fixed options are kept, and the others solved for
+        """
+        solve = self._solve
+        options, measurements, __ = solve.solve(
+            'donut', {'circumference': 90}, self._global_options,
+            {'row_count': 20})
+        self.assertEqual(20, options['row_count'])
+        self.assertEqual(90, measurements['circumference'])
+        self.assertRaises(ValueError, solve.solve, 'ball', {'hole': 12},
+                          self._global_options)
+        self.assertRaises(ValueError, solve.solve, 'ball', {'rows': 12},
+                          self._global_options, {'nope': 1})
+
+    def test_parse_gauge(self):
+        """ Gauges give stitches and rows in 10cm
+        """
+        self.assertEqual((16.0, 18.0), self._solve.parse_gauge('16,18'))
+        self.assertEqual((16.0, 16.0), self._solve.parse_gauge('16'))
+        self.assertRaises(ValueError, self._solve.parse_gauge, '')
+        self.assertRaises(ValueError, self._solve.parse_gauge, '0,18')
+
+
+class TestAssembly(unittest.TestCase):
+    @property
+    def _assembly(self):
+        import crocad.assembly
+        return crocad.assembly
+
+    @property
+    def _segments(self):
+        return [{'shape': 'cone',
+                 'options': {'row_count': 8, 'max_circumference': 30}},
+                {'shape': 'ball', 'options': {'row_count': 20},
+                 'first_row': 9},
+                {'shape': 'cone', 'options': {'row_count': 4},
+                 'reverse': True}]
+
+    def test_transition(self):
+        """ Transition rows at most double or halve the stitch-count
+        """
+        transition = self._assembly.transition
+        self.assertEqual([12, 24, 48, 96], transition(6, 100))
+        self.assertEqual([50, 25, 13, 7], transition(100, 6))
+        self.assertEqual([], transition(10, 12))
+
+    def test_layout(self):
+        """ Segments are joined, with transitions between them
+        """
+        import crocad.ball
+        import crocad.cone
+        import crocad.util
+        import crocad.cache
+        assembly = self._assembly.Assembly(
+            self._segments, cache=crocad.cache.LRUCache(8))
+        stitches, rows = assembly.layout()
+        cone = list(crocad.util.round_to_nearest_iter(
+            crocad.cone.cone(8, 30), 6, 6))
+        ball = list(crocad.util.round_to_nearest_iter(
+            crocad.ball.ball(20), 6, 6))[8:]
+        end = list(crocad.util.round_to_nearest_iter(
+            crocad.cone.cone(4, 60), 6, 6))[::-1]
+        self.assertEqual(cone + ball + [12, 24, 48] + end, stitches)
+        self.assertEqual([(1, 8), (9, 20), (24, 27)], rows)
+        self.assertEqual('Cone (8 rows, 30 max-circumference) + Ball (20 rows)'
+                         ' + Cone (4 rows, 60 max-circumference)',
+                         assembly.pattern_title())
+
+    def test_incremental(self):
+        """ Changing a segment only generates that segment again
+        """
+        import crocad.cache
+        assembly = self._assembly.Assembly(
+            self._segments, cache=crocad.cache.LRUCache(8))
+        assembly.stitches()
+        self.assertEqual(3, assembly.generated)
+        assembly[1] = {'shape': 'ball', 'options': {'row_count': 24}}
+        stitches = assembly.stitches()
+        self.assertEqual(4, assembly.generated)
+        self.assertEqual(stitches, self._assembly.Assembly(
+            self._segments[:1] + [assembly[1]] + self._segments[2:]
+        ).stitches())
+
+    def test_invalid(self):
+        """ Invalid segments raise ValueError
+        """
+        Assembly = self._assembly.Assembly
+        self.assertRaises(ValueError, Assembly, [{'shape': 'donut'}])
+        self.assertRaises(ValueError, Assembly,
+                          [{'shape': 'ball', 'options': {'nope': 1}}])
+        self.assertRaises(ValueError, Assembly([
+            {'shape': 'ball', 'first_row': 99}]).stitches)
+
+
+class TestStore(unittest.TestCase):
+    @property
+    def _store(self):
+        import crocad.store
+        return crocad.store
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.now = 1000.0
+        self.store = self._store.PatternStore(self.path, max_size=100,
+                                              clock=lambda: self.now)
+        self.addCleanup(self.store.close)
+
+    def test_content_addressed(self):
+        """ Patterns with identical output share a file
+        """
+        self.assertEqual(None, self.store.get('a'))
+        self.store.put('a', u'Ympyrä\n')
+        self.store.put('b', u'Ympyrä\n')
+        self.assertEqual(u'Ympyrä\n', self.store.get('b'))
+        self.assertEqual(2, len(self.store))
+        self.assertEqual(len(u'Ympyrä\n'.encode('utf-8')), self.store.size())
+        self.assertFalse(self.store.put('c', 'x' * 101))
+
+    def test_eviction(self):
+        """ The least recently used patterns are evicted when full
+        """
+        for key in 'abc':
+            self.now += 1
+            self.store.put(key, key * 40)
+        self.assertEqual(None, self.store.get('a'))
+        self.now += 1
+        self.store.get('b')
+        self.now += 1
+        self.store.put('d', 'd' * 40)
+        self.assertEqual('b' * 40, self.store.get('b'))
+        self.assertEqual(None, self.store.get('c'))
+        self.assertEqual(80, self.store.size())
+
+    def test_shared(self):
+        """ Stores opened on the same directory share their patterns
+        """
+        import os
+        other = self._store.PatternStore(self.path)
+        self.addCleanup(other.close)
+        self.store.put('a', 'a')
+        self.assertEqual('a', other.get('a'))
+        # Files removed by another process are treated as missing:
+        objects = os.path.join(self.path, 'objects')
+        for directory in os.listdir(objects):
+            for name in os.listdir(os.path.join(objects, directory)):
+                os.unlink(os.path.join(objects, directory, name))
+        self.assertEqual(None, other.get('a'))
+        self.assertEqual(0, self.store.size())
+
+    def test_print_stored(self):
+        """ Stored patterns are printed without being generated again
+        """
+        import io
+        import optparse
+        import crocad.ball
+        import crocad.output
+        command_opts, __ = crocad.ball.option_parser().parse_args([])
+        global_options = optparse.Values({
+            'accurate': False, 'format': 'txt', 'store': self.path})
+        calls = []
+
+        def pattern(command_opts, global_options):
+            calls.append(command_opts)
+            return crocad.ball.pattern(command_opts, global_options)
+
+        outputs = []
+        for __ in range(2):
+            stream = io.StringIO()
+            self._store.print_stored('ball', pattern, command_opts,
+                                     global_options,
+                                     crocad.output.writer(stream))
+            outputs.append(stream.getvalue())
+        self.assertEqual(1, len(calls))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertTrue(outputs[0].startswith('Ball (16 rows)\n'))
+
+        global_options.format = 'counts'
+        self.assertNotEqual(
+            self._store.pattern_key('ball', command_opts, global_options),
+            self._store.pattern_key('ball', command_opts,
+                                    optparse.Values({'accurate': False})))
+
+    def test_unusable_store(self):
+        """ Patterns are printed without a store which can't be opened
+        """
+        import io
+        import optparse
+        import os.path
+        import crocad.ball
+        import crocad.output
+        blocked = os.path.join(self.path, 'file')
+        with open(blocked, 'w') as stream:
+            stream.write('not a directory')
+        corrupt = os.path.join(self.path, 'corrupt')
+        os.makedirs(corrupt)
+        with open(os.path.join(corrupt, 'index.sqlite'), 'wb') as stream:
+            stream.write(b'not a database' * 100)
+        command_opts, __ = crocad.ball.option_parser().parse_args([])
+        for path in [os.path.join(blocked, 'store'), corrupt]:
+            self.assertEqual(None, self._store.open_store(path))
+            stream = io.StringIO()
+            self._store.print_stored(
+                'ball', crocad.ball.pattern, command_opts,
+                optparse.Values({'accurate': False, 'format': 'txt',
+                                 'store': path}),
+                crocad.output.writer(stream))
+            self.assertTrue(stream.getvalue().startswith('Ball (16 rows)\n'))
+
+
+class TestWorkQueue(unittest.TestCase):
+    @property
+    def _workqueue(self):
+        import crocad.workqueue
+        return crocad.workqueue
+
+    def setUp(self):
+        import optparse
+        import os.path
+        import shutil
+        import tempfile
+        import crocad.sweep
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'journal.db')
+        self.now = 1000.0
+        self.queue = self._workqueue.WorkQueue(self.path,
+                                               clock=lambda: self.now)
+        self.addCleanup(self.queue.close)
+        self.jobs = list(crocad.sweep.sweep_jobs(
+            'ball', [('row_count', range(4, 14))], format='counts'))
+        self.defaults = optparse.Values({'accurate': False,
+                                         'format': 'counts'})
+        self.assertEqual(4, self.queue.add(self.jobs, unit_size=3))
+
+    def _expected(self):
+        import crocad.sweep
+        return crocad.sweep.run_chunk(self.jobs, self.defaults)
+
+    def test_resume_after_crash(self):
+        """ Units claimed by a worker which dies are claimed again once
+        their lease expires
+        """
+        import crocad.sweep
+        unit_id, jobs = self.queue.claim('first', lease=60)
+        self.assertEqual(self.jobs[:3], jobs)
+        self.queue.complete(unit_id, ['done'])
+        self.queue.claim('first', lease=60)     # 'first' crashes.
+        self.now += 30
+        for __ in range(2):
+            unit_id, jobs = self.queue.claim('second', lease=60)
+            self.queue.complete(unit_id, crocad.sweep.run_chunk(
+                jobs, self.defaults))
+        self.assertEqual(None, self.queue.claim('second', lease=60))
+        self.assertEqual({'pending': 0, 'claimed': 1, 'done': 3},
+                         self.queue.progress())
+        self.now += 31
+        self.assertEqual(1, self._workqueue.work(self.queue, self.defaults,
+                                                 'second', lease=60))
+        self.assertEqual(['done'] + self._expected()[3:],
+                         list(self.queue.results()))
+
+    def test_remote_workers(self):
+        """ Workers on other hosts claim units over TCP
+        """
+        import threading
+        server = self._workqueue.QueueServer(self.queue, ('127.0.0.1', 0))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        remotes = [self._workqueue.RemoteQueue(server.server_address)
+                   for __ in range(2)]
+        completed = [self._workqueue.work(remote, self.defaults, 'remote',
+                                          poll=0) for remote in remotes]
+        for remote in remotes:
+            remote.close()
+        self.assertEqual([4, 0], completed)
+        self.assertEqual(self._expected(), list(self.queue.results()))
+
+    def test_output_option(self):
+        """ status and results are written to the --output file
+        """
+        import json
+        import optparse
+        import os.path
+        path = os.path.join(os.path.dirname(self.path), 'out.jsonl')
+        global_options = optparse.Values({'accurate': False,
+                                          'format': 'counts',
+                                          'output': path})
+        self._workqueue.work(self.queue, self.defaults, 'local', poll=0)
+        self._workqueue.main(['status', self.path], global_options)
+        with open(path) as stream:
+            self.assertEqual({'pending': 0, 'claimed': 0, 'done': 4},
+                             json.loads(stream.read()))
+        self._workqueue.main(['results', self.path], global_options)
+        with open(path) as stream:
+            self.assertEqual(self._expected(),
+                             [json.loads(line) for line in stream])
+
+    def test_journal_jobs(self):
+        """ Journals record every option affecting the output, and are only
+        served to other hosts if asked
+        """
+        import optparse
+        defaults = optparse.Values({'accurate': True, 'format': 'json',
+                                    'rounding': 'optimal', 'group_rows': True})
+        jobs = list(self._workqueue.journal_jobs(
+            'ball', [('row_count', [4, 5])], defaults))
+        self.assertEqual(2, len(jobs))
+        for job in jobs:
+            self.assertEqual((True, 'json', 'optimal', True),
+                             (job['accurate'], job['format'],
+                              job['rounding'], job['group_rows']))
+        self.assertEqual(('127.0.0.1', 8765),
+                         self._workqueue._address('8765'))
+        self.assertEqual(('0.0.0.0', 8765),
+                         self._workqueue._address('0.0.0.0:8765'))
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        import optparse
+        import threading
+        import crocad.server
+        defaults = optparse.Values({'accurate': False, 'format': 'counts'})
+        self.service = crocad.server.PatternService(defaults, workers=2)
+        self.server = crocad.server.make_server(self.service, port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+        self.thread.join()
+
+    def _connection(self):
+        import http.client
+        return http.client.HTTPConnection(*self.server.server_address[:2])
+
+    def _request(self, conn, method, path, body=None):
+        import json
+        conn.request(method, path, body=body)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+
+    def test_keep_alive(self):
+        """ Several requests can be made on one connection, and repeated
+        requests are served from the cache
+        """
+        conn = self._connection()
+        for __ in range(2):
+            status, result = self._request(conn, 'GET', '/ball?row_count=5')
+            self.assertEqual(200, status)
+            self.assertEqual('6\n12\n12\n12\n6', result['output'])
+        self.assertEqual(1, self.service.cache.stats().hits)
+        conn.close()
+
+    def test_post_and_errors(self):
+        import json
+        conn = self._connection()
+        status, result = self._request(conn, 'POST', '/pattern', json.dumps(
+            {'id': 3, 'shape': 'cone', 'options': {'row_count': 5,
+                                                   'max_circumference': 24}}))
+        self.assertEqual((200, 3), (status, result['id']))
+        self.assertEqual('6\n6\n12\n18\n24', result['output'])
+        status, result = self._request(conn, 'GET', '/cone?row_count=x')
+        self.assertEqual(400, status)
+        status, result = self._request(conn, 'GET', '/notexist')
+        self.assertEqual(404, status)
+        conn.close()
+
+    def test_failing_job(self):
+        """ A job which fails unexpectedly gets a 500 response, which isn't
+        cached
+        """
+        import json
+        import crocad.ball
+        import crocad.batch
+
+        class Failing(object):
+            NAMES = ['failing']
+            option_parser = crocad.ball.option_parser
+
+            @staticmethod
+            def pattern(command_opts, global_options):
+                raise RuntimeError('broken')
+
+        crocad.batch.SHAPES['failing'] = Failing
+        self.addCleanup(crocad.batch.SHAPES.pop, 'failing')
+        conn = self._connection()
+        for __ in range(2):
+            status, result = self._request(conn, 'POST', '/pattern',
+                                           json.dumps({'id': 7,
+                                                       'shape': 'failing'}))
+            self.assertEqual((500, 7, 'broken'),
+                             (status, result['id'], result['error']))
+        self.assertEqual(0, len(self.service.cache))
+        status, result = self._request(conn, 'GET', '/ball?row_count=5')
+        self.assertEqual(200, status)
+        conn.close()
+
+    def test_invalid_content_length(self):
+        import json
+        conn = self._connection()
+        conn.putrequest('POST', '/pattern')
+        conn.putheader('Content-Length', 'x')
+        conn.endheaders()
+        response = conn.getresponse()
+        self.assertEqual(400, response.status)
+        self.assertTrue('error' in json.loads(
+            response.read().decode('utf-8')))
+        conn.close()
+
+
+class TestLocalization(unittest.TestCase):
+    @property
+    def _localization(self):
+        import crocad.localization
+        return crocad.localization
+
+    def test_translation_context(self):
+        """ A translation context overrides the process locale
+        """
+        locale.setlocale(locale.LC_ALL, 'en_GB.utf-8')
+        _ = self._localization.get_translation()
+        with self._localization.translation_context('fi_FI.UTF-8'):
+            self.assertEqual('fi_FI', _.language())
+            self.assertEqual('ks jokaiseen ks:aan', _('sc in each sc'))
+        self.assertEqual('sc in each sc', _('sc in each sc'))
+
+    def test_concurrent_locales(self):
+        """ Threads can render different locales at the same time
+        """
+        import threading
+        import crocad.util
+        results = {}
+
+        def render(name, locale_name):
+            with self._localization.translation_context(locale_name):
+                results[name] = [crocad.util.instruction_txt(2, 6, 6)
+                                 for __ in range(200)]
+
+        threads = [threading.Thread(target=render, args=args) for args in
+                   [('fi', 'fi_FI.UTF-8'), ('en', 'en_GB.UTF-8')]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(set(['2. krs: ks jokaiseen ks:aan(6)']),
+                         set(results['fi']))
+        self.assertEqual(set(['Row 2: sc in each sc (6)']),
+                         set(results['en']))
+
+    def test_catalogs_are_shared(self):
+        self.assertTrue(self._localization.catalog_for('fi_FI')
+                        is self._localization.catalog_for('fi_FI'))
+        self.assertTrue(self._localization.catalog_for('xx_XX')
+                        .is_passthrough())
+
+
+def _write_mo(path, messages, hash_size=0):
+    """ Write `messages` (a dict of bytes) to a .mo file at `path`, with a
+    hash table of `hash_size` entries.
+    """
+    import struct
+    from crocad.mocatalog import hashpjw
+    keys = sorted(messages)
+    strings_start = 28 + len(keys) * 16 + hash_size * 4
+    table = [0] * hash_size
+    originals, translations, strings = [], [], b''
+    for index, key in enumerate(keys):
+        if hash_size:
+            value = hashpjw(key)
+            slot, increment = value % hash_size, 1 + value % (hash_size - 2)
+            while table[slot]:
+                slot = (slot + increment) % hash_size
+            table[slot] = index + 1
+    for strings_list, values in [(originals, keys),
+                                 (translations, [messages[k] for k in keys])]:
+        for value in values:
+            strings_list.append((len(value), strings_start + len(strings)))
+            strings += value + b'\0'
+    data = struct.pack('<7I', 0x950412de, 0, len(keys), 28,
+                       28 + len(keys) * 8, hash_size, 28 + len(keys) * 16)
+    for length, offset in originals + translations:
+        data += struct.pack('<2I', length, offset)
+    data += struct.pack('<%dI' % hash_size, *table) + strings
+    with open(path, 'wb') as mo_file:
+        mo_file.write(data)
+
+
+class TestMappedCatalog(unittest.TestCase):
+    @property
+    def _MappedCatalog(self):
+        import crocad.mocatalog
+        return crocad.mocatalog.MappedCatalog
+
+    def test_matches_gettext(self):
+        """ Every message in the Finnish catalog matches GNUTranslations
+        """
+        import gettext
+        import os.path
+        import crocad
+        path = os.path.join(os.path.dirname(crocad.__file__), 'locale',
+                            'fi', 'LC_MESSAGES', 'crochet-cad.mo')
+        with open(path, 'rb') as mo_file:
+            expected = gettext.GNUTranslations(mo_file)
+        catalog = self._MappedCatalog(path)
+        for message in list(expected._catalog) + ['not translated']:
+            self.assertEqual(expected.gettext(message),
+                             catalog.gettext(message))
+        catalog.close()
+
+    def test_hash_table(self):
+        """ Catalogs with a hash table are searched using it
+        """
+        import os.path
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        messages = dict((('msg %d' % i).encode(), ('käännös %d' % i)
+                         .encode('utf-8')) for i in range(50))
+        messages[b''] = b'Content-Type: text/plain; charset=UTF-8\n'
+        for hash_size in [0, 101]:
+            path = os.path.join(directory, '%d.mo' % hash_size)
+            _write_mo(path, messages, hash_size)
+            catalog = self._MappedCatalog(path)
+            self.assertEqual(51, len(catalog))
+            for i in range(50):
+                self.assertEqual('käännös %d' % i,
+                                 catalog.gettext('msg %d' % i))
+            self.assertEqual('msg 50', catalog.gettext('msg 50'))
+            catalog.close()
+
+    def test_invalid_files(self):
+        import os.path
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name, data in [('empty.mo', b''), ('bad.mo', b'x' * 64)]:
+            path = os.path.join(directory, name)
+            with open(path, 'wb') as mo_file:
+                mo_file.write(data)
+            self.assertRaises(IOError, self._MappedCatalog, path)
+
+
+class TestProfiling(unittest.TestCase):
+    @property
+    def _profiling(self):
+        import crocad.profiling
+        return crocad.profiling
+
+    def tearDown(self):
+        self._profiling.disable()
+
+    def test_disabled(self):
+        """ The hooks do nothing while profiling is disabled
+        """
+        stitches = iter([6, 12])
+        self.assertTrue(self._profiling.stage_iter('generate', stitches)
+                        is stitches)
+        self.assertTrue(self._profiling.stage('a') is
+                        self._profiling.stage('b'))
+        self._profiling.count('rows')
+        self.assertEqual(None, self._profiling.active())
+
+    def test_nested_stages(self):
+        """ Each stage is charged only for its exclusive time
+        """
+        ticks = iter(range(100))
+        exported = []
+        profiler = self._profiling.enable(self._profiling.Profiler(
+            [exported.append], clock=lambda: next(ticks)))
+        with self._profiling.stage('print'):
+            for __ in self._profiling.stage_iter('generate', [1, 2]):
+                self._profiling.count('rows')
+        self.assertTrue(self._profiling.disable() is profiler)
+        self.assertEqual([profiler], exported)
+        self.assertEqual({'print': 4.0, 'generate': 3.0}, profiler.seconds)
+        self.assertEqual({'print': 1, 'generate': 3}, profiler.calls)
+        self.assertEqual({'rows': 2}, profiler.counters)
+
+    def test_profile_option(self):
+        import subprocess
+        import sys
+        process = subprocess.Popen([sys.executable, 'crochet-cad',
+            '--profile', 'cone', '-r', '5'], stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        stdout, stderr = process.communicate()
+        self.assertTrue(stdout.startswith('Cone'))
+        for stage in ['options', 'generate', 'snap', 'instructions', 'print',
+                      'Total']:
+            self.assertTrue(stage in stderr)
+
+
 class TestInit(unittest.TestCase):
     @property
     def _crocad(self):
@@ -356,6 +1827,25 @@ class TestInit(unittest.TestCase):
         self.assertEqual(self._crocad.find_command('cone'), crocad.cone.main)
         self.assertRaises(self._crocad.UserError, lambda: self._crocad.find_command('notexist'))
 
+    def test_command_names(self):
+        """ The lazy command table matches each command module's NAMES
+        """
+        import importlib
+        for module_name, names in self._crocad.COMMAND_MODULES:
+            self.assertEqual(names,
+                             importlib.import_module(module_name).NAMES)
+
+    def test_lazy_imports(self):
+        """ Importing crocad doesn't import command modules or NumPy
+        """
+        import subprocess
+        import sys
+        loaded = subprocess.check_output([sys.executable, '-c',
+            'import sys, crocad; print(" ".join(sorted(sys.modules)))'],
+            universal_newlines=True).split()
+        for module_name in ['crocad.ball', 'crocad.server', 'numpy']:
+            self.assertFalse(module_name in loaded)
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark the crochet-cad generators, snapping, instructions and rendering.
+
+Usage: benchmark.py run [-o FILE] [-q] [-k MATCH]
+       benchmark.py compare BASELINE [RESULTS] [-t THRESHOLD]
+
+`run` times each benchmark and writes the results as JSON. `compare` compares
+RESULTS (or a fresh run, if omitted) against a BASELINE written by `run`, and
+exits with status 1 if any benchmark is slower by more than THRESHOLD.
+"""
+
+import collections
+import contextlib
+import json
+import optparse
+import os.path
+import platform
+import sys
+import time
+import timeit
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from crocad import ball, cone, donut, engine, localization, util    # NOQA
+from crocad import similar                                          # NOQA
+from crocad.cache import NullCache                                 # NOQA
+
+# The largest row-count is 10 ** MAX_EXPONENT, or 10 ** QUICK_EXPONENT with
+# --quick:
+MAX_EXPONENT = 6
+QUICK_EXPONENT = 4
+
+# Rows in the patterns used for the instruction and rendering benchmarks:
+PATTERN_ROWS = 1000
+
+
+def consume(iterable):
+    """ Exhaust `iterable`, discarding its values. """
+    collections.deque(iterable, maxlen=0)
+
+
+@contextlib.contextmanager
+def uncached():
+    """ Disable the instruction caches for the duration of the block. """
+    previous = util.set_instruction_caches(NullCache(), NullCache())
+    try:
+        yield
+    finally:
+        util.set_instruction_caches(*previous)
+
+
+def print_pattern_to_null(stitches, locale_name=None):
+    """ Print the text instructions for `stitches` to os.devnull, without
+    caching, using the catalog for `locale_name`.
+    """
+    with open(os.devnull, 'w') as null:
+        with contextlib.redirect_stdout(null), uncached(), \
+                localization.translation_context(locale_name):
+            util.print_instructions_txt('Benchmark', stitches)
+
+
+def benchmarks(exponent):
+    """ Generate (name, function) pairs for each benchmark. """
+    for rows in [10 ** n for n in range(1, exponent + 1)]:
+        yield 'ball/%d' % rows, lambda rows=rows: consume(ball.ball(rows))
+        yield 'cone/%d' % rows, lambda rows=rows: consume(cone.cone(rows, 60))
+        yield 'donut/%d' % rows, \
+            lambda rows=rows: consume(donut.donut(18, rows))
+        yield 'engine.ball/%d' % rows, lambda rows=rows: engine.ball(rows)
+        yield 'engine.cone/%d' % rows, lambda rows=rows: engine.cone(rows, 60)
+        yield 'engine.donut/%d' % rows, \
+            lambda rows=rows: engine.donut(18, rows)
+        yield 'engine.ellipsoid/%d' % rows, \
+            lambda rows=rows: engine.ELLIPSOID.batch(rows, 1.5)
+
+    counts = list(ball.ball(10 ** exponent))
+    yield 'round_to_nearest_iter/%d' % len(counts), \
+        lambda: consume(util.round_to_nearest_iter(counts, 6, 6))
+
+    stitches = list(util.round_to_nearest_iter(ball.ball(PATTERN_ROWS), 1, 6))
+    rows = list(util.pattern_rows(stitches))
+
+    def instructions():
+        for row in rows:
+            util.instruction(row.prev, row.count)
+
+    def instructions_txt():
+        for row in rows:
+            util.instruction_txt(row.number, row.prev, row.count)
+
+    def uncached_instructions():
+        with uncached():
+            instructions()
+
+    yield 'instruction/%d' % PATTERN_ROWS, instructions
+    yield 'instruction.uncached/%d' % PATTERN_ROWS, uncached_instructions
+    yield 'instruction_txt/%d' % PATTERN_ROWS, instructions_txt
+    yield 'group_rows/%d' % PATTERN_ROWS, \
+        lambda: consume(util.group_rows(rows))
+    # An index of cones with 100 row-counts and 10 ** exponent / 100
+    # circumferences, up to 100,000 patterns:
+    circumferences = 10 ** min(exponent, 5) // 100
+    index = similar.ProfileIndex().extend(similar.shape_profiles(
+        'cone', [('row_count', range(2, 102)),
+                 ('max_circumference', range(6, 6 + circumferences))]))
+    query = list(util.round_to_nearest_iter(cone.cone(30, 42), 6, 6))
+    yield 'similar.nearest/%d' % len(index), \
+        lambda: index.nearest(query, 5)
+    yield 'similar.nearest.unpruned/%d' % len(index), \
+        lambda: index.nearest(query, 5, prune=False)
+    yield 'print_instructions_txt.passthrough/%d' % PATTERN_ROWS, \
+        lambda: print_pattern_to_null(stitches, 'C')
+    yield 'print_instructions_txt.translated/%d' % PATTERN_ROWS, \
+        lambda: print_pattern_to_null(stitches, 'fi_FI.UTF-8')
+
+
+def measure(function, repeat):
+    """
+    Return the best time, in seconds, for a single call of `function`, and
+    the number of calls timed in each of `repeat` runs.
+    """
+    timer = timeit.Timer(function)
+    loops, elapsed = timer.autorange()
+    best = elapsed / loops
+    for __ in range(repeat - 1):
+        best = min(best, timer.timeit(loops) / loops)
+    return best, loops
+
+
+def run(exponent, repeat, match=None, names=None, verbose=True):
+    """ Run the benchmarks, and return the results dict. """
+    results = collections.OrderedDict()
+    for name, function in benchmarks(exponent):
+        if match and match not in name or names and name not in names:
+            continue
+        seconds, loops = measure(function, repeat)
+        results[name] = {'seconds': seconds, 'loops': loops}
+        if verbose:
+            print('%-45s %12.6f s' % (name, seconds), file=sys.stderr)
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'benchmarks': results,
+    }
+
+
+def compare(baseline, results, threshold):
+    """
+    Print a comparison of `results` against `baseline`, and return the
+    names of the benchmarks which have regressed by more than `threshold`
+    (a fraction).
+    """
+    regressions = []
+    old, new = baseline['benchmarks'], results['benchmarks']
+    for name in old:
+        if name not in new:
+            print('%-45s %s' % (name, 'missing'))
+            continue
+        ratio = new[name]['seconds'] / old[name]['seconds']
+        if ratio > 1 + threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            status = 'faster'
+        else:
+            status = ''
+        print('%-45s %12.6f %12.6f %6.2fx %s' % (
+            name, old[name]['seconds'], new[name]['seconds'], ratio, status))
+    for name in new:
+        if name not in old:
+            print('%-45s %s' % (name, 'new'))
+    return regressions
+
+
+def main(argv=sys.argv[1:]):
+    """ Run or compare benchmarks. """
+    opt_parser = optparse.OptionParser(
+        '%prog run [-o FILE] [-q] [-k MATCH]\n'
+        '       %prog compare BASELINE [RESULTS] [-t THRESHOLD]',
+        description='Benchmark crochet-cad, or compare benchmark results.')
+    opt_parser.add_option('-o', '--output', metavar='FILE',
+        help='write results to FILE instead of stdout')
+    opt_parser.add_option('-q', '--quick', action='store_true', default=False,
+        help='only benchmark up to 10^%d rows' % QUICK_EXPONENT)
+    opt_parser.add_option('-k', '--match', metavar='MATCH',
+        help='only run benchmarks whose names contain MATCH')
+    opt_parser.add_option('-r', '--repeat', type='int', default=5,
+        help='the number of times to time each benchmark [%default]')
+    opt_parser.add_option('-t', '--threshold', type='float', default=0.2,
+        help='the slow-down, as a fraction, counted as a regression'
+        ' [%default]')
+    options, args = opt_parser.parse_args(argv)
+    exponent = QUICK_EXPONENT if options.quick else MAX_EXPONENT
+
+    if args[:1] == ['run'] and len(args) == 1:
+        results = run(exponent, options.repeat, options.match)
+        output = json.dumps(results, indent=2)
+        if options.output:
+            with open(options.output, 'w') as output_file:
+                output_file.write(output + '\n')
+        else:
+            print(output)
+        return 0
+    elif args[:1] == ['compare'] and len(args) in (2, 3):
+        with open(args[1]) as baseline_file:
+            baseline = json.load(baseline_file)
+        if options.match:
+            baseline['benchmarks'] = dict(
+                (name, result) for name, result
+                in baseline['benchmarks'].items() if options.match in name)
+        if len(args) == 3:
+            with open(args[2]) as results_file:
+                results = json.load(results_file)
+        else:
+            # Only re-run the benchmarks in the baseline:
+            exponent = max([1] + [
+                len(name.rpartition('/')[2]) - 1
+                for name in baseline['benchmarks']
+                if name.startswith('ball/')])
+            results = run(exponent, options.repeat, options.match,
+                          names=baseline['benchmarks'])
+        regressions = compare(baseline, results, options.threshold)
+        if regressions:
+            print('%d benchmark(s) regressed by more than %d%%' % (
+                len(regressions), options.threshold * 100))
+            return 1
+        return 0
+    opt_parser.error('expected "run" or "compare BASELINE [RESULTS]"')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
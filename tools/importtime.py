@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of Crochet CAD, a library and script for generating
+# crochet patterns for simple 3D shapes.
+#
+# Copyright (C) 2010, 2011 Mark Smith <mark.smith@practicalpoetry.co.uk>
+#
+# Crochet CAD is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the import-time of common crochet-cad invocations.
+
+Each invocation is run several times under `python -X importtime`, and the
+median time spent importing modules (beyond those imported by the
+interpreter itself) is compared to its budget. Invocations must also avoid
+importing modules which are only needed by other commands.
+
+Usage: importtime.py [-n RUNS] [-v]
+
+Exits with status 1 if any invocation exceeds its budget.
+"""
+
+import optparse
+import os.path
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'crochet-cad')
+
+# Modules which are slow to import, and only needed by a few commands:
+HEAVY_MODULES = ['numpy', 'http.server', 'concurrent.futures', 'sqlite3']
+
+# (name, crochet-cad arguments, budget in milliseconds)
+INVOCATIONS = [
+    ('help', ['--help'], 60),
+    ('ball', ['ball'], 60),
+    ('cone', ['cone'], 60),
+    ('donut', ['donut'], 60),
+    ('inhuman', ['--inhuman', 'ball'], 60),
+]
+
+
+def import_times(args):
+    """
+    Run python with `args` under -X importtime and return a dict mapping
+    each top-level import to its cumulative import time in microseconds,
+    plus the set of all imported modules.
+    """
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime'] + args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, cwd=ROOT,
+        universal_newlines=True)
+    __, stderr = process.communicate()
+    top_level = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            continue    # The header line.
+        name = fields[2].rstrip()
+        modules.add(name.strip())
+        if not name.startswith(' ' * 3):
+            top_level[name.strip()] = cumulative
+    return top_level, modules
+
+
+def measure(args, runs):
+    """
+    Return the median import time, in milliseconds, of running crochet-cad
+    with `args`, and the set of modules it imported.
+    """
+    startup, __ = import_times(['-c', 'pass'])
+    totals = []
+    for __ in range(runs):
+        top_level, modules = import_times([SCRIPT] + args)
+        totals.append(sum(cumulative for name, cumulative
+                          in top_level.items() if name not in startup))
+    totals.sort()
+    return totals[len(totals) // 2] / 1000.0, modules
+
+
+def main(argv=sys.argv[1:]):
+    """ Measure each invocation, and report any that are over budget. """
+    opt_parser = optparse.OptionParser('%prog [-n RUNS] [-v]',
+        description='Measure the import-time of crochet-cad invocations.')
+    opt_parser.add_option('-n', '--runs', type='int', default=7,
+        help='the number of times to run each invocation [%default]')
+    opt_parser.add_option('-v', '--verbose', action='store_true',
+        default=False, help='list the modules imported by each invocation')
+    options, __ = opt_parser.parse_args(argv)
+
+    failed = False
+    for name, args, budget in INVOCATIONS:
+        elapsed, modules = measure(args, options.runs)
+        heavy = sorted(module for module in HEAVY_MODULES
+                       if module in modules)
+        ok = elapsed <= budget and not heavy
+        failed = failed or not ok
+        print('%-8s %7.1f ms (budget %d ms) %s%s' % (
+            name, elapsed, budget, 'ok' if ok else 'FAILED',
+            ' - imports %s' % ', '.join(heavy) if heavy else ''))
+        if options.verbose:
+            print('    ' + ', '.join(sorted(modules)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())